@@ -0,0 +1,140 @@
+"""Load test the local HTTP API.
+
+Sends a mix of segmentation, strategy and glycogen requests with concurrent clients
+and reports throughput and latency percentiles per endpoint. A fraction of the
+requests use new parameters, the rest repeat earlier requests and are served from
+the result cache.
+
+Usage:
+    python -m benchmarks.api_load_test [--url http://127.0.0.1:8000] [--requests 500]
+        [--concurrency 16] [--unique 0.2] [--workers 4] [--executor process]
+
+Without --url a server is started in this process on a free port.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.api import create_server
+
+ENDPOINTS = ["segments", "strategy", "glycogen"]
+
+
+def post(url: str, body: dict) -> tuple:
+    """Post a JSON request and return the status and latency in seconds."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        status = error.code
+    return status, time.perf_counter() - start
+
+
+def create_requests(
+    route_ids: list, num_requests: int, unique: float, seed: int = 0
+) -> list:
+    """Create a random mix of requests, `unique` of them with new parameters."""
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(num_requests):
+        if requests and rng.random() >= unique:
+            requests.append(rng.choice(requests))
+            continue
+
+        endpoint = rng.choice(ENDPOINTS)
+        body = {"route_id": rng.choice(route_ids)}
+        if endpoint == "segments":
+            body["window_size_km"] = round(rng.uniform(1.0, 3.0), 1)
+        else:
+            body["relative_power_climb"] = round(rng.uniform(4.0, 7.0), 2)
+            body["semi_draft_point"] = rng.choice([0.5, 0.6, 0.7])
+        requests.append((endpoint, body))
+
+    return requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--stages", nargs="+", default=["stage-1", "stage-4"])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--unique", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = create_server(port=0, workers=args.workers, executor=args.executor)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+
+    # Process the routes, this is the slow step of a cold start
+    route_ids = []
+    for stage in args.stages:
+        start = time.perf_counter()
+        request = urllib.request.Request(
+            f"{url}/routes",
+            data=json.dumps({"stage": stage}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            route_ids.append(json.loads(response.read())["route_id"])
+        print(f"Processed {stage} in {time.perf_counter() - start:.2f} s")
+
+    requests = create_requests(route_ids, args.requests, unique=args.unique)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(
+            executor.map(
+                lambda request: post(f"{url}/{request[0]}", request[1]), requests
+            )
+        )
+    elapsed = time.perf_counter() - start
+
+    results_df = pd.DataFrame(
+        {
+            "endpoint": [endpoint for endpoint, _ in requests],
+            "status": [status for status, _ in results],
+            "latency (ms)": [latency * 1000 for _, latency in results],
+        }
+    )
+    summary_df = results_df.groupby("endpoint")["latency (ms)"].agg(
+        requests="count",
+        p50=lambda latency: np.percentile(latency, 50),
+        p99=lambda latency: np.percentile(latency, 99),
+        max="max",
+    )
+    print(summary_df.to_string(float_format="%.1f"))
+    print()
+    print(f"Requests: {len(results_df)} with {args.concurrency} clients")
+    print(f"Errors: {(results_df['status'] != 200).sum()}")
+    print(f"Throughput: {len(results_df) / elapsed:.0f} requests/s")
+    print(f"p50 latency: {np.percentile(results_df['latency (ms)'], 50):.1f} ms")
+    print(f"p99 latency: {np.percentile(results_df['latency (ms)'], 99):.1f} ms")
+
+    if server is not None:
+        server.shutdown()
+        server.RequestHandlerClass.service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Check that chunked processing gives the same route and segments as the whole file.
+
+Writes a small synthetic route as a gpx file: a random walk over several tracks with
+climbs of different lengths, gpx-like elevation resolution and flat stretches. The
+route is processed whole with `create_dataframe` and `generate_segments` and in
+chunks with `process_gpx_chunked` and `generate_segments_chunked`, for chunk sizes
+smaller than the route and a small initial halo, so chunk boundaries fall on climbs,
+flats and plateaus. Every column and every segment has to be exactly equal. Runs in
+a few seconds, see `chunked_processing_benchmark` for the time and memory on long
+routes.
+
+Usage:
+    python -m benchmarks.chunked_equivalence [--points 5000]
+        [--chunk-points 300 1000 2048] [--halo-points 16] [--seed 0]
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src.chunked_processing import generate_segments_chunked, process_gpx_chunked
+from src.generate_segments import generate_segments
+from src.process_data import create_dataframe, read_gpx_file
+
+WINDOW_SIZE_KM = 2.0
+MIN_SLOPE_DIFF = 1.5
+# Periods of the elevation waves in points, from long climbs to small bumps
+LONG_ROUTE_PERIODS = (40_000, 7_000, 900, 60)
+SHORT_ROUTE_PERIODS = (1_500, 600, 150, 40)
+
+
+def write_synthetic_route(
+    path: Path, num_points: int, seed: int = 0, periods: tuple = LONG_ROUTE_PERIODS
+) -> None:
+    """Write a synthetic route with climbs, flats and plateaus as gpx."""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, num_points))
+    step_deg = 1e-4  # About 10 m
+    latitude = 45 + np.cumsum(step_deg * np.cos(heading))
+    longitude = 6 + np.cumsum(step_deg * np.sin(heading))
+
+    position = np.arange(num_points)
+    elevation = 800 + sum(
+        amplitude * np.sin(2 * np.pi * position / period + phase)
+        for amplitude, period, phase in zip(
+            [600, 150, 40, 5], periods, rng.uniform(0, 2 * np.pi, 4)
+        )
+    )
+    elevation += np.cumsum(rng.normal(0, 0.05, num_points))
+    # Flat stretches, e.g. along a lake, of up to 5000 points
+    for start in rng.integers(0, num_points, max(num_points // 100_000, 1) * 3):
+        length = rng.integers(100, min(5000, num_points // 10))
+        elevation[start : start + length] = elevation[start]
+    # Elevation resolution of gpx devices, gives equal neighbours and plateaus
+    elevation = np.round(elevation * 5) / 5
+
+    # Several tracks and track segments, as in multi-day routes
+    breaks = set(np.linspace(0, num_points, 6, dtype=int)[1:-1])
+    with open(path, "w") as gpx_file:
+        gpx_file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="vlab" '
+            'xmlns="http://www.topografix.com/GPX/1/1">\n<trk><trkseg>\n'
+        )
+        for i in range(num_points):
+            if i in breaks:
+                gpx_file.write("</trkseg></trk>\n<trk><trkseg>\n")
+            gpx_file.write(
+                f'<trkpt lat="{latitude[i]:.7f}" lon="{longitude[i]:.7f}">'
+                f"<ele>{elevation[i]:.1f}</ele></trkpt>\n"
+            )
+        gpx_file.write("</trkseg></trk>\n</gpx>\n")
+
+
+def process_whole(path: Path) -> tuple:
+    df = create_dataframe(read_gpx_file(path))
+    segments = generate_segments(
+        df, window_size_km=WINDOW_SIZE_KM, min_slope_diff=MIN_SLOPE_DIFF
+    )
+    return df, segments
+
+
+def process_chunked(
+    path: Path, directory: Path, chunk_points: int, halo_points: int
+) -> tuple:
+    df = process_gpx_chunked(path, directory=directory, chunk_points=chunk_points)
+    segments = generate_segments_chunked(
+        df,
+        window_size_km=WINDOW_SIZE_KM,
+        min_slope_diff=MIN_SLOPE_DIFF,
+        chunk_points=chunk_points,
+        halo_points=halo_points,
+    )
+    return df, segments
+
+
+def compare(whole: tuple, chunked: tuple) -> list:
+    """List the differences between the whole and the chunked results."""
+    whole_df, whole_segments = whole
+    chunked_df, chunked_segments = chunked
+    differences = []
+    if list(whole_df.columns) != list(chunked_df.columns):
+        differences.append(f"columns {list(chunked_df.columns)}")
+    for column in whole_df.columns:
+        if not np.array_equal(
+            whole_df[column].to_numpy(), chunked_df[column].to_numpy(), equal_nan=True
+        ):
+            num_different = np.sum(
+                whole_df[column].to_numpy() != chunked_df[column].to_numpy()
+            )
+            differences.append(f"{column}: {num_different} different values")
+    if len(whole_segments) != len(chunked_segments):
+        differences.append(
+            f"{len(chunked_segments)} segments instead of {len(whole_segments)}"
+        )
+    elif whole_segments != chunked_segments:
+        differences.append("different segments")
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument(
+        "--chunk-points", type=int, nargs="+", default=[300, 1000, 2048]
+    )
+    parser.add_argument("--halo-points", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        path = directory / "route.gpx"
+        write_synthetic_route(
+            path, args.points, seed=args.seed, periods=SHORT_ROUTE_PERIODS
+        )
+        whole = process_whole(path)
+        print(f"Synthetic route: {args.points} points, {len(whole[1])} segments")
+
+        failures = 0
+        for chunk_points in args.chunk_points:
+            differences = compare(
+                whole,
+                process_chunked(
+                    path,
+                    directory / f"chunks-{chunk_points}",
+                    chunk_points=chunk_points,
+                    halo_points=args.halo_points,
+                ),
+            )
+            failures += bool(differences)
+            print(
+                f"{f'{chunk_points} point chunks':>22}: "
+                f"{'equal' if not differences else '; '.join(differences)}"
+            )
+
+    if failures:
+        raise SystemExit(f"{failures} chunk sizes differ from the whole file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Report the time and peak memory of chunked processing on a long route.
+
+Writes a synthetic long route as a gpx file, see `chunked_equivalence`, and
+processes it whole with `create_dataframe` and `generate_segments` and in chunks
+with `process_gpx_chunked` and `generate_segments_chunked`, for several chunk sizes.
+Reports the time and the peak traced memory of both. Run `chunked_equivalence` to
+check that the results are equal.
+
+Usage:
+    python -m benchmarks.chunked_processing_benchmark [--points 500000]
+        [--chunk-points 1000 4096 65536] [--halo-points 64] [--seed 0]
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.chunked_equivalence import (
+    process_chunked,
+    process_whole,
+    write_synthetic_route,
+)
+
+
+def measure(function, *args, **kwargs) -> tuple:
+    """Run a function and return its result, time in s and peak traced memory in MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=500_000)
+    parser.add_argument(
+        "--chunk-points", type=int, nargs="+", default=[1000, 4096, 65536]
+    )
+    parser.add_argument("--halo-points", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        path = directory / "route.gpx"
+        write_synthetic_route(path, args.points, seed=args.seed)
+        print(
+            f"Synthetic route: {args.points} points, "
+            f"{path.stat().st_size / 2**20:.0f} MB gpx"
+        )
+
+        whole, duration, peak = measure(process_whole, path)
+        print(
+            f"{'whole file':>22}: {duration:6.1f} s, {peak:7.1f} MB peak, "
+            f"{len(whole[1])} segments"
+        )
+        del whole
+
+        for chunk_points in args.chunk_points:
+            chunked, duration, peak = measure(
+                process_chunked,
+                path,
+                directory / f"chunks-{chunk_points}",
+                chunk_points=chunk_points,
+                halo_points=args.halo_points,
+            )
+            print(
+                f"{f'{chunk_points} point chunks':>22}: {duration:6.1f} s, "
+                f"{peak:7.1f} MB peak, {len(chunked[1])} segments"
+            )
+            del chunked
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Benchmark the DEM elevation correction on all TDF stages.
+
+Writes synthetic DEM tiles over every tile the stages touch, from a smooth analytic
+terrain, so the exact elevation is known at every point. Every stage is corrected
+with a new `DemTiles` instance (cold: tiles are opened and their pages read) and
+again with the same instance (warm). Reports the sampling and correction times and
+the interpolation error against the analytic terrain, which has to stay within the
+grid resolution.
+
+Usage:
+    python -m benchmarks.dem_benchmark [--tile-size 1201] [--stages stage-1 stage-2]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.dem import DemTiles, correct_elevation, tile_name
+from src.process_data import STAGE_DIRECTORY, create_dataframe, read_gpx_file
+
+STAGES = [f"stage-{i}" for i in range(1, 22)]
+MAX_ERROR_M = 1.0
+
+
+def terrain(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """Smooth analytic terrain in m, with hills of a few km."""
+    return (
+        800
+        + 600 * np.sin(np.radians(latitude) * 150) * np.cos(np.radians(longitude) * 120)
+        + 80 * np.sin(latitude * 60) * np.sin(longitude * 45)
+    )
+
+
+def write_tiles(directory: Path, tiles: set, tile_size: int) -> None:
+    """Write the terrain as `.npy` tiles, with the north edge in the first row."""
+    steps = np.linspace(0, 1, tile_size)
+    for south, west in tiles:
+        latitude, longitude = np.meshgrid(
+            south + 1 - steps, west + steps, indexing="ij"
+        )
+        np.save(
+            directory / f"{tile_name(south, west)}.npy",
+            terrain(latitude, longitude).astype(np.float32),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=STAGES)
+    parser.add_argument("--tile-size", type=int, default=1201)
+    args = parser.parse_args()
+
+    routes = {
+        stage: create_dataframe(read_gpx_file(STAGE_DIRECTORY / f"{stage}-route.gpx"))
+        for stage in args.stages
+    }
+    tiles = {
+        (int(south), int(west))
+        for df in routes.values()
+        for south, west in zip(
+            np.floor(df["latitude"]).astype(int), np.floor(df["longitude"]).astype(int)
+        )
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_tiles(Path(directory), tiles, args.tile_size)
+        print(
+            f"{len(tiles)} tiles of {args.tile_size} x {args.tile_size} values, "
+            f"{len(routes)} stages"
+        )
+
+        results = []
+        for stage, df in routes.items():
+            dem = DemTiles(directory)
+            start = time.perf_counter()
+            elevation = dem.sample(df["latitude"], df["longitude"])
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            dem.sample(df["latitude"], df["longitude"])
+            warm = time.perf_counter() - start
+            start = time.perf_counter()
+            correct_elevation(df, dem)
+            correction = time.perf_counter() - start
+
+            error = np.abs(elevation - terrain(df["latitude"], df["longitude"]))
+            results.append(
+                {
+                    "stage": stage,
+                    "points": len(df),
+                    "tiles": len(dem),
+                    "cold sample (ms)": cold * 1000,
+                    "warm sample (ms)": warm * 1000,
+                    "warm correction (ms)": correction * 1000,
+                    "max error (m)": error.max(),
+                }
+            )
+
+    results_df = pd.DataFrame(results).set_index("stage")
+    with pd.option_context("display.width", 200, "display.max_columns", 10):
+        print(results_df.round(2))
+        print(
+            f"\nMedian warm correction: {results_df['warm correction (ms)'].median():.1f} ms"
+        )
+
+    if (results_df["max error (m)"] > MAX_ERROR_M).any():
+        raise SystemExit(f"Interpolation error above {MAX_ERROR_M} m")
+
+
+if __name__ == "__main__":
+    main()
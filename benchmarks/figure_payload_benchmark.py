@@ -0,0 +1,156 @@
+"""Report the plotly payload size and serialization time per figure and stage.
+
+Builds the route map, the elevation profile with segments and the glycogen plot of
+every stage, and serializes each figure as `st.plotly_chart` does: as plain JSON
+lists, and as typed arrays on the first rerun (cold) and on later reruns of the same
+cached figure (warm). Checks that the typed arrays decode to the plain values within
+float32 precision.
+
+Usage:
+    python -m benchmarks.figure_payload_benchmark [--stages stage-1 stage-2]
+        [--output payloads.csv]
+"""
+
+import argparse
+import base64
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+import plotly.io
+import plotly.tools
+
+from src.compute_segments_analytics import STRATEGY_PARAMETERS, evaluate_strategy
+from src.figure_payload import measure_payload
+from src.generate_segments import create_segments_dataframe, generate_segments
+from src.glycogen_model import compute_route_glycogen
+from src.plotting import combine_plots, plot_map, plot_segments
+from src.process_data import (
+    SEGMENTATION_PARAMETERS,
+    STAGE_DIRECTORY,
+    create_dataframe,
+    read_gpx_file,
+)
+from src.simulate_route import integrate_route
+
+STAGES = [f"stage-{i}" for i in range(1, 22)]
+RIDER_STATS = STRATEGY_PARAMETERS["rider_stats"]
+
+
+def decode_typed_arrays(obj):
+    """Decode the typed array specs in a figure dict to numpy arrays."""
+    if isinstance(obj, dict):
+        if "bdata" in obj and "dtype" in obj:
+            values = np.frombuffer(base64.b64decode(obj["bdata"]), dtype=obj["dtype"])
+            if "shape" in obj:
+                values = values.reshape([int(size) for size in obj["shape"].split(",")])
+            return values
+        return {key: decode_typed_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [decode_typed_arrays(value) for value in obj]
+    return obj
+
+
+def compare_payloads(plain, compact) -> bool:
+    """Compare a plain figure dict with a decoded compact one within float32."""
+    if isinstance(plain, dict):
+        return plain.keys() == compact.keys() and all(
+            compare_payloads(plain[key], compact[key]) for key in plain
+        )
+    if isinstance(compact, np.ndarray):
+        plain = np.array(plain, dtype=float)
+        return plain.shape == compact.shape and np.allclose(
+            compact, plain, rtol=1e-6, atol=0, equal_nan=True
+        )
+    if isinstance(plain, list) and isinstance(compact, list):
+        return len(plain) == len(compact) and all(
+            compare_payloads(a, b) for a, b in zip(plain, compact)
+        )
+    return plain == compact
+
+
+def build_figures(stage: str) -> dict:
+    """Build the route figures of a stage as pages 01, 02 and 04 do."""
+    df = create_dataframe(read_gpx_file(STAGE_DIRECTORY / f"{stage}-route.gpx"))
+    segments = generate_segments(
+        df,
+        window_size_km=SEGMENTATION_PARAMETERS["window_size_km"],
+        min_slope_diff=SEGMENTATION_PARAMETERS["min_slope_diff"],
+    )
+    segments_df = evaluate_strategy(
+        create_segments_dataframe(df=df, segments=segments),
+        rider_stats=RIDER_STATS,
+    )
+    glycogen_df = compute_route_glycogen(
+        integrate_route(df=df, segments_df=segments_df, rider_stats=RIDER_STATS),
+        rider_stats=RIDER_STATS,
+    )
+    return {
+        "map": plot_map(df=df, segments_df=segments_df, selected_stage=stage),
+        "segments": plot_segments(df=df, segments=segments),
+        "glycogen": combine_plots(
+            df=df, segments=segments, segments_df=segments_df, glycogen_df=glycogen_df
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=STAGES)
+    parser.add_argument("--output", type=Path, help="Write the report to a csv file")
+    args = parser.parse_args()
+
+    results = []
+    failures = 0
+    for stage in args.stages:
+        for name, fig in build_figures(stage).items():
+            start = time.perf_counter()
+            plain = plotly.io.to_json(go.Figure.to_dict(fig), validate=False)
+            plain_time = time.perf_counter() - start
+            cold = measure_payload(fig)
+            warm = measure_payload(fig)
+
+            compact = plotly.io.to_json(
+                plotly.tools.return_figure_from_figure_or_data(fig, True),
+                validate=False,
+            )
+            if not compare_payloads(
+                json.loads(plain), decode_typed_arrays(json.loads(compact))
+            ):
+                failures += 1
+                print(f"{stage} {name}: typed arrays differ from the plain figure")
+
+            results.append(
+                {
+                    "stage": stage,
+                    "figure": name,
+                    "plain (kB)": len(plain.encode("utf-8")) / 1000,
+                    "typed (kB)": cold["size (bytes)"] / 1000,
+                    "plain (ms)": plain_time * 1000,
+                    "typed cold (ms)": cold["time (s)"] * 1000,
+                    "typed warm (ms)": warm["time (s)"] * 1000,
+                }
+            )
+
+    results_df = pd.DataFrame(results).set_index(["stage", "figure"])
+    with pd.option_context(
+        "display.width", 200, "display.max_columns", 10, "display.max_rows", 100
+    ):
+        print(results_df.round(1))
+        totals = results_df.groupby("figure").median()
+        totals["size ratio"] = totals["typed (kB)"] / totals["plain (kB)"]
+        print("\nMedian per figure:")
+        print(totals.round(2))
+
+    if args.output:
+        results_df.to_csv(args.output)
+        print(f"Report written to {args.output}")
+    if failures:
+        raise SystemExit(f"{failures} figures differ from their plain payload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Check the block-wise linear recurrence of the glycogen model against a plain loop.
+
+Evaluates `_linear_recurrence` on batches that mix strongly and barely decaying
+series, where the blocks have to follow the strongest decay, and on every series
+alone, and compares both with a step-by-step loop.
+
+Usage:
+    python -m benchmarks.glycogen_recurrence_check [--steps 20000] [--seed 0]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.glycogen_model import _linear_recurrence
+
+
+def loop_recurrence(decay, increment, initial=0.0) -> np.ndarray:
+    """Evaluate x[t] = decay[t] * x[t-1] + increment[t] one step at a time."""
+    result = np.empty(np.broadcast_shapes(decay.shape, increment.shape))
+    state = np.broadcast_to(np.asarray(initial, dtype=float), result.shape[:-1])
+    for t in range(result.shape[-1]):
+        state = decay[..., t] * state + increment[..., t]
+        result[..., t] = state
+    return result
+
+
+def build_cases(num_steps: int, seed: int = 0) -> dict:
+    """Build batches of decay factors and increments per case name."""
+    rng = np.random.default_rng(seed)
+    increment = rng.exponential(1.0, (3, num_steps))
+    return {
+        "no decay and weak decay": (
+            np.stack([np.ones(num_steps), np.full(num_steps, np.exp(-1 / 316))]),
+            increment[:2],
+        ),
+        "no decay and strong decay": (
+            np.stack([np.ones(num_steps), np.full(num_steps, np.exp(-0.5))]),
+            increment[:2],
+        ),
+        "random mixed decay": (
+            np.exp(
+                -rng.uniform(0, 1, (3, num_steps)) * np.array([[0.0], [0.01], [0.5]])
+            ),
+            increment,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = 0
+    for name, (decay, increment) in build_cases(args.steps, seed=args.seed).items():
+        initial = np.linspace(0, 100, len(decay))
+        expected = loop_recurrence(decay, increment, initial)
+
+        start = time.perf_counter()
+        with np.errstate(all="raise"):
+            batched = _linear_recurrence(decay, increment, initial)
+        duration = time.perf_counter() - start
+        alone = np.stack(
+            [
+                _linear_recurrence(decay[i], increment[i], initial[i])
+                for i in range(len(decay))
+            ]
+        )
+
+        equal = all(
+            np.allclose(result, expected, rtol=1e-9, atol=1e-9)
+            for result in (batched, alone)
+        )
+        failures += not equal
+        print(
+            f"{name:>26}: {duration * 1000:6.1f} ms, "
+            f"{'equal' if equal else 'different'} to the loop"
+        )
+
+    if failures:
+        raise SystemExit(f"{failures} cases differ from the loop")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Benchmark the gpx export of all TDF stages for a team.
+
+Plans every stage for the default roster of the team roster page and writes one gpx
+file per stage and rider into a zip archive with `export_team_gpx`. Reports the
+export time and size, compares the time of one stage with building and serializing
+the same gpx with gpxpy, and checks that the exported files parse back to the route
+points and one waypoint per segment.
+
+Usage:
+    python -m benchmarks.gpx_export_benchmark [--stages stage-1 stage-2]
+        [--output team.zip]
+"""
+
+import argparse
+import io
+import time
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import define_drafting_decisions
+from src.gpx_export import export_route_gpx, export_team_gpx
+from src.process_data import (
+    SEGMENTATION_PARAMETERS,
+    STAGE_DIRECTORY,
+    create_dataframe,
+    read_gpx_file,
+    segment_route,
+)
+from src.roster import create_roster, plan_roster_segments
+
+STAGES = [f"stage-{i}" for i in range(1, 22)]
+ROSTER = create_roster(
+    pd.DataFrame(
+        {
+            "name": [f"rider {i}" for i in range(1, 9)],
+            "weight_rider": [58.0, 62.0, 65.0, 68.0, 70.0, 72.0, 75.0, 80.0],
+            "cda_full": [0.25, 0.255, 0.2625, 0.27, 0.275, 0.28, 0.29, 0.3],
+            "cda_semi": [0.29, 0.295, 0.305, 0.31, 0.315, 0.32, 0.33, 0.345],
+            "cda_none": [0.33, 0.34, 0.35, 0.355, 0.36, 0.37, 0.38, 0.395],
+            "relative_power_climb": [6.0, 5.8, 5.5, 5.3, 5.2, 5.0, 4.8, 4.5],
+            "relative_power_flat": [3.0] * 8,
+            "relative_power_descend": [1.5] * 8,
+        }
+    )
+)
+
+
+def export_gpxpy(df: pd.DataFrame, segments_df: pd.DataFrame, name: str) -> bytes:
+    """Export the same route and waypoints by building a gpxpy object tree."""
+    import gpxpy.gpx
+
+    gpx = gpxpy.gpx.GPX()
+    distance = df["distance"].to_numpy()
+    for row in segments_df.to_dict("records"):
+        i = min(np.searchsorted(distance, row["start point (km)"]), len(df) - 1)
+        gpx.waypoints.append(
+            gpxpy.gpx.GPXWaypoint(
+                latitude=df["latitude"].iloc[i],
+                longitude=df["longitude"].iloc[i],
+                elevation=df["elevation"].iloc[i],
+                name=row["segment"],
+                comment=f"{row['relative power (w/kg)']:.1f} W/kg",
+            )
+        )
+    track = gpxpy.gpx.GPXTrack(name=name)
+    segment = gpxpy.gpx.GPXTrackSegment()
+    for latitude, longitude, elevation in zip(
+        df["latitude"], df["longitude"], df["elevation"]
+    ):
+        segment.points.append(
+            gpxpy.gpx.GPXTrackPoint(latitude, longitude, elevation=elevation)
+        )
+    track.segments.append(segment)
+    gpx.tracks.append(track)
+    return gpx.to_xml().encode("utf-8")
+
+
+def check_export(gpx_data: bytes, df: pd.DataFrame, segments_df: pd.DataFrame) -> list:
+    """List the differences between an exported gpx file and its route and plan."""
+    namespace = "{http://www.topografix.com/GPX/1/1}"
+    root = ElementTree.fromstring(gpx_data)
+    points = np.array(
+        [
+            (
+                float(point.get("lat")),
+                float(point.get("lon")),
+                float(point.findtext(f"{namespace}ele", "nan")),
+            )
+            for point in root.iter(f"{namespace}trkpt")
+        ]
+    )
+    waypoint_names = [
+        waypoint.findtext(f"{namespace}name")
+        for waypoint in root.iter(f"{namespace}wpt")
+    ]
+
+    differences = []
+    if len(points) != len(df):
+        differences.append(f"{len(points)} points instead of {len(df)}")
+    elif not np.allclose(
+        points[:, :2], df[["latitude", "longitude"]], atol=1e-7
+    ) or not np.allclose(points[:, 2], df["elevation"], atol=0.05, equal_nan=True):
+        differences.append("different points")
+    if waypoint_names != list(segments_df["segment"]):
+        differences.append(
+            f"{len(waypoint_names)} waypoints instead of {len(segments_df)} segments"
+        )
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=STAGES)
+    parser.add_argument("--output", type=Path, help="Write the zip archive to a file")
+    args = parser.parse_args()
+
+    stages = {}
+    rider_plans = {}
+    for stage in args.stages:
+        df = create_dataframe(read_gpx_file(STAGE_DIRECTORY / f"{stage}-route.gpx"))
+        segments_df, _, _ = define_drafting_decisions(
+            segment_route(df, **SEGMENTATION_PARAMETERS),
+            semi_draft_point=0.6,
+            full_draft_point=0.9,
+        )
+        stages[stage] = df
+        rider_plans[stage] = plan_roster_segments(ROSTER, segments_df)
+
+    num_points = sum(len(df) for df in stages.values())
+    num_files = len(stages) * len(ROSTER)
+    print(
+        f"{len(stages)} stages, {len(ROSTER)} riders: {num_files} gpx files of "
+        f"{num_points * len(ROSTER)} points"
+    )
+
+    start = time.perf_counter()
+    archive = io.BytesIO()
+    export_team_gpx(archive, stages=stages, rider_plans=rider_plans)
+    duration = time.perf_counter() - start
+    print(
+        f"{'team export':>14}: {duration:6.2f} s, "
+        f"{archive.getbuffer().nbytes / 2**20:.1f} MB zip"
+    )
+
+    stage, df = next(iter(stages.items()))
+    rider, (weight_rider, segments_df) = next(iter(rider_plans[stage].items()))
+    for label, function in [
+        ("writer", lambda: export_route_gpx(df, segments_df, name=stage)),
+        ("gpxpy", lambda: export_gpxpy(df, segments_df, name=stage)),
+    ]:
+        start = time.perf_counter()
+        gpx_data = function()
+        duration = time.perf_counter() - start
+        print(f"{f'{stage} {label}':>14}: {duration * 1000:6.0f} ms")
+
+    failures = 0
+    with zipfile.ZipFile(archive) as zip_file:
+        for stage, df in stages.items():
+            for rider, (weight_rider, segments_df) in rider_plans[stage].items():
+                gpx_data = zip_file.read(f"{stage}/{stage} {rider}.gpx")
+                differences = check_export(gpx_data, df, segments_df)
+                if differences:
+                    failures += 1
+                    print(f"{stage} {rider}: {'; '.join(differences)}")
+    print(f"{num_files - failures}/{num_files} files match their route and plan")
+
+    if args.output:
+        args.output.write_bytes(archive.getvalue())
+        print(f"Zip archive written to {args.output}")
+    if failures:
+        raise SystemExit(f"{failures} files differ from their route and plan")
+
+
+if __name__ == "__main__":
+    main()
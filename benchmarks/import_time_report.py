@@ -0,0 +1,118 @@
+"""Report the import time of the app entry point and every page.
+
+Runs the imports of every page in a fresh interpreter with `python -X importtime`
+and reports the total import time and the slowest modules, to track cold-start
+regressions. Only the import statements of a page are run, not the page itself.
+Heavy modules that the src code defers to first use should not show up here.
+
+Usage:
+    python -m benchmarks.import_time_report [--top 10] [--repeat 3]
+        [--output results.csv]
+"""
+
+import argparse
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils import WARM_UP_MODULES
+
+PAGES = [Path("stage_selection.py"), *sorted(Path("pages").glob("*.py"))]
+
+
+def extract_imports(path: Path) -> str:
+    """Get the top-level import statements of a page as source code."""
+    tree = ast.parse(path.read_text())
+    imports = [
+        ast.get_source_segment(path.read_text(), node)
+        for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+    ]
+    return "\n".join(imports)
+
+
+def measure_import_time(source: str) -> pd.DataFrame:
+    """Run import statements in a fresh interpreter and parse the importtime log.
+
+    Args:
+        source: Import statements to run.
+
+    Returns:
+        pd.DataFrame: Self and cumulative import time in ms per imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", source],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        rows.append(
+            {
+                "module": module.strip(),
+                "depth": (len(module) - len(module.lstrip()) - 1) // 2,
+                "self (ms)": int(self_us) / 1000,
+                "cumulative (ms)": int(cumulative_us) / 1000,
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = []
+    for path in PAGES:
+        # Best of several runs, the first run also pays for compiling bytecode
+        runs = [measure_import_time(extract_imports(path)) for _ in range(args.repeat)]
+        totals = [run.loc[run["depth"] == 0, "cumulative (ms)"].sum() for run in runs]
+        best = runs[min(range(len(runs)), key=totals.__getitem__)]
+        top_level = best[best["depth"] == 0]
+        heaviest = best.nlargest(args.top, "self (ms)")
+
+        results.append(
+            {
+                "page": str(path),
+                "import time (ms)": min(totals),
+                "modules": len(best),
+                "heavy modules": ", ".join(
+                    module
+                    for module in WARM_UP_MODULES
+                    if module in set(best["module"])
+                ),
+            }
+        )
+        print(f"{path}: {min(totals):.0f} ms, {len(best)} modules")
+        print(
+            top_level.nlargest(args.top, "cumulative (ms)")[
+                ["module", "cumulative (ms)"]
+            ].to_string(index=False, float_format="%.1f")
+        )
+        print(
+            heaviest[["module", "self (ms)"]].to_string(
+                index=False, float_format="%.1f"
+            )
+        )
+        print()
+
+    results_df = pd.DataFrame(results)
+    print(results_df.to_string(index=False, float_format="%.0f"))
+
+    if args.output is not None:
+        results_df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Benchmark page reruns end to end with Streamlit's headless test runner.
+
+Drives the stage selection and the first four pages through the interactions of a
+coach for every TDF stage: switching stage, nudging the minimum segment length,
+editing a power cell and recomputing durations. Every step records the wall time
+from the interaction until the page is ready and the resident memory of the process
+after it. The first pass over the stages is cold, later passes are warm.
+
+AppTest cannot drive data editor widgets, so the power cell edit is applied through
+the edited segments in the session state, which is what the segment analysis page
+reads the edits from.
+
+Usage:
+    python -m benchmarks.page_rerun_benchmark [--stages stage-1 stage-2] [--repeat 2]
+        [--output report.csv] [--compare baseline.csv] [--tolerance 0.2]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.session_concurrency import resident_memory_mb
+from src import utils
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "stage_selection.py"
+STAGES = [f"stage-{i}" for i in range(1, 22)]
+
+
+class PageDriver:
+    """Drive one app session and record every rerun."""
+
+    def __init__(self, timeout: float = 300):
+        self.app = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self.records = []
+
+    def run(self, pass_number: int, stage: str, page: str, step: str) -> None:
+        """Rerun the app and record the wall time and memory of the rerun."""
+        start = time.perf_counter()
+        self.app.run()
+        duration = time.perf_counter() - start
+        if self.app.exception:
+            raise RuntimeError(
+                f"{page} ({step}) failed on {stage}: {self.app.exception[0].value}"
+            )
+
+        self.records.append(
+            {
+                "pass": pass_number,
+                "stage": stage,
+                "page": page,
+                "step": step,
+                "duration (ms)": duration * 1000,
+                "memory (MB)": resident_memory_mb(),
+            }
+        )
+
+    def open_page(self, pass_number: int, stage: str, page: str) -> None:
+        self.app.switch_page(page)
+        self.run(pass_number, stage, page, "open")
+
+    def run_stage(self, pass_number: int, stage: str) -> None:
+        """Run the interactions of a coach on a stage."""
+        app = self.app
+
+        # Stage selection: switch stage
+        app.switch_page("stage_selection.py")
+        app.run()
+        app.selectbox[0].set_value(stage)
+        self.run(pass_number, stage, "stage_selection.py", "switch stage")
+
+        # Segment generation: nudge the minimum segment length
+        page = "pages/01_segment_generation.py"
+        self.open_page(pass_number, stage, page)
+        window_size = next(
+            widget
+            for widget in app.number_input
+            if widget.label == "Minimum segment length (km)"
+        )
+        window_size.set_value(2.1 if window_size.value == 2.0 else 2.0)
+        self.run(pass_number, stage, page, "nudge window_size_km")
+
+        # Segment analysis: edit a power cell and recompute durations
+        page = "pages/02_segment_analysis.py"
+        self.open_page(pass_number, stage, page)
+        segments_df = app.session_state["segments_df_edited"].copy()
+        column = segments_df.columns.get_loc("relative power (w/kg)")
+        segments_df.iloc[0, column] += 0.1
+        app.session_state["segments_df_edited"] = segments_df
+        self.run(pass_number, stage, page, "edit power cell")
+        next(
+            button for button in app.button if button.label == "Recompute durations"
+        ).click()
+        self.run(pass_number, stage, page, "recompute durations")
+
+        # Segment strategy and glycogen analysis
+        for page in ["pages/03_segment_strategy.py", "pages/04_glycogen_analysis.py"]:
+            self.open_page(pass_number, stage, page)
+
+
+def summarize(report_df: pd.DataFrame) -> pd.DataFrame:
+    """Summarize the cold (first pass) and warm (later passes) rerun times per step."""
+    report_df = report_df.assign(
+        run=report_df["pass"].map(
+            lambda pass_number: "cold" if pass_number == 1 else "warm"
+        )
+    )
+    summary_df = report_df.pivot_table(
+        index=["page", "step"],
+        columns="run",
+        values="duration (ms)",
+        aggfunc=["median", "max"],
+        sort=False,
+    )
+    summary_df.columns = [f"{run} {stat} (ms)" for stat, run in summary_df.columns]
+    return summary_df.round(0)
+
+
+def compare(
+    report_df: pd.DataFrame, baseline_df: pd.DataFrame, tolerance: float
+) -> pd.DataFrame:
+    """Compare warm rerun times per step with a baseline report.
+
+    Returns:
+        pd.DataFrame: Median times per step, with the steps that are more than
+            `tolerance` slower than the baseline flagged as regressions.
+    """
+    columns = ["page", "step"]
+    current = (
+        report_df[report_df["pass"] > 1].groupby(columns)["duration (ms)"].median()
+    )
+    baseline = (
+        baseline_df[baseline_df["pass"] > 1].groupby(columns)["duration (ms)"].median()
+    )
+    comparison_df = pd.DataFrame({"baseline (ms)": baseline, "current (ms)": current})
+    comparison_df["ratio"] = (
+        comparison_df["current (ms)"] / comparison_df["baseline (ms)"]
+    )
+    comparison_df["regression"] = comparison_df["ratio"] > 1 + tolerance
+    return comparison_df.round(2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=STAGES)
+    parser.add_argument("--repeat", type=int, default=2, help="Passes over the stages")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", type=Path, help="Write every rerun to a csv file")
+    parser.add_argument("--compare", type=Path, help="Baseline csv file to compare")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative slowdown that counts as a regression",
+    )
+    args = parser.parse_args()
+
+    # Keep the benchmark routes and segments out of the app's results store
+    results_directory = tempfile.TemporaryDirectory()
+    utils.RESULTS_STORE_PATH = str(Path(results_directory.name) / "results.db")
+
+    driver = PageDriver(timeout=args.timeout)
+    for pass_number in range(1, args.repeat + 1):
+        for stage in args.stages:
+            driver.run_stage(pass_number, stage)
+
+    report_df = pd.DataFrame(driver.records)
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(summarize(report_df))
+        print(
+            f"\nMemory: {report_df['memory (MB)'].iloc[0]:.0f} MB after the first "
+            f"rerun, {report_df['memory (MB)'].max():.0f} MB peak"
+        )
+        if args.compare:
+            comparison_df = compare(
+                report_df, pd.read_csv(args.compare), args.tolerance
+            )
+            print(f"\nComparison with {args.compare}:")
+            print(comparison_df)
+            print(f"\n{comparison_df['regression'].sum()} regressions")
+
+    if args.output:
+        report_df.to_csv(args.output, index=False)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
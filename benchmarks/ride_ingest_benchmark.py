@@ -0,0 +1,182 @@
+"""Benchmark the ingest of a team's recorded rides and check the plan comparison.
+
+Plans a TDF stage as the API does and writes synthetic recorded rides that follow
+the plan at 1 Hz: every rider rides the planned segment durations scaled by a pace
+factor, at the planned power scaled by a power factor plus noise. Half of the rides
+are gpx files with timestamps and power extensions, the others csv files. The rides
+are read and compared with the plan one after the other and with the thread and
+process pools, and the comparison has to recover the pace and power factors.
+
+Usage:
+    python -m benchmarks.ride_ingest_benchmark [--stage stage-1] [--riders 8]
+        [--workers 4] [--seed 0]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import STRATEGY_PARAMETERS, evaluate_strategy
+from src.process_data import (
+    SEGMENTATION_PARAMETERS,
+    STAGE_DIRECTORY,
+    create_dataframe,
+    read_gpx_file,
+    segment_route,
+)
+from src.ride_ingest import compare_ride, compare_team_rides, read_ride
+
+START_TIME = pd.Timestamp("2026-07-05 11:00:00", tz="UTC")
+
+
+def simulate_ride(
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    weight_rider: float,
+    pace_factor: float,
+    power_factor: float,
+    rng: np.random.Generator,
+) -> pd.DataFrame:
+    """Simulate a 1 Hz recording of a ride that follows the plan."""
+    boundaries_km = np.concatenate(
+        [segments_df["start point (km)"].iloc[:1], segments_df["end point (km)"]]
+    )
+    boundary_time = np.concatenate(
+        [[0.0], np.cumsum(segments_df["duration (s)"].to_numpy() * pace_factor)]
+    )
+    # Time at every route point, then the route position at every second
+    point_time = np.interp(df["distance"], boundaries_km, boundary_time)
+    seconds = np.arange(0, boundary_time[-1], 1.0)
+    distance = np.interp(seconds, point_time, df["distance"])
+
+    segment = np.clip(
+        np.searchsorted(boundary_time, seconds, side="right") - 1,
+        0,
+        len(segments_df) - 1,
+    )
+    power = (
+        segments_df["relative power (w/kg)"].to_numpy()[segment]
+        * weight_rider
+        * power_factor
+    )
+    power = np.maximum(power + rng.normal(0, 15, len(seconds)), 0).round()
+
+    return pd.DataFrame(
+        {
+            "time": START_TIME + pd.to_timedelta(seconds, unit="s"),
+            "latitude": np.interp(distance, df["distance"], df["latitude"]),
+            "longitude": np.interp(distance, df["distance"], df["longitude"]),
+            "elevation": np.interp(distance, df["distance"], df["elevation"]),
+            "power": power,
+        }
+    )
+
+
+def write_ride_gpx(ride_df: pd.DataFrame, path: Path) -> None:
+    """Write a ride as gpx with timestamps and power extensions."""
+    times = ride_df["time"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    with open(path, "w") as gpx_file:
+        gpx_file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="vlab" '
+            'xmlns="http://www.topografix.com/GPX/1/1">\n<trk><trkseg>\n'
+        )
+        for row, timestamp in zip(ride_df.itertuples(index=False), times):
+            gpx_file.write(
+                f'<trkpt lat="{row.latitude:.7f}" lon="{row.longitude:.7f}">'
+                f"<ele>{row.elevation:.1f}</ele><time>{timestamp}</time>"
+                f"<extensions><power>{row.power:.0f}</power></extensions></trkpt>\n"
+            )
+        gpx_file.write("</trkseg></trk>\n</gpx>\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stage", default="stage-1")
+    parser.add_argument("--riders", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rider_stats = STRATEGY_PARAMETERS["rider_stats"]
+    df = create_dataframe(read_gpx_file(STAGE_DIRECTORY / f"{args.stage}-route.gpx"))
+    segments_df = evaluate_strategy(
+        segment_route(df, **SEGMENTATION_PARAMETERS), rider_stats=rider_stats
+    )
+
+    rng = np.random.default_rng(args.seed)
+    pace_factors = rng.uniform(0.95, 1.1, args.riders)
+    power_factors = rng.uniform(0.9, 1.05, args.riders)
+
+    with tempfile.TemporaryDirectory() as directory:
+        rides = {}
+        for i, (pace_factor, power_factor) in enumerate(
+            zip(pace_factors, power_factors)
+        ):
+            ride_df = simulate_ride(
+                df,
+                segments_df,
+                weight_rider=rider_stats["weight_rider"],
+                pace_factor=pace_factor,
+                power_factor=power_factor,
+                rng=rng,
+            )
+            path = Path(directory) / f"rider-{i + 1}.{'gpx' if i % 2 == 0 else 'csv'}"
+            if path.suffix == ".gpx":
+                write_ride_gpx(ride_df, path)
+            else:
+                ride_df.to_csv(path, index=False)
+            rides[path.name] = path
+        print(
+            f"{args.stage}: {len(segments_df)} segments, {args.riders} rides of "
+            f"{len(ride_df)} points"
+        )
+
+        start = time.perf_counter()
+        sequential = {
+            name: compare_ride(read_ride(path), segments_df, rider_stats)
+            for name, path in rides.items()
+        }
+        print(f"{'sequential':>10}: {time.perf_counter() - start:6.2f} s")
+        for executor in ["thread", "process"]:
+            start = time.perf_counter()
+            parallel = compare_team_rides(
+                rides,
+                segments_df,
+                rider_stats,
+                workers=args.workers,
+                executor=executor,
+            )
+            print(f"{executor:>10}: {time.perf_counter() - start:6.2f} s")
+            for name in rides:
+                pd.testing.assert_frame_equal(parallel[name], sequential[name])
+
+    failures = 0
+    for (name, comparison_df), pace_factor, power_factor in zip(
+        sequential.items(), pace_factors, power_factors
+    ):
+        total = comparison_df[["planned duration (s)", "actual duration (s)"]].sum()
+        pace = total["actual duration (s)"] / total["planned duration (s)"]
+        power = np.average(
+            comparison_df["actual power (W)"] / comparison_df["planned power (W)"],
+            weights=comparison_df["actual duration (s)"],
+        )
+        ok = abs(pace - pace_factor) < 0.01 and abs(power - power_factor) < 0.02
+        failures += not ok
+        print(
+            f"{name:>12}: pace {pace:.3f} (ridden {pace_factor:.3f}), "
+            f"power {power:.3f} (ridden {power_factor:.3f}), "
+            f"final glycogen {comparison_df['actual glycogen level (%)'].iloc[-1]:.0f}"
+            f"% (planned {comparison_df['planned glycogen level (%)'].iloc[-1]:.0f}%)"
+        )
+
+    if failures:
+        raise SystemExit(f"{failures} rides do not match their pace or power")
+
+
+if __name__ == "__main__":
+    main()
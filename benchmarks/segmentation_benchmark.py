@@ -0,0 +1,92 @@
+"""Benchmark the segmentation methods on all TDF stages.
+
+Compares run time, number of segments and fit error (RMSE of a least-squares line
+per segment) of the peak/valley method and the optimal piecewise-linear method.
+
+Usage:
+    python -m benchmarks.segmentation_benchmark [--repeat 5] [--output results.csv]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from src.generate_segments import generate_segments
+from src.optimal_segmentation import compute_fit_error, generate_optimal_segments
+from src.process_data import create_dataframe, read_gpx_file
+
+STAGE_DIRECTORY = Path("data/tdf")
+
+
+def time_method(function, repeat: int, **kwargs) -> tuple:
+    """Run a segmentation method and return its best run time and segments."""
+    run_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        segments = function(**kwargs)
+        run_times.append(time.perf_counter() - start)
+
+    return min(run_times), segments
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--window-size-km", type=float, default=2.0)
+    parser.add_argument("--min-slope-diff", type=float, default=1.5)
+    parser.add_argument("--penalty", type=float, default=10000.0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    stages = sorted(
+        STAGE_DIRECTORY.glob("stage-*-route.gpx"),
+        key=lambda path: int(path.stem.split("-")[1]),
+    )
+
+    results = []
+    for path in stages:
+        df = create_dataframe(gpx_file=read_gpx_file(path=str(path)))
+        methods = {
+            "peaks and valleys": (
+                generate_segments,
+                dict(
+                    window_size_km=args.window_size_km,
+                    min_slope_diff=args.min_slope_diff,
+                ),
+            ),
+            "optimal piecewise linear": (
+                generate_optimal_segments,
+                dict(penalty=args.penalty, min_length_km=args.window_size_km),
+            ),
+        }
+        for method, (function, kwargs) in methods.items():
+            run_time, segments = time_method(function, args.repeat, df=df, **kwargs)
+            results.append(
+                {
+                    "stage": path.stem.replace("-route", ""),
+                    "points": len(df),
+                    "method": method,
+                    "run time (ms)": run_time * 1000,
+                    "segments": len(segments),
+                    "fit error (m)": compute_fit_error(df, segments),
+                }
+            )
+
+    results_df = pd.DataFrame(results)
+    pd.set_option("display.width", 200)
+    print(results_df.to_string(index=False, float_format="%.2f"))
+    print()
+    print(
+        results_df.groupby("method")[["run time (ms)", "segments", "fit error (m)"]]
+        .mean()
+        .to_string(float_format="%.2f")
+    )
+
+    if args.output is not None:
+        results_df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Simulate many concurrent app sessions and report memory and latency.
+
+Every simulated session does what a user does when opening the app: it loads a
+stage, builds the route index, range statistics, segments and figures with the same
+cached functions and arguments as the pages, and keeps its own edited copy of the
+segments in a session state dict. All sessions of a round run at the same time in
+threads, like the script threads of the Streamlit server, and they are kept alive
+between rounds, so the memory reported for N sessions is what the server holds for
+N users. The app's own headless test runner cannot be used here, it swaps a global
+runtime for every run and does not support concurrent runs.
+
+Routes are shared through the route registry, so the number of route copies stays
+at the number of distinct stages. With --private-copies every session copies its
+route, as sessions did before, for comparison.
+
+Usage:
+    python -m benchmarks.session_concurrency [--sessions 1 2 4 8 16 32]
+        [--stages stage-1 stage-2] [--private-copies]
+"""
+
+import argparse
+import resource
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from src import utils
+from src.compute_segments_analytics import (
+    apply_relative_power,
+    compute_durations_batch,
+    define_drafting_decisions,
+)
+from src.utils import (
+    get_map_figure,
+    get_range_statistics,
+    get_route_index,
+    get_route_registry,
+    get_segments,
+    get_segments_figure,
+    load_stage,
+)
+
+RIDER_STATS = {
+    "weight_rider": 70,
+    "cda_values": {"full": 0.14, "semi": 0.2, "none": 0.32},
+}
+
+
+def resident_memory_mb() -> float:
+    """Get the resident memory of this process in MB."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak instead of current memory where /proc is not available (in kB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_session(stage: str, private_copy: bool = False) -> tuple:
+    """Open a session on a stage and return its state and duration in seconds."""
+    start = time.perf_counter()
+    session_state = {"selected_stage": stage}
+
+    # Stage selection
+    df = load_stage(stage)
+    if private_copy:
+        df = df.copy()
+    session_state["df"] = df
+    session_state["route_index"] = get_route_index(df)
+    session_state["range_statistics"] = get_range_statistics(df)
+
+    # Segment generation
+    segments, segments_df = get_segments(
+        df=df,
+        segmentation_method="peaks and valleys",
+        window_size_km=2.0,
+        min_slope_diff=1.5,
+        segment_penalty=10000.0,
+    )
+    get_map_figure(
+        df=df,
+        segments_df=segments_df,
+        selected_stage=stage,
+        _route_index=session_state["route_index"],
+    )
+    get_segments_figure(df=df, segments=segments)
+
+    # Segment analysis, the edited segments are the only state of the session
+    segments_df, _, _ = define_drafting_decisions(segments_df)
+    segments_df["relative power (w/kg)"] = segments_df.apply(
+        apply_relative_power, args=(5.5, 1.5, 3.0), axis=1
+    )
+    segments_df["duration (s)"] = compute_durations_batch(
+        segments_df, rider_stats=RIDER_STATS
+    ).round(0)
+    session_state["segments"] = segments
+    session_state["segments_df_edited"] = segments_df
+
+    return session_state, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--stages", nargs="+", default=["stage-1", "stage-2"])
+    parser.add_argument(
+        "--private-copies",
+        action="store_true",
+        help="Copy the route in every session instead of sharing it",
+    )
+    args = parser.parse_args()
+
+    # Keep the benchmark routes and segments out of the app's results store
+    results_directory = tempfile.TemporaryDirectory()
+    utils.RESULTS_STORE_PATH = str(Path(results_directory.name) / "results.db")
+
+    # Warm up the caches, so the first round does not include processing the routes
+    for stage in args.stages:
+        run_session(stage)
+
+    sessions = []
+    baseline_mb = resident_memory_mb()
+    print(
+        f"{'sessions':>8} {'memory (MB)':>12} {'per session (MB)':>17} "
+        f"{'route copies':>13} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9}"
+    )
+    for num_sessions in sorted(args.sessions):
+        new_sessions = num_sessions - len(sessions)
+        if new_sessions <= 0:
+            continue
+
+        stages = [args.stages[i % len(args.stages)] for i in range(new_sessions)]
+        with ThreadPoolExecutor(max_workers=new_sessions) as executor:
+            results = list(
+                executor.map(
+                    lambda stage: run_session(stage, args.private_copies), stages
+                )
+            )
+        sessions.extend(session_state for session_state, _ in results)
+        durations = np.array([duration for _, duration in results])
+
+        memory_mb = resident_memory_mb() - baseline_mb
+        route_copies = len({id(session_state["df"]) for session_state in sessions})
+        print(
+            f"{num_sessions:>8} {memory_mb:>12.1f} {memory_mb / num_sessions:>17.2f} "
+            f"{route_copies:>13} {np.percentile(durations, 50) * 1000:>9.0f} "
+            f"{np.percentile(durations, 95) * 1000:>9.0f} "
+            f"{durations.max() * 1000:>9.0f}"
+        )
+
+    route_registry = get_route_registry()
+    print(
+        f"\nRoute registry: {len(route_registry)} routes, "
+        f"{route_registry.memory_usage() / 1e6:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
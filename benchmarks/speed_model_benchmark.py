@@ -0,0 +1,110 @@
+"""Benchmark the route geometry speed model on all TDF stages.
+
+Plans every stage with the default strategy parameters and computes the flat and
+descending segment durations with the constant average speeds and with the speed
+model. Reports the time of `compute_route_durations`, which runs on every rerun of
+the segment analysis page, and how far the modelled durations are from the constant
+speed durations. Checks that climbing segments keep their duration.
+
+Usage:
+    python -m benchmarks.speed_model_benchmark [--stages stage-1 stage-2]
+        [--repeat 20]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import (
+    compute_durations_batch,
+    define_drafting_decisions,
+)
+from src.process_data import (
+    SEGMENTATION_PARAMETERS,
+    STAGE_DIRECTORY,
+    create_dataframe,
+    read_gpx_file,
+    segment_route,
+)
+from src.speed_model import compute_route_durations, compute_speed_profile
+
+STAGES = [f"stage-{i}" for i in range(1, 22)]
+RIDER_STATS = {
+    "weight_rider": 70.0,
+    "cda_values": {"full": 0.25, "semi": 0.29, "none": 0.33},
+    "relative_power_climb": 5.2,
+    "relative_power_flat": 3.0,
+    "relative_power_descend": 1.5,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", default=STAGES)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = []
+    failures = 0
+    for stage in args.stages:
+        df = create_dataframe(read_gpx_file(STAGE_DIRECTORY / f"{stage}-route.gpx"))
+        segments_df, _, _ = define_drafting_decisions(
+            segment_route(df, **SEGMENTATION_PARAMETERS),
+            semi_draft_point=0.6,
+            full_draft_point=0.9,
+        )
+        segments_df["relative power (w/kg)"] = np.select(
+            [
+                segments_df["average slope (%)"] > 2,
+                segments_df["average slope (%)"] < -2,
+            ],
+            [
+                RIDER_STATS["relative_power_climb"],
+                RIDER_STATS["relative_power_descend"],
+            ],
+            RIDER_STATS["relative_power_flat"],
+        )
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            route_durations = compute_route_durations(df, segments_df, RIDER_STATS)
+        duration = (time.perf_counter() - start) / args.repeat
+
+        constant = compute_durations_batch(segments_df, rider_stats=RIDER_STATS)
+        modelled = compute_durations_batch(
+            segments_df, rider_stats=RIDER_STATS, route_durations=route_durations
+        )
+        climbing = segments_df["average slope (%)"].to_numpy() > 2
+        if not np.allclose(constant[climbing], modelled[climbing]):
+            failures += 1
+            print(f"{stage}: climbing durations changed")
+
+        speed_profile = compute_speed_profile(df, segments_df, RIDER_STATS)
+        descending = segments_df["average slope (%)"].to_numpy() < -2
+        results.append(
+            {
+                "stage": stage,
+                "points": len(df),
+                "segments": len(segments_df),
+                "model (ms)": duration * 1000,
+                "flat constant (min)": constant[~climbing & ~descending].sum() / 60,
+                "flat model (min)": modelled[~climbing & ~descending].sum() / 60,
+                "down constant (min)": constant[descending].sum() / 60,
+                "down model (min)": modelled[descending].sum() / 60,
+                "corners < 30 m": int((speed_profile["turn radius (m)"] < 30).sum()),
+            }
+        )
+
+    results_df = pd.DataFrame(results).set_index("stage")
+    with pd.option_context("display.width", 200, "display.max_columns", 10):
+        print(results_df.round(1))
+        print(f"\nMedian model time: {results_df['model (ms)'].median():.1f} ms")
+
+    if failures:
+        raise SystemExit(f"{failures} stages changed their climbing durations")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,14 @@
 
 import streamlit as st
 
-from src.generate_segments import create_segments_dataframe, generate_segments
-from src.plotting import plot_map, plot_segments
-from src.utils import excel_download_button, set_page_config
+from src.utils import (
+    excel_download_button,
+    get_climb_catalog,
+    get_map_figure,
+    get_segments,
+    get_segments_figure,
+    set_page_config,
+)
 
 set_page_config()
 
@@ -19,6 +24,9 @@ else:
 if "selected_stage" in st.session_state:
     selected_stage = st.session_state.selected_stage
 
+if "route_index" in st.session_state:
+    route_index = st.session_state.route_index
+
 if "window_size_km" in st.session_state:
     window_size_km = st.session_state.window_size_km
 else:
@@ -29,33 +37,120 @@ if "min_slope_diff" in st.session_state:
 else:
     min_slope_diff = 1.5
 
+if "segmentation_method" in st.session_state:
+    segmentation_method = st.session_state.segmentation_method
+else:
+    segmentation_method = "peaks and valleys"
+
+if "segment_penalty" in st.session_state:
+    segment_penalty = st.session_state.segment_penalty
+else:
+    segment_penalty = 10000.0
+
 # Define sidebar
 with st.sidebar:
     st.header("⚙️ Segment model parameters", divider="grey")
+    segmentation_methods = ["peaks and valleys", "optimal piecewise linear"]
+    segmentation_method = st.selectbox(
+        "Segmentation method",
+        options=segmentation_methods,
+        index=segmentation_methods.index(segmentation_method),
+    )
     window_size_km = st.number_input(
         "Minimum segment length (km)", value=window_size_km, step=0.1
     )
-    min_slope_diff = st.number_input(
-        "Minimum slope difference (%)", value=min_slope_diff, step=0.1
-    )
+    if segmentation_method == "peaks and valleys":
+        min_slope_diff = st.number_input(
+            "Minimum slope difference (%)", value=min_slope_diff, step=0.1
+        )
+    else:
+        segment_penalty = st.number_input(
+            "Segment penalty",
+            value=segment_penalty,
+            step=1000.0,
+            help="Cost of adding a segment in squared meters of elevation error, "
+            "higher values give fewer segments.",
+        )
     st.image(
         "assets/logo.png",
         use_column_width=True,
     )
 
-# Generate segments
-segments = generate_segments(
-    df=df, window_size_km=window_size_km, min_slope_diff=min_slope_diff
-)
-segments_df = create_segments_dataframe(df=df, segments=segments)
+# Reserve the page layout, so cheap elements can be filled in before the figures
+map_container = st.container()
+metrics_container = st.container()
+segment_container = st.container()
+table_container = st.container()
 
-# Plot map with segments
-map_fig = plot_map(
+# Generate segments
+segments, segments_df = get_segments(
     df=df,
-    segments_df=segments_df,
-    selected_stage=selected_stage,
+    segmentation_method=segmentation_method,
+    window_size_km=window_size_km,
+    min_slope_diff=min_slope_diff,
+    segment_penalty=segment_penalty,
 )
-st.plotly_chart(map_fig, use_container_width=True)
+
+# Ingest the climbs of the stage into the catalog shared by all sessions
+if selected_stage != "custom gpx":
+    get_climb_catalog().add_stage(stage=selected_stage, df=df, segments_df=segments_df)
+
+
+@st.fragment
+def route_map(df, segments_df, selected_stage, route_index) -> None:
+    """Show the map with a point lookup, reruns on its own when a point is picked."""
+    map_fig = get_map_figure(
+        df=df,
+        segments_df=segments_df,
+        selected_stage=selected_stage,
+        _route_index=route_index,
+    )
+    map_event = st.plotly_chart(
+        map_fig, use_container_width=True, on_select="rerun", selection_mode="points"
+    )
+
+    # Look up a route point by distance or by clicking on the map
+    selected_points = [
+        point
+        for point in map_event.selection.points
+        if "lat" in point and "lon" in point
+    ]
+    if selected_points:
+        selected_km = float(
+            route_index.nearest_km(selected_points[0]["lat"], selected_points[0]["lon"])
+        )
+    else:
+        selected_km = 0.0
+    jump_to_km = st.number_input(
+        "📍 Jump to km",
+        min_value=0.0,
+        max_value=float(route_index.distance[-1]),
+        value=selected_km,
+        step=0.1,
+        format="%.1f",
+        help="Click on the map to select the nearest km.",
+    )
+    point = df.iloc[int(route_index.index_at_km(jump_to_km))]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric(label="Distance", value=f"📍 {point['distance']:.2f} km")
+    col2.metric(label="Elevation", value=f"⛰️ {point['elevation']:.0f} m")
+    col3.metric(label="Gradient", value=f"📐 {point['gradient']:.1f} %")
+    col4.metric(
+        label="Location", value=f"🌍 {point['latitude']:.4f}, {point['longitude']:.4f}"
+    )
+
+
+@st.fragment
+def segments_table(segments_df, selected_stage) -> None:
+    """Show the segments with a download button, which only reruns the table."""
+    st.caption(f"💾 Dataframe with {len(segments_df)} generated segments")
+    st.dataframe(segments_df, use_container_width=True)
+    excel_download_button(
+        df=segments_df,
+        label="Download segments",
+        filename=f"stage_{selected_stage}_segments",
+    )
+
 
 # Add stage info metrics
 total_distance = int(df["distance"].max())
@@ -63,29 +158,35 @@ min_elevation = int(df["elevation"].min())
 max_elevation = int(df["elevation"].max().round(0))
 total_gain = int(df[df["elevation_diff"] >= 0]["elevation_diff"].sum().round(0))
 
-col1, col2, col3, col4 = st.columns(4)
-col1.metric(label="Total distance", value=f"🗺️ {total_distance} km")
-col2.metric(label="Total elevation gain", value=f"📈 {total_gain} m")
-col3.metric(label="Min elevation", value=f"⬇️ {min_elevation} m")
-col4.metric(label="Max elevation", value=f"⬆️ {max_elevation} m")
-
-# Plot elevation with segments
-segment_fig = plot_segments(df=df, segments=segments)
-st.plotly_chart(segment_fig, use_container_width=True)
+with metrics_container:
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric(label="Total distance", value=f"🗺️ {total_distance} km")
+    col2.metric(label="Total elevation gain", value=f"📈 {total_gain} m")
+    col3.metric(label="Min elevation", value=f"⬇️ {min_elevation} m")
+    col4.metric(label="Max elevation", value=f"⬆️ {max_elevation} m")
 
 # Display dataframe with segment info
-st.caption(f"💾 Dataframe with {len(segments_df)} generated segments")
-st.dataframe(segments_df, use_container_width=True)
-
-# Download button for dataframe
-excel_download_button(
-    df=segments_df,
-    label="Download segments",
-    filename=f"stage_{selected_stage}_segments",
-)
+with table_container:
+    segments_table(segments_df=segments_df, selected_stage=selected_stage)
+
+# Plot map and elevation with segments last, as they take the longest to build
+with map_container:
+    route_map(
+        df=df,
+        segments_df=segments_df,
+        selected_stage=selected_stage,
+        route_index=route_index,
+    )
+
+with segment_container:
+    st.plotly_chart(
+        get_segments_figure(df=df, segments=segments), use_container_width=True
+    )
 
 # Save data to session state
 st.session_state.window_size_km = window_size_km
 st.session_state.min_slope_diff = min_slope_diff
+st.session_state.segmentation_method = segmentation_method
+st.session_state.segment_penalty = segment_penalty
 st.session_state.segments = segments
 st.session_state.segments_df = segments_df
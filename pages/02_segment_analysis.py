@@ -6,12 +6,23 @@ import pandas as pd
 import streamlit as st
 
 from src.compute_segments_analytics import (
-    apply_duration,
     apply_relative_power,
+    compute_durations_batch,
     define_drafting_decisions,
 )
-from src.plotting import plot_segments
-from src.utils import excel_download_button, set_page_config
+from src.plotting import plot_marginal_gains
+from src.range_statistics import check_segment_boundaries, update_segment_statistics
+from src.sensitivity import compute_sensitivities
+from src.solve_target_time import solve_for_target_time
+from src.speed_model import SPEED_MODELS, compute_route_durations
+from src.utils import (
+    excel_download_button,
+    format_duration,
+    get_segments_figure,
+    gpx_download_button,
+    save_scenario_form,
+    set_page_config,
+)
 
 set_page_config()
 
@@ -38,6 +49,9 @@ if "segments" in st.session_state:
 if "segments_df" in st.session_state:
     segments_df = st.session_state.segments_df
 
+if "range_statistics" in st.session_state:
+    range_statistics = st.session_state.range_statistics
+
 if "average_speed_flat" in st.session_state:
     average_speed_flat = st.session_state.average_speed_flat
 else:
@@ -48,6 +62,11 @@ if "average_speed_down" in st.session_state:
 else:
     average_speed_down = 60.0
 
+if "speed_model" in st.session_state:
+    speed_model = st.session_state.speed_model
+else:
+    speed_model = "constant"
+
 if "rider_stats" in st.session_state:
     weight_rider = st.session_state.rider_stats["weight_rider"]
     cda_full = st.session_state.rider_stats["cda_values"]["full"]
@@ -99,12 +118,21 @@ with st.sidebar:
         on_change=save_dataframe_edits,
     )
     st.header("Segment Speeds", divider="grey")
+    speed_model = st.radio(
+        "Speed model",
+        options=SPEED_MODELS,
+        index=SPEED_MODELS.index(speed_model),
+        on_change=save_dataframe_edits,
+        help="Route geometry models the speed on flat and descending segments at "
+        "every point from the power, gradient, turn radius and braking for corners.",
+    )
     average_speed_flat = st.number_input(
         "Avg. speed flat segments",
         value=average_speed_flat,
         step=0.5,
         format="%.1f",
         on_change=save_dataframe_edits,
+        disabled=speed_model != "constant",
     )
     average_speed_down = st.number_input(
         "Avg. speed down segments",
@@ -112,6 +140,7 @@ with st.sidebar:
         step=0.5,
         format="%.1f",
         on_change=save_dataframe_edits,
+        disabled=speed_model != "constant",
     )
 
     st.image(
@@ -130,9 +159,8 @@ rider_stats = {
     },
 }
 
-# Plot elevation with segments
-segment_fig = plot_segments(df=df, segments=segments)
-st.plotly_chart(segment_fig, use_container_width=True)
+# Reserve space for the elevation plot, it is drawn after the table
+segment_container = st.container()
 
 # Set drafting points
 segments_df, semi_draft_segment, full_draft_segment = define_drafting_decisions(
@@ -151,13 +179,20 @@ if "relative power (w/kg)" not in segments_df.columns:
 
 
 # Compute segment durations
+def get_route_durations(segments_df: pd.DataFrame):
+    """Model flat and descending segment durations from the route geometry."""
+    if speed_model == "constant":
+        return None
+    return compute_route_durations(df, segments_df, rider_stats=rider_stats)
+
+
 def compute_durations(segments_df: pd.DataFrame) -> pd.DataFrame:
-    segments_df["duration (s)"] = segments_df.apply(
-        apply_duration,
-        axis=1,
+    segments_df["duration (s)"] = compute_durations_batch(
+        segments_df,
         rider_stats=rider_stats,
         average_speed_down=average_speed_down,
         average_speed_flat=average_speed_flat,
+        route_durations=get_route_durations(segments_df),
     ).round(0)
 
     return segments_df
@@ -172,21 +207,176 @@ if "segments_df_edited" in st.session_state:
 
 st.session_state.segments_df = compute_durations(segments_df=segments_df)
 
+
+# Solve the power plan for a target time
+@st.fragment
+def target_time_solver(segments_df: pd.DataFrame) -> None:
+    """Show the target time solver, its inputs only rerun the solver."""
+    with st.expander("🎯 Solve for target time"):
+        segment_names = segments_df["segment"].tolist()
+        col1, col2, col3 = st.columns(3)
+        target_range = col1.select_slider(
+            "Segments",
+            options=segment_names,
+            value=(segment_names[0], segment_names[-1]),
+        )
+        start_segment = segment_names.index(target_range[0])
+        end_segment = segment_names.index(target_range[1])
+        current_time = segments_df["duration (s)"].iloc[start_segment : end_segment + 1]
+        target_time_min = col2.number_input(
+            "Target time (min)",
+            value=round(current_time.sum() / 60, 1),
+            step=0.5,
+            format="%.1f",
+            help=f"Current time: {format_duration(current_time.sum())}",
+        )
+        solve_mode = col3.radio(
+            "Adjust",
+            options=["scale", "climb"],
+            format_func=lambda mode: {
+                "scale": "Scale all power",
+                "climb": "Uniform climbing power",
+            }[mode],
+        )
+        if st.button("Solve for target time"):
+            try:
+                solution, relative_power = solve_for_target_time(
+                    segments_df,
+                    target_time_s=target_time_min * 60,
+                    rider_stats=rider_stats,
+                    average_speed_down=average_speed_down,
+                    average_speed_flat=average_speed_flat,
+                    start_segment=start_segment,
+                    end_segment=end_segment,
+                    mode=solve_mode,
+                    df=df if speed_model == "route geometry" else None,
+                )
+            except ValueError as error:
+                st.warning(f"Error: {error}", icon="⚠️")
+            else:
+                segments_df = segments_df.copy()
+                segments_df["relative power (w/kg)"] = relative_power
+                st.session_state.segments_df_edited = compute_durations(segments_df)
+                st.session_state.target_time_solution = (solve_mode, solution)
+                st.rerun()
+
+        if "target_time_solution" in st.session_state:
+            solve_mode, solution = st.session_state.target_time_solution
+            if solve_mode == "scale":
+                st.caption(f"Power scaled by a factor {solution:.3f}")
+            else:
+                st.caption(f"Climbing power set to {solution:.2f} W/kg")
+
+
+target_time_solver(segments_df=segments_df)
+
 search = st.button("Recompute durations", on_click=force_compute_durations)
-st.session_state.segments_df_edited = st.data_editor(
+segments_df_edited = st.data_editor(
     st.session_state.segments_df,
     height=800,
     use_container_width=True,
     num_rows="dynamic",
 )
 
-
-# Download button for dataframe
-excel_download_button(
-    df=segments_df,
-    label="Download",
-    filename=f"stage_{selected_stage}_segments",
+# Recompute statistics of added or edited segments from their start and end points
+invalid_segments = check_segment_boundaries(segments_df_edited, range_statistics)
+if invalid_segments.any():
+    st.warning(
+        "Error: "
+        + ", ".join(segments_df_edited.loc[invalid_segments, "segment"].astype(str))
+        + " start or end outside the route or end before they start, their "
+        "statistics are not updated",
+        icon="⚠️",
+    )
+st.session_state.segments_df_edited = update_segment_statistics(
+    segments_df_edited,
+    range_statistics=range_statistics,
+    previous_df=st.session_state.segments_df,
 )
+if not st.session_state.segments_df_edited.equals(segments_df_edited):
+    st.rerun()
+
+
+# Rank segments by the time saved for more power, less drag or less mass
+@st.fragment
+def marginal_gains(segments_df: pd.DataFrame) -> None:
+    """Show the time saved per segment, its inputs only rerun this section."""
+    with st.expander("💡 Marginal gains"):
+        col1, col2, col3, col4 = st.columns(4)
+        delta_power = col1.number_input("Power change (W)", value=10.0, step=1.0)
+        delta_cda = col2.number_input(
+            "CdA change", value=-0.01, step=0.005, format="%.3f"
+        )
+        delta_mass = col3.number_input("Mass change (kg)", value=-1.0, step=0.5)
+        rank_by = col4.radio(
+            "Rank by", options=["power", "CdA", "mass"], horizontal=True
+        )
+
+        sensitivity_df = compute_sensitivities(
+            segments_df,
+            rider_stats=rider_stats,
+            delta_power=delta_power,
+            delta_cda=delta_cda,
+            delta_mass=delta_mass,
+            df=df if speed_model == "route geometry" else None,
+        )
+        time_saved_columns = dict(
+            zip(["power", "CdA", "mass"], sensitivity_df.columns[-3:])
+        )
+        column = time_saved_columns[rank_by]
+        st.dataframe(
+            sensitivity_df.sort_values(column, ascending=False),
+            height=400,
+            use_container_width=True,
+            hide_index=True,
+        )
+        st.plotly_chart(
+            plot_marginal_gains(df, sensitivity_df=sensitivity_df, column=column),
+            use_container_width=True,
+        )
+
+
+marginal_gains(segments_df=st.session_state.segments_df_edited)
+
+strategy_parameters = {
+    "semi_draft_point": semi_draft_point,
+    "full_draft_point": full_draft_point,
+    "rider_stats": rider_stats,
+    "average_speed_flat": average_speed_flat,
+    "average_speed_down": average_speed_down,
+    "speed_model": speed_model,
+    "segmentation_method": st.session_state.get("segmentation_method"),
+    "window_size_km": st.session_state.get("window_size_km"),
+}
+save_scenario_form(
+    stage=selected_stage,
+    segments_df=st.session_state.segments_df_edited,
+    key="segment_analysis_scenario",
+    parameters=strategy_parameters,
+)
+
+# Download buttons for dataframe and gpx with segment waypoints for head units
+col1, col2 = st.columns(2)
+with col1:
+    excel_download_button(
+        df=segments_df,
+        label="Download",
+        filename=f"stage_{selected_stage}_segments",
+    )
+with col2:
+    gpx_download_button(
+        df=df,
+        segments_df=segments_df,
+        label="Download gpx",
+        filename=f"stage_{selected_stage}_segments",
+        weight_rider=rider_stats["weight_rider"],
+    )
+
+# Plot elevation with segments
+with segment_container:
+    st.plotly_chart(
+        get_segments_figure(df=df, segments=segments), use_container_width=True
+    )
 
 # Save data to session state
 st.session_state.segments = segments
@@ -194,3 +384,5 @@ st.session_state.segments_df = segments_df
 st.session_state.rider_stats = rider_stats
 st.session_state.average_speed_flat = average_speed_flat
 st.session_state.average_speed_down = average_speed_down
+st.session_state.speed_model = speed_model
+st.session_state.strategy_parameters = strategy_parameters
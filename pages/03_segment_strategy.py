@@ -3,8 +3,18 @@
 import streamlit as st
 
 from src.compute_segments_analytics import compute_glycogen_level
-from src.plotting import plot_segments
-from src.utils import excel_download_button, set_page_config
+from src.simulate_route import (
+    compute_km_arrival_times,
+    compute_segment_arrival_times,
+    integrate_route,
+)
+from src.utils import (
+    excel_download_button,
+    format_duration,
+    get_segments_figure,
+    save_scenario_form,
+    set_page_config,
+)
 
 set_page_config()
 
@@ -24,6 +34,9 @@ if "segments_df" in st.session_state:
 if "segments" in st.session_state:
     segments = st.session_state.segments
 
+if "rider_stats" in st.session_state:
+    rider_stats = st.session_state.rider_stats
+
 
 # Define sidebar
 with st.sidebar:
@@ -32,6 +45,12 @@ with st.sidebar:
         "Temperature (°C)", value=27.0, step=0.1, format="%.1f"
     )
     humidity = st.number_input("Humidity (%)", value=80, step=1)
+    point_level_physics = st.toggle(
+        "Point-level physics",
+        value=False,
+        help="Integrate speed and time at every route point using its gradient "
+        "and the air density for the given conditions.",
+    )
 
     st.image(
         "assets/logo.png",
@@ -39,15 +58,52 @@ with st.sidebar:
     )
 
 
-# Plot elevation with segments
-segment_fig = plot_segments(df=df, segments=segments)
-st.plotly_chart(segment_fig, use_container_width=True)
+# Reserve space for the elevation plot, it is drawn after the tables
+segment_container = st.container()
 
 # Compute glycogen levels
 segments_df = compute_glycogen_level(segments_df, glycogen_start_level=100)
 
+# Integrate speed and time at every route point
+if point_level_physics:
+    route_times = integrate_route(
+        df=df,
+        segments_df=segments_df,
+        rider_stats=rider_stats,
+        temperature=temperature,
+        humidity=humidity,
+    )
+    segment_times_df = compute_segment_arrival_times(
+        route_times=route_times, segments_df=segments_df
+    )
+    col1, col2 = st.columns(2)
+    col1.metric(
+        label="Finish time (point-level physics)",
+        value=f"⏱️ {format_duration(route_times['time (s)'].iloc[-1])}",
+    )
+    col2.metric(
+        label="Finish time (segment model)",
+        value=f"⏱️ {format_duration(segments_df['duration (s)'].sum())}",
+    )
+    col1, col2 = st.columns(2)
+    col1.caption("⏱️ Arrival times at segment boundaries")
+    col1.dataframe(segment_times_df, height=400, use_container_width=True)
+    col2.caption("⏱️ Arrival times per km")
+    col2.dataframe(
+        compute_km_arrival_times(route_times=route_times),
+        height=400,
+        use_container_width=True,
+    )
+
 # Display data
 segments_df = st.data_editor(segments_df, height=1000, use_container_width=True)
+save_scenario_form(
+    stage=selected_stage,
+    segments_df=segments_df,
+    key="segment_strategy_scenario",
+    parameters=st.session_state.get("strategy_parameters"),
+)
+
 # Download button for dataframe
 excel_download_button(
     df=segments_df,
@@ -55,5 +111,12 @@ excel_download_button(
     filename=f"stage_{selected_stage}_segments",
 )
 
+# Plot elevation with segments
+with segment_container:
+    st.plotly_chart(
+        get_segments_figure(df=df, segments=segments), use_container_width=True
+    )
+
 # Save data to session state
 st.session_state.segments_df = segments_df
+st.session_state.conditions = {"temperature": temperature, "humidity": humidity}
@@ -2,8 +2,9 @@
 
 import streamlit as st
 
-from src.plotting import combine_plots
-from src.utils import get_session_state, set_page_config
+from src.glycogen_model import CRITICAL_POWER_WKG, W_PRIME_JKG, compute_route_glycogen
+from src.simulate_route import integrate_route
+from src.utils import get_combined_figure, get_session_state, set_page_config
 
 set_page_config()
 
@@ -21,8 +22,63 @@ if "segments" in st.session_state:
 # Get or set variables
 session_state = get_session_state()
 
+# Define sidebar
+with st.sidebar:
+    st.header("Glycogen model", divider="grey")
+    glycogen_model = st.radio(
+        "Model",
+        options=["Segment model", "W′ balance"],
+        help="The W′ balance model depletes above critical power and recovers "
+        "exponentially below it, at every route point over time.",
+    )
+    critical_power_wkg = st.number_input(
+        "Critical power (W/kg)",
+        value=CRITICAL_POWER_WKG,
+        step=0.1,
+        disabled=glycogen_model != "W′ balance",
+    )
+    w_prime_jkg = st.number_input(
+        "W′ (J/kg)",
+        value=W_PRIME_JKG,
+        step=10.0,
+        disabled=glycogen_model != "W′ balance",
+    )
+
+    st.image(
+        "assets/logo.png",
+        use_column_width=True,
+    )
+
+# Compute the glycogen level at every route point over time
+glycogen_df = None
+if glycogen_model == "W′ balance":
+    rider_stats = st.session_state.rider_stats
+    route_times = integrate_route(
+        df=df,
+        segments_df=segments_df,
+        rider_stats=rider_stats,
+        **st.session_state.get("conditions", {}),
+    )
+    glycogen_df = compute_route_glycogen(
+        route_times=route_times,
+        rider_stats=rider_stats,
+        critical_power_wkg=critical_power_wkg,
+        w_prime_jkg=w_prime_jkg,
+    )
+    col1, col2 = st.columns(2)
+    col1.metric(
+        label="Final glycogen level",
+        value=f"🔋 {glycogen_df['glycogen level (%)'].iloc[-1]:.0f}%",
+    )
+    col2.metric(
+        label="Minimum glycogen level",
+        value=f"🪫 {glycogen_df['glycogen level (%)'].min():.0f}%",
+    )
+
 # Plot elevation with segments
-combined_fig = combine_plots(df=df, segments=segments, segments_df=segments_df)
+combined_fig = get_combined_figure(
+    df=df, segments=segments, segments_df=segments_df, glycogen_df=glycogen_df
+)
 st.plotly_chart(combined_fig, use_container_width=True)
 
 
@@ -0,0 +1,80 @@
+"""Code for the Scenario Comparison page of the app."""
+
+import streamlit as st
+
+from src.plotting import plot_scenario_comparison
+from src.utils import (
+    excel_download_button,
+    format_duration,
+    get_scenario_store,
+    set_page_config,
+)
+
+set_page_config()
+
+st.markdown("# Scenario Comparison")
+
+# Get or set variables
+if "selected_stage" in st.session_state:
+    selected_stage = st.session_state.selected_stage
+else:
+    st.warning("Error: start analysis from stage selection", icon="⚠️")
+
+scenario_store = get_scenario_store()
+scenario_names = scenario_store.names(selected_stage)
+
+# Define sidebar
+with st.sidebar:
+    st.header("Scenarios", divider="grey")
+    selected_scenarios = st.multiselect(
+        "Compare", options=scenario_names, default=scenario_names
+    )
+    st.caption(f"💾 Scenario store size: {scenario_store.nbytes() / 1024:.1f} kB")
+    st.image(
+        "assets/logo.png",
+        use_column_width=True,
+    )
+
+if not scenario_names:
+    st.info(
+        "Save strategies as scenarios on the segment analysis and segment strategy "
+        "pages to compare them here.",
+        icon="💾",
+    )
+    st.stop()
+
+# Summary per scenario
+summary_df = scenario_store.summarize(selected_stage, names=selected_scenarios)
+if "total duration (s)" in summary_df.columns:
+    summary_df["total duration"] = summary_df["total duration (s)"].apply(
+        format_duration
+    )
+st.dataframe(summary_df, use_container_width=True, hide_index=True)
+
+# Plot scenarios
+comparison_fig = plot_scenario_comparison(
+    {name: scenario_store.view(selected_stage, name) for name in selected_scenarios}
+)
+st.plotly_chart(comparison_fig, use_container_width=True)
+
+# Side-by-side segment comparison
+comparison_df = scenario_store.compare(selected_stage, names=selected_scenarios)
+st.caption(f"💾 Side-by-side comparison of {len(selected_scenarios)} scenarios")
+st.dataframe(comparison_df, height=800, use_container_width=True)
+
+col1, col2 = st.columns([3, 1], vertical_alignment="bottom")
+scenario_to_load = col1.selectbox("Scenario", options=scenario_names)
+if col2.button("📂 Load scenario", use_container_width=True):
+    st.session_state.segments_df = scenario_store.load(selected_stage, scenario_to_load)
+    st.session_state.segments_df_edited = st.session_state.segments_df
+    st.toast(f"Loaded {scenario_to_load} as the current strategy")
+if col2.button("🗑️ Delete scenario", use_container_width=True):
+    scenario_store.delete(selected_stage, scenario_to_load)
+    st.rerun()
+
+# Download button for dataframe
+excel_download_button(
+    df=comparison_df,
+    label="Download comparison",
+    filename=f"stage_{selected_stage}_scenarios",
+)
@@ -0,0 +1,119 @@
+"""Code for the Climb Catalog page of the app."""
+
+import streamlit as st
+
+from src.utils import (
+    excel_download_button,
+    get_climb_catalog,
+    get_segments,
+    load_stage,
+    set_page_config,
+)
+
+set_page_config()
+
+st.markdown("# Climb Catalog")
+
+# Get or set variables
+climb_catalog = get_climb_catalog()
+stage_list = [f"stage-{i}" for i in range(1, 22)]
+
+if "window_size_km" in st.session_state:
+    window_size_km = st.session_state.window_size_km
+else:
+    window_size_km = 2.0
+
+if "min_slope_diff" in st.session_state:
+    min_slope_diff = st.session_state.min_slope_diff
+else:
+    min_slope_diff = 1.5
+
+if "segmentation_method" in st.session_state:
+    segmentation_method = st.session_state.segmentation_method
+else:
+    segmentation_method = "peaks and valleys"
+
+if "segment_penalty" in st.session_state:
+    segment_penalty = st.session_state.segment_penalty
+else:
+    segment_penalty = 10000.0
+
+# Define sidebar
+with st.sidebar:
+    st.header("🔎 Climb filters", divider="grey")
+    min_length_km = st.number_input("Minimum length (km)", value=0.0, step=0.5)
+    min_slope = st.number_input("Minimum average slope (%)", value=2.0, step=0.5)
+    min_sustained_slope = st.number_input(
+        "Minimum max sustained slope (%)", value=0.0, step=0.5
+    )
+    within_last_km = st.number_input(
+        "Within last km of stage",
+        value=0.0,
+        step=5.0,
+        help="Only climbs that start within this distance of the finish, 0 for all.",
+    )
+    selected_stages = st.multiselect("Stages", options=climb_catalog.stages())
+    sort_by = st.selectbox(
+        "Sort by",
+        options=[
+            "average slope (%)",
+            "max sustained slope (%)",
+            "length (km)",
+            "elevation gain (m)",
+            "km to finish",
+            "summit elevation (m)",
+        ],
+    )
+    ascending = st.toggle("Ascending", value=False)
+    st.image(
+        "assets/logo.png",
+        use_column_width=True,
+    )
+
+# Ingest stages that are not in the catalog yet
+missing_stages = [stage for stage in stage_list if stage not in climb_catalog.stages()]
+if missing_stages and st.button(
+    f"Ingest {len(missing_stages)} remaining stages",
+    help="Segments every stage that is not in the catalog yet with the current "
+    "segment model parameters.",
+):
+    progress_bar = st.progress(0.0)
+    for i, stage in enumerate(missing_stages):
+        progress_bar.progress(i / len(missing_stages), text=f"Ingesting {stage}")
+        stage_df = load_stage(stage)
+        _, stage_segments_df = get_segments(
+            df=stage_df,
+            segmentation_method=segmentation_method,
+            window_size_km=window_size_km,
+            min_slope_diff=min_slope_diff,
+            segment_penalty=segment_penalty,
+        )
+        climb_catalog.add_stage(stage=stage, df=stage_df, segments_df=stage_segments_df)
+    progress_bar.empty()
+    st.rerun()
+
+# Query the catalog
+climbs_df = climb_catalog.query(
+    min_length_km=min_length_km,
+    min_slope=min_slope,
+    min_sustained_slope=min_sustained_slope,
+    within_last_km=within_last_km or None,
+    stages=selected_stages or None,
+    sort_by=sort_by,
+    ascending=ascending,
+)
+
+col1, col2, col3 = st.columns(3)
+col1.metric(label="Ingested stages", value=f"🗺️ {len(climb_catalog.stages())}")
+col2.metric(label="Climbs in catalog", value=f"⛰️ {len(climb_catalog)}")
+col3.metric(label="Matching climbs", value=f"🔎 {len(climbs_df)}")
+
+st.caption(f"💾 Dataframe with {len(climbs_df)} climbs")
+st.dataframe(climbs_df, height=800, use_container_width=True, hide_index=True)
+
+# Download button for dataframe
+excel_download_button(
+    df=climbs_df,
+    label="Download climbs",
+    filename="climb_catalog",
+)
@@ -0,0 +1,281 @@
+"""Code for the Team Roster page of the app."""
+
+import io
+
+import pandas as pd
+import streamlit as st
+
+from src.compute_segments_analytics import define_drafting_decisions
+from src.gpx_export import export_team_gpx
+from src.plotting import plot_roster_glycogen
+from src.roster import (
+    create_roster,
+    evaluate_roster,
+    evaluate_roster_tour,
+    plan_roster_segments,
+)
+from src.utils import (
+    excel_download_button,
+    format_duration,
+    get_results_store,
+    get_roster_route_durations,
+    get_segments,
+    load_stage,
+    set_page_config,
+)
+
+set_page_config()
+
+st.markdown("# Team Roster")
+
+# Get or set variables
+if "selected_stage" in st.session_state:
+    selected_stage = st.session_state.selected_stage
+
+if "df" in st.session_state:
+    df = st.session_state.df
+
+if "segments_df" in st.session_state:
+    segments_df = st.session_state.segments_df
+else:
+    st.warning("Error: start analysis from segment generation", icon="⚠️")
+
+if "roster_df" in st.session_state:
+    roster_df = st.session_state.roster_df
+else:
+    roster_df = pd.DataFrame(
+        {
+            "name": [f"rider {i}" for i in range(1, 9)],
+            "weight_rider": [58.0, 62.0, 65.0, 68.0, 70.0, 72.0, 75.0, 80.0],
+            "cda_full": [0.25, 0.255, 0.2625, 0.27, 0.275, 0.28, 0.29, 0.3],
+            "cda_semi": [0.29, 0.295, 0.305, 0.31, 0.315, 0.32, 0.33, 0.345],
+            "cda_none": [0.33, 0.34, 0.35, 0.355, 0.36, 0.37, 0.38, 0.395],
+            "relative_power_climb": [6.0, 5.8, 5.5, 5.3, 5.2, 5.0, 4.8, 4.5],
+            "relative_power_flat": [3.0] * 8,
+            "relative_power_descend": [1.5] * 8,
+        }
+    )
+
+if "average_speed_flat" in st.session_state:
+    average_speed_flat = st.session_state.average_speed_flat
+else:
+    average_speed_flat = 45.0
+
+if "average_speed_down" in st.session_state:
+    average_speed_down = st.session_state.average_speed_down
+else:
+    average_speed_down = 60.0
+
+if "speed_model" in st.session_state:
+    speed_model = st.session_state.speed_model
+else:
+    speed_model = "constant"
+
+if "window_size_km" in st.session_state:
+    window_size_km = st.session_state.window_size_km
+else:
+    window_size_km = 2.0
+
+if "min_slope_diff" in st.session_state:
+    min_slope_diff = st.session_state.min_slope_diff
+else:
+    min_slope_diff = 1.5
+
+if "segmentation_method" in st.session_state:
+    segmentation_method = st.session_state.segmentation_method
+else:
+    segmentation_method = "peaks and valleys"
+
+if "segment_penalty" in st.session_state:
+    segment_penalty = st.session_state.segment_penalty
+else:
+    segment_penalty = 10000.0
+
+# Define sidebar
+with st.sidebar:
+    st.header("Drafting strategy", divider="grey")
+    semi_draft_point = st.number_input("Semi draft point", value=0.6, step=0.1)
+    full_draft_point = st.number_input("Full draft point", value=0.9, step=0.1)
+    st.image(
+        "assets/logo.png",
+        use_column_width=True,
+    )
+
+# Edit roster
+st.caption("🚴 Roster with rider weight, CdA per drafting mode and power (W/kg)")
+roster_df = st.data_editor(
+    roster_df, use_container_width=True, num_rows="dynamic", hide_index=True
+)
+try:
+    roster = create_roster(roster_df.dropna())
+except ValueError as error:
+    st.warning(f"Error: {error}", icon="⚠️")
+    st.stop()
+
+
+def get_route_durations(stage_df, segments_df):
+    """Model the flat and descending segment durations of every rider."""
+    if speed_model == "constant":
+        return None
+    return get_roster_route_durations(stage_df, roster, segments_df)
+
+
+# Evaluate all riders on all segments of the stage
+if "drafting" not in segments_df.columns:
+    segments_df, _, _ = define_drafting_decisions(
+        segments_df,
+        semi_draft_point=semi_draft_point,
+        full_draft_point=full_draft_point,
+    )
+durations_df, glycogen_df = evaluate_roster(
+    roster,
+    segments_df,
+    average_speed_down=average_speed_down,
+    average_speed_flat=average_speed_flat,
+    route_durations=get_route_durations(df, segments_df),
+)
+
+summary_df = pd.DataFrame(
+    {
+        "duration (s)": durations_df.sum(axis=1).round(0),
+        "final glycogen level (%)": glycogen_df.iloc[:, -1],
+        "min glycogen level (%)": glycogen_df.min(axis=1),
+    }
+)
+summary_df.insert(1, "duration", summary_df["duration (s)"].apply(format_duration))
+summary_df["gap (s)"] = summary_df["duration (s)"] - summary_df["duration (s)"].min()
+
+st.header(f"📍 {selected_stage}", divider="grey")
+st.dataframe(summary_df.sort_values("duration (s)"), use_container_width=True)
+
+roster_fig = plot_roster_glycogen(glycogen_df=glycogen_df, segments_df=segments_df)
+st.plotly_chart(roster_fig, use_container_width=True)
+
+st.caption("⏱️ Duration (s) per rider and segment")
+st.dataframe(durations_df.round(0), use_container_width=True)
+
+# Evaluate all riders on all stages of the tour
+st.header("🗺️ Full tour", divider="grey")
+if st.button("Evaluate full tour"):
+    stages = {}
+    progress_bar = st.progress(0.0)
+    for i in range(1, 22):
+        stage = f"stage-{i}"
+        progress_bar.progress((i - 1) / 21, text=f"Loading {stage}")
+        _, stage_segments_df = get_segments(
+            df=load_stage(stage),
+            segmentation_method=segmentation_method,
+            window_size_km=window_size_km,
+            min_slope_diff=min_slope_diff,
+            segment_penalty=segment_penalty,
+        )
+        stages[stage], _, _ = define_drafting_decisions(
+            stage_segments_df,
+            semi_draft_point=semi_draft_point,
+            full_draft_point=full_draft_point,
+        )
+    progress_bar.empty()
+    st.session_state.roster_tour_stages = stages
+
+if "roster_tour_stages" in st.session_state:
+    tour_route_durations = None
+    if speed_model != "constant":
+        tour_route_durations = {
+            stage: get_route_durations(load_stage(stage), stage_segments_df)
+            for stage, stage_segments_df in st.session_state.roster_tour_stages.items()
+        }
+    tour_df = evaluate_roster_tour(
+        roster,
+        st.session_state.roster_tour_stages,
+        average_speed_down=average_speed_down,
+        average_speed_flat=average_speed_flat,
+        route_durations=tour_route_durations,
+    )
+    tour_durations_df = tour_df.pivot(
+        index="rider", columns="stage", values="duration (s)"
+    )[list(st.session_state.roster_tour_stages)]
+    tour_durations_df.insert(0, "total (s)", tour_durations_df.sum(axis=1).round(0))
+    tour_durations_df.insert(
+        0, "total", tour_durations_df["total (s)"].apply(format_duration)
+    )
+    st.dataframe(
+        tour_durations_df.sort_values("total (s)").round(0), use_container_width=True
+    )
+
+    # Download button for dataframe
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        excel_download_button(
+            df=tour_df,
+            label="Download tour evaluation",
+            filename="roster_tour",
+        )
+    if col2.button("💾 Save tour evaluation to results store"):
+        roster_by_name = roster_df.dropna().set_index("name")
+        with get_results_store().batch() as results_store:
+            for row in tour_df.to_dict("records"):
+                rider = roster_by_name.loc[row["rider"]]
+                results_store.save_strategy(
+                    stage=row["stage"],
+                    name="roster tour",
+                    segments_df=st.session_state.roster_tour_stages[row["stage"]],
+                    rider=row["rider"],
+                    parameters={
+                        "semi_draft_point": semi_draft_point,
+                        "full_draft_point": full_draft_point,
+                        "rider_stats": {
+                            "weight_rider": rider["weight_rider"],
+                            "cda_values": {
+                                "full": rider["cda_full"],
+                                "semi": rider["cda_semi"],
+                                "none": rider["cda_none"],
+                            },
+                        },
+                        "relative_power_climb": rider["relative_power_climb"],
+                        "relative_power_flat": rider["relative_power_flat"],
+                        "relative_power_descend": rider["relative_power_descend"],
+                        "average_speed_flat": average_speed_flat,
+                        "average_speed_down": average_speed_down,
+                        "speed_model": speed_model,
+                    },
+                    finish_time_s=row["duration (s)"],
+                    final_glycogen_level=row["final glycogen level (%)"],
+                    min_glycogen_level=row["min glycogen level (%)"],
+                    store_segments=False,
+                )
+        st.toast(f"Saved {len(tour_df)} stage results")
+
+    # Export every stage with the segment plan of every rider for their head units
+    if col3.button("🗺️ Export gpx files for the team"):
+        stages = st.session_state.roster_tour_stages
+        gpx_zip = io.BytesIO()
+        with st.spinner(f"Writing {len(stages) * len(roster)} gpx files"):
+            export_team_gpx(
+                gpx_zip,
+                stages={stage: load_stage(stage) for stage in stages},
+                rider_plans={
+                    stage: plan_roster_segments(
+                        roster,
+                        stage_segments_df,
+                        average_speed_down=average_speed_down,
+                        average_speed_flat=average_speed_flat,
+                        route_durations=(
+                            None
+                            if tour_route_durations is None
+                            else tour_route_durations[stage]
+                        ),
+                    )
+                    for stage, stage_segments_df in stages.items()
+                },
+            )
+        st.session_state.roster_gpx_zip = gpx_zip.getvalue()
+    if "roster_gpx_zip" in st.session_state:
+        col3.download_button(
+            label="Download gpx files",
+            data=st.session_state.roster_gpx_zip,
+            file_name="roster_tour_gpx.zip",
+            mime="application/zip",
+        )
+
+# Save data to session state
+st.session_state.roster_df = roster_df
@@ -0,0 +1,100 @@
+"""Code for the Results Store page of the app."""
+
+import streamlit as st
+
+from src.generate_segments import segments_from_dataframe
+from src.utils import (
+    excel_download_button,
+    format_duration,
+    get_range_statistics,
+    get_results_store,
+    get_route_index,
+    load_stored_route,
+    set_page_config,
+)
+
+set_page_config()
+
+st.markdown("# Results Store")
+
+# Get or set variables
+results_store = get_results_store()
+riders = results_store.riders()
+
+# Define sidebar
+with st.sidebar:
+    st.header("Filters", divider="grey")
+    stage_list = [f"stage-{i}" for i in range(1, 22)]
+    stage = st.selectbox("Stage", options=["all"] + stage_list + ["custom gpx"])
+    filter_semi_draft_point = st.toggle("Filter on semi draft point", value=False)
+    semi_draft_point = st.number_input(
+        "Semi draft point",
+        value=0.6,
+        step=0.1,
+        disabled=not filter_semi_draft_point,
+    )
+    st.image(
+        "assets/logo.png",
+        use_column_width=True,
+    )
+
+if not riders:
+    st.info(
+        "Save strategies on the segment analysis, segment strategy or team roster "
+        "pages to store them here.",
+        icon="💾",
+    )
+    st.stop()
+
+# Best finish time per stage of a rider
+st.header("🏆 Best finish time per stage", divider="grey")
+rider = st.selectbox("Rider", options=riders)
+best_df = results_store.best_finish_times(rider)
+best_df.insert(2, "finish time", best_df["finish_time_s"].apply(format_duration))
+st.dataframe(best_df, use_container_width=True, hide_index=True)
+
+# Strategies matching the filters
+st.header("🔎 Strategies", divider="grey")
+strategies_df = results_store.find_strategies(
+    stage=None if stage == "all" else stage,
+    semi_draft_point=semi_draft_point if filter_semi_draft_point else None,
+)
+st.caption(f"💾 {len(strategies_df)} stored strategies")
+st.dataframe(strategies_df, use_container_width=True, hide_index=True)
+excel_download_button(
+    df=strategies_df, label="Download strategies", filename="strategies"
+)
+
+# Re-open a stored strategy, loading its route and segments from the store
+st.header("📂 Open strategy", divider="grey")
+with_segments_df = strategies_df[strategies_df["route_id"].notna()]
+if with_segments_df.empty:
+    st.stop()
+
+strategy_id = st.selectbox(
+    "Strategy",
+    options=with_segments_df["strategy_id"],
+    format_func=lambda strategy_id: " | ".join(
+        with_segments_df.loc[
+            with_segments_df["strategy_id"] == strategy_id, ["stage", "rider", "name"]
+        ].iloc[0]
+    ),
+)
+if st.button("Open strategy"):
+    strategy, segments_df = results_store.load_strategy(strategy_id)
+    df = load_stored_route(strategy["route_id"])
+    if df is None or segments_df is None:
+        st.warning("Error: route or segments of the strategy are not stored", icon="⚠️")
+    else:
+        st.session_state.selected_stage = strategy["stage"]
+        st.session_state.df = df
+        st.session_state.route_index = get_route_index(df)
+        st.session_state.range_statistics = get_range_statistics(df)
+        st.session_state.segments = segments_from_dataframe(df, segments_df)
+        st.session_state.segments_df = segments_df
+        st.session_state.segments_df_edited = segments_df
+        if "rider_stats" in strategy["parameters"]:
+            st.session_state.rider_stats = strategy["parameters"]["rider_stats"]
+        st.session_state.rider_name = strategy["rider"]
+        st.toast(f"Opened {strategy['name']} for {strategy['stage']}")
+        st.switch_page("pages/02_segment_analysis.py")
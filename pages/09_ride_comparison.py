@@ -0,0 +1,103 @@
+"""Code for the Ride Comparison page of the app."""
+
+import streamlit as st
+
+from src.glycogen_model import CRITICAL_POWER_WKG, W_PRIME_JKG
+from src.plotting import plot_ride_comparison
+from src.ride_ingest import summarize_team_rides
+from src.utils import (
+    excel_download_button,
+    format_duration,
+    get_ride_comparisons,
+    set_page_config,
+)
+
+set_page_config()
+
+st.markdown("# Ride Comparison")
+
+# Get or set variables
+if "selected_stage" in st.session_state:
+    selected_stage = st.session_state.selected_stage
+
+if "segments_df" in st.session_state and "duration (s)" in (
+    st.session_state.segments_df.columns
+):
+    segments_df = st.session_state.segments_df
+    rider_stats = st.session_state.rider_stats
+else:
+    st.warning("Error: plan the durations on segment analysis first", icon="⚠️")
+    st.stop()
+
+# Define sidebar
+with st.sidebar:
+    st.header("Alignment", divider="grey")
+    match_distance = st.toggle(
+        "Match the planned distance",
+        value=True,
+        help="Scale the recorded distance to the planned route distance. Turn off "
+        "for rides that did not finish the route.",
+    )
+    st.header("Glycogen model", divider="grey")
+    critical_power_wkg = st.number_input(
+        "Critical power (W/kg)", value=CRITICAL_POWER_WKG, step=0.1
+    )
+    w_prime_jkg = st.number_input("W′ (J/kg)", value=W_PRIME_JKG, step=10.0)
+    st.image(
+        "assets/logo.png",
+        use_column_width=True,
+    )
+
+# Upload the recorded rides of the team
+uploaded_files = st.file_uploader(
+    "Recorded rides (gpx with time and power, or csv)",
+    type=["gpx", "csv"],
+    accept_multiple_files=True,
+)
+if not uploaded_files:
+    st.info(
+        "Upload the recorded rides of the team to compare them with the plan.",
+        icon="📂",
+    )
+    st.stop()
+
+with st.spinner("Reading rides"):
+    comparisons = get_ride_comparisons(
+        rides={file.name: file.getvalue() for file in uploaded_files},
+        segments_df=segments_df,
+        rider_stats=rider_stats,
+        match_distance=match_distance,
+        critical_power_wkg=critical_power_wkg,
+        w_prime_jkg=w_prime_jkg,
+    )
+for name, error in comparisons.items():
+    if isinstance(error, str):
+        st.error(f"{name}: {error}", icon="🚨")
+comparisons = {
+    name: comparison_df
+    for name, comparison_df in comparisons.items()
+    if not isinstance(comparison_df, str)
+}
+if not comparisons:
+    st.stop()
+
+# Actual against planned time, power and glycogen per rider
+st.header(f"📍 {selected_stage}", divider="grey")
+summary_df = summarize_team_rides(comparisons)
+for column in ["planned duration (s)", "actual duration (s)"]:
+    summary_df.insert(
+        summary_df.columns.get_loc(column),
+        column.replace(" (s)", ""),
+        summary_df[column].apply(format_duration),
+    )
+st.dataframe(summary_df.round(1), use_container_width=True)
+
+comparison_fig = plot_ride_comparison(comparisons)
+st.plotly_chart(comparison_fig, use_container_width=True)
+
+# Per segment comparison of a rider
+rider = st.selectbox("Rider", options=list(comparisons))
+st.dataframe(comparisons[rider].round(1), use_container_width=True, hide_index=True)
+excel_download_button(
+    df=comparisons[rider], label="Download comparison", filename=f"{rider} comparison"
+)
@@ -0,0 +1,460 @@
+"""Local HTTP API for the segment analysis pipeline.
+
+Exposes route processing, segmentation, strategy evaluation and glycogen levels as
+JSON endpoints, built on the same `src` functions as the app. The work runs on a
+process or thread worker pool. Results are cached by a hash of the endpoint and
+request body, so repeated requests are lookups and identical concurrent requests
+share one computation. Any POST request can be submitted as a job with `?async=1`
+and polled at `/jobs/<job id>`.
+
+Usage:
+    python -m src.api [--host 127.0.0.1] [--port 8000] [--workers 4]
+        [--executor process]
+
+Endpoints:
+    GET  /health          Status of the service.
+    POST /routes          Process a route, the body is gpx data, {"gpx": "..."} or
+                          {"stage": "stage-1"}. Returns the route id.
+    POST /segments        Segment a route: {"route_id": "...", "method": ...}.
+    POST /strategy        Evaluate a drafting and power strategy on the segments.
+    POST /glycogen        Glycogen level per segment of a strategy.
+    GET  /jobs/<job id>   Status and result of a job.
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from src.compute_segments_analytics import STRATEGY_PARAMETERS, evaluate_strategy
+from src.process_data import (
+    SEGMENTATION_PARAMETERS,
+    STAGE_DIRECTORY,
+    configure_logging,
+    create_dataframe,
+    parse_gpx_file,
+    segment_route,
+)
+
+logger = logging.getLogger(__name__)
+
+# Modules the workers import on start, instead of on their first request
+WORKER_MODULES = ("gpxpy", "scipy.ndimage", "scipy.optimize", "scipy.signal")
+GLYCOGEN_COLUMNS = [
+    "segment",
+    "start point (km)",
+    "end point (km)",
+    "relative power (w/kg)",
+    "glycogen level (%)",
+]
+
+
+class NotFoundError(KeyError):
+    """Raised for unknown routes, stages and jobs."""
+
+
+def process_route(gpx_data: str) -> pd.DataFrame:
+    """Parse and process gpx data into a route dataframe."""
+    try:
+        gpx_file = parse_gpx_file(gpx_data)
+    except Exception as error:
+        raise ValueError(f"Invalid gpx data: {error}") from error
+
+    return create_dataframe(gpx_file=gpx_file)
+
+
+class ResultCache:
+    """Thread-safe LRU cache of futures keyed by a hash of the request."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    def get(self, key: str) -> Future:
+        """Get a cached future, or None."""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self._futures.move_to_end(key)
+            return future
+
+    def get_or_create(self, key: str, create) -> tuple:
+        """Get a cached future or add the one returned by `create()`.
+
+        Failed futures stay in the cache to report their error, but are replaced on
+        the next request, so the request can be retried.
+
+        Returns:
+            tuple: The future and whether it was found in the cache.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not _failed(future):
+                self._futures.move_to_end(key)
+                return future, True
+
+            future = create()
+            self._futures[key] = future
+            self._futures.move_to_end(key)
+            while len(self._futures) > self.max_entries:
+                self._futures.popitem(last=False)
+
+        return future, False
+
+
+class AnalysisService:
+    """Request handling of the API, independent of the HTTP server.
+
+    Every new request runs in its own thread, which hands the heavy computations to
+    the worker pool. A cached request is always owned by a running thread, so
+    requests can wait for each other: chained requests (route -> segments ->
+    strategy -> glycogen) reuse the cached result of every step.
+    """
+
+    def __init__(
+        self, workers: int = 4, executor: str = "process", max_entries: int = 1024
+    ):
+        """Start the worker pool.
+
+        Args:
+            workers: Number of workers of the pool.
+            executor: "process" or "thread" worker pool.
+            max_entries: Maximum number of cached results.
+        """
+        if executor == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, initializer=_import_worker_modules
+            )
+        elif executor == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+        else:
+            raise ValueError(f"Unknown executor: {executor}")
+        self.workers = workers
+        self.executor = executor
+        self.routes = ResultCache(max_entries=64)
+        self.results = ResultCache(max_entries=max_entries)
+        self._handlers = {
+            "segments": self._segments,
+            "strategy": self._strategy,
+            "glycogen": self._glycogen,
+        }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "executor": self.executor,
+            "routes": len(self.routes),
+            "results": len(self.results),
+        }
+
+    def submit(self, endpoint: str, body) -> tuple:
+        """Submit a request, or get it from the cache.
+
+        Args:
+            endpoint: Name of the endpoint.
+            body: Decoded request body.
+
+        Returns:
+            tuple: Job id, future with the JSON result and whether it was cached.
+        """
+        if endpoint == "routes":
+            # The job id of a route is its route id, the hash of the gpx data
+            gpx_data = self._read_route_body(body)
+            job_id = _hash_request(endpoint, gpx_data)
+            self.routes.get_or_create(
+                job_id, lambda: self._pool.submit(process_route, gpx_data)
+            )
+            handler, body = self._summarize_route, job_id
+        elif endpoint in self._handlers:
+            job_id = _hash_request(endpoint, body)
+            handler = self._handlers[endpoint]
+        else:
+            raise NotFoundError(f"Unknown endpoint: {endpoint}")
+
+        future, cached = self.results.get_or_create(job_id, Future)
+        if not cached:
+            threading.Thread(
+                target=_run, args=(future, handler, body), daemon=True
+            ).start()
+        return job_id, future, cached
+
+    def job(self, job_id: str) -> Future:
+        """Get the future of a submitted job."""
+        future = self.results.get(job_id)
+        if future is None:
+            raise NotFoundError(f"Unknown job: {job_id}")
+        return future
+
+    def _read_route_body(self, body) -> str:
+        if isinstance(body, str):
+            return body
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be gpx data or a JSON object")
+        if "gpx" in body:
+            return body["gpx"]
+        stage = str(body.get("stage", ""))
+        path = STAGE_DIRECTORY / f"{stage}-route.gpx"
+        if not re.fullmatch(r"stage-\d+", stage) or not path.exists():
+            raise NotFoundError(f"Unknown stage: {stage}")
+        return path.read_text()
+
+    def _route(self, route_id: str) -> pd.DataFrame:
+        future = self.routes.get(route_id)
+        if future is None:
+            raise NotFoundError(f"Unknown route: {route_id}, post it to /routes first")
+        return future.result()
+
+    def _summarize_route(self, route_id: str) -> dict:
+        df = self._route(route_id)
+        return {
+            "route_id": route_id,
+            "points": len(df),
+            "distance (km)": float(df["distance"].max()),
+            "elevation gain (m)": float(df["elevation_diff"].clip(lower=0).sum()),
+            "min elevation (m)": float(df["elevation"].min()),
+            "max elevation (m)": float(df["elevation"].max()),
+        }
+
+    def _segments(self, body: dict) -> dict:
+        parameters = _parameters(body, SEGMENTATION_PARAMETERS, required=["route_id"])
+        df = self._route(parameters.pop("route_id"))
+        segments_df = self._pool.submit(segment_route, df, **parameters).result()
+        return {"segments": _to_records(segments_df)}
+
+    def _strategy(self, body: dict) -> dict:
+        parameters = _parameters(
+            body,
+            STRATEGY_PARAMETERS,
+            optional=["route_id", "segments", *SEGMENTATION_PARAMETERS],
+        )
+        if "segments" in parameters:
+            segments_df = pd.DataFrame(parameters.pop("segments"))
+        else:
+            # Segment the route through the cache, shared with /segments
+            segments_body = {
+                key: parameters.pop(key)
+                for key in ["route_id", *SEGMENTATION_PARAMETERS]
+                if key in parameters
+            }
+            _, future, _ = self.submit("segments", segments_body)
+            segments_df = pd.DataFrame(future.result()["segments"])
+
+        segments_df = self._pool.submit(
+            evaluate_strategy, segments_df, **parameters
+        ).result()
+        return {
+            "finish time (s)": float(segments_df["duration (s)"].sum()),
+            "final glycogen level (%)": float(
+                segments_df["glycogen level (%)"].iloc[-1]
+            ),
+            "segments": _to_records(segments_df),
+        }
+
+    def _glycogen(self, body: dict) -> dict:
+        _, future, _ = self.submit("strategy", body)
+        segments_df = pd.DataFrame(future.result()["segments"])
+        return {
+            "final glycogen level (%)": float(
+                segments_df["glycogen level (%)"].iloc[-1]
+            ),
+            "min glycogen level (%)": float(segments_df["glycogen level (%)"].min()),
+            "segments": _to_records(segments_df[GLYCOGEN_COLUMNS]),
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """HTTP layer of the API, decodes requests and encodes results as JSON."""
+
+    service = None  # AnalysisService, set by `create_server`
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path.strip("/").split("/")
+        try:
+            if path == ["health"]:
+                self._respond(HTTPStatus.OK, self.service.health())
+            elif len(path) == 2 and path[0] == "jobs":
+                self._respond_job(path[1], self.service.job(path[1]))
+            else:
+                raise NotFoundError(f"Unknown path: {self.path}")
+        except NotFoundError as error:
+            self._respond(HTTPStatus.NOT_FOUND, {"error": error.args[0]})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        try:
+            job_id, future, _ = self.service.submit(
+                url.path.strip("/"), self._read_body()
+            )
+            if parse_qs(url.query).get("async", ["0"])[0] in ("1", "true"):
+                self._respond_job(job_id, future)
+            else:
+                self._respond(HTTPStatus.OK, future.result())
+        except NotFoundError as error:
+            self._respond(HTTPStatus.NOT_FOUND, {"error": error.args[0]})
+        except (ValueError, TypeError, KeyError) as error:
+            self._respond(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+        except Exception as error:
+            logger.exception("Request failed")
+            self._respond(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)})
+
+    def _read_body(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        text = data.decode("utf-8")
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(text or "{}")
+        return text
+
+    def _respond_job(self, job_id: str, future: Future) -> None:
+        if not future.done():
+            self._respond(HTTPStatus.ACCEPTED, {"job_id": job_id, "status": "running"})
+        elif future.exception() is not None:
+            self._respond(
+                HTTPStatus.OK,
+                {
+                    "job_id": job_id,
+                    "status": "failed",
+                    "error": str(future.exception()),
+                },
+            )
+        else:
+            self._respond(
+                HTTPStatus.OK,
+                {"job_id": job_id, "status": "done", "result": future.result()},
+            )
+
+    def _respond(self, status: HTTPStatus, result: dict) -> None:
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+class AnalysisServer(ThreadingHTTPServer):
+    """Threaded HTTP server with a listen backlog for many concurrent clients."""
+
+    daemon_threads = True
+    # The default of 5 drops connections under load, which then wait for a retry
+    request_queue_size = 128
+
+
+def create_server(
+    host: str = "127.0.0.1", port: int = 8000, **service_kwargs
+) -> AnalysisServer:
+    """Create the HTTP server with its analysis service.
+
+    Args:
+        host: Host to listen on.
+        port: Port to listen on, 0 for any free port.
+        **service_kwargs: Arguments of `AnalysisService`.
+
+    Returns:
+        AnalysisServer: Server, start it with `serve_forever()`.
+    """
+    handler = type(
+        "AnalysisRequestHandler",
+        (RequestHandler,),
+        {"service": AnalysisService(**service_kwargs)},
+    )
+    return AnalysisServer((host, port), handler)
+
+
+def _import_worker_modules() -> None:
+    for module in WORKER_MODULES:
+        importlib.import_module(module)
+
+
+def _run(future: Future, handler, body) -> None:
+    """Run a request handler and set its result on the future."""
+    try:
+        future.set_result(handler(body))
+    except Exception as error:
+        future.set_exception(error)
+
+
+def _failed(future: Future) -> bool:
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+
+def _hash_request(endpoint: str, body) -> str:
+    """Hash an endpoint and request body, independent of the order of keys."""
+    data = json.dumps([endpoint, body], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _parameters(
+    body: dict, defaults: dict, required: list = (), optional: list = ()
+) -> dict:
+    """Merge the request body with the default parameters of an endpoint.
+
+    Raises:
+        ValueError: If the body misses a required or has an unknown parameter.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    unknown = set(body) - set(defaults) - set(required) - set(optional)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    missing = set(required) - set(body)
+    if missing:
+        raise ValueError(f"Missing parameters: {', '.join(sorted(missing))}")
+    return {**defaults, **body}
+
+
+def _to_records(df: pd.DataFrame) -> list:
+    """Convert a dataframe to JSON-compatible records, NaN becomes null."""
+    return json.loads(df.to_json(orient="records"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--max-entries", type=int, default=1024)
+    args = parser.parse_args()
+
+    configure_logging()
+    server = create_server(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        executor=args.executor,
+        max_entries=args.max_entries,
+    )
+    logger.info(f"Serving the analysis API on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Code to process long routes in chunks with bounded memory.
+
+Multi-day and ultra-distance routes have millions of points. The chunked pipeline
+streams the gpx file, processes it chunk by chunk and spills the columns to
+memory-mapped files, so memory is bounded by the chunk size instead of the route
+length. Every step gives exactly the same result as processing the whole file with
+`create_dataframe` and `generate_segments`:
+
+- distances continue from the last point of the previous chunk,
+- Gaussian smoothing holds back the points whose kernel reaches into the next chunk
+  and keeps the points its kernel needs from the previous chunk,
+- peaks and valleys are detected per chunk with halo regions around it, which grow
+  where a peak cannot be decided within them,
+- segments are stitched from the peaks and valleys of all chunks.
+"""
+
+import logging
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.generate_segments import PEAK_PROMINENCE, PEAK_WIDTH, build_segments
+from src.process_data import SMOOTHING_SIGMA, compute_route_columns, iter_gpx_points
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    "latitude",
+    "longitude",
+    "elevation",
+    "distance",
+    "elevation_diff",
+    "gradient",
+    "smoothed_elevation",
+]
+BYTES_PER_POINT = 1024  # Parsing and processing memory per point of a chunk
+DEFAULT_MAX_MEMORY_MB = 256
+SMOOTHING_TRUNCATE = 4.0  # Default of `gaussian_filter1d`
+DEFAULT_HALO_POINTS = 2048
+
+
+def chunk_points_for_memory(max_memory_mb: float) -> int:
+    """Get the number of points per chunk that fits in a memory ceiling."""
+    return max(int(max_memory_mb * 2**20 / BYTES_PER_POINT), 1024)
+
+
+def process_gpx_chunked(
+    file,
+    directory=None,
+    max_memory_mb: float = DEFAULT_MAX_MEMORY_MB,
+    chunk_points: int = None,
+) -> pd.DataFrame:
+    """Process a gpx file in chunks into a dataframe backed by memory-mapped files.
+
+    Args:
+        file: Path or file object of the gpx file.
+        directory: Directory for the column files, a new temporary directory if not
+            specified.
+        max_memory_mb: Memory ceiling in MB, sets the number of points per chunk.
+        chunk_points: Number of points per chunk, overrides `max_memory_mb`.
+
+    Returns:
+        pd.DataFrame: Dataframe with gpx data, the same as `create_dataframe`, with
+            read-only columns mapped from the files in `directory`.
+    """
+    if chunk_points is None:
+        chunk_points = chunk_points_for_memory(max_memory_mb)
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="route-")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Processing gpx file in chunks of {chunk_points} points.")
+
+    column_files = {
+        column: open(directory / f"{column}.f8", "wb") for column in COLUMNS
+    }
+    smoother = _ChunkedSmoother()
+    previous_point = None
+    distance_m = 0.0
+    try:
+        for latitude, longitude, elevation in iter_gpx_points(file, chunk_points):
+            if previous_point is None:
+                columns, distance_m = compute_route_columns(
+                    latitude, longitude, elevation
+                )
+            else:
+                # Continue from the last point of the previous chunk
+                columns, distance_m = compute_route_columns(
+                    np.concatenate([[previous_point[0]], latitude]),
+                    np.concatenate([[previous_point[1]], longitude]),
+                    np.concatenate([[previous_point[2]], elevation]),
+                    start_distance_m=distance_m,
+                )
+                columns = {column: values[1:] for column, values in columns.items()}
+            previous_point = (latitude[-1], longitude[-1], elevation[-1])
+
+            for column, values in columns.items():
+                values.tofile(column_files[column])
+            smoother.push(elevation).tofile(column_files["smoothed_elevation"])
+
+        smoother.flush().tofile(column_files["smoothed_elevation"])
+    finally:
+        for column_file in column_files.values():
+            column_file.close()
+
+    df = load_chunked_route(directory)
+    logger.info(f"DataFrame shape: {df.shape}")
+    return df
+
+
+def load_chunked_route(directory) -> pd.DataFrame:
+    """Load a route processed by `process_gpx_chunked` from its column files.
+
+    Returns:
+        pd.DataFrame: Dataframe with gpx data and read-only memory-mapped columns.
+    """
+    directory = Path(directory)
+    columns = {
+        column: np.memmap(directory / f"{column}.f8", dtype=np.float64, mode="r")
+        for column in COLUMNS
+    }
+    return pd.DataFrame(columns, copy=False)
+
+
+def generate_segments_chunked(
+    df: pd.DataFrame,
+    window_size_km: float = 1.0,
+    min_slope_diff: float = 2.0,
+    max_memory_mb: float = DEFAULT_MAX_MEMORY_MB,
+    chunk_points: int = None,
+    halo_points: int = DEFAULT_HALO_POINTS,
+) -> list:
+    """Generate the same segments as `generate_segments`, one chunk at a time.
+
+    Args:
+        df: Dataframe with gpx data, e.g. from `process_gpx_chunked`.
+        window_size_km: Minimum window length to define a segment  in km.
+        min_slope_diff: Minimum slope difference to define a segment in %.
+        max_memory_mb: Memory ceiling in MB, sets the number of points per chunk.
+        chunk_points: Number of points per chunk, overrides `max_memory_mb`.
+        halo_points: Initial number of points around a chunk to detect its peaks.
+
+    Returns:
+        list: list of defined segments.
+    """
+    if chunk_points is None:
+        chunk_points = chunk_points_for_memory(max_memory_mb)
+
+    smoothed_elevation = df["smoothed_elevation"].to_numpy()
+    peaks = find_peaks_chunked(
+        smoothed_elevation, chunk_points=chunk_points, halo_points=halo_points
+    )
+    valleys = find_peaks_chunked(
+        smoothed_elevation,
+        chunk_points=chunk_points,
+        halo_points=halo_points,
+        valleys=True,
+    )
+
+    return build_segments(
+        peaks,
+        valleys,
+        distance=df["distance"].to_numpy(),
+        elevation=df["elevation"].to_numpy(),
+        window_size_km=window_size_km,
+        min_slope_diff=min_slope_diff,
+    )
+
+
+def find_peaks_chunked(
+    values: np.ndarray,
+    chunk_points: int,
+    halo_points: int = DEFAULT_HALO_POINTS,
+    valleys: bool = False,
+) -> np.ndarray:
+    """Find the same peaks as `find_peaks` with the segment generation conditions.
+
+    Every chunk is searched together with a halo of points on both sides. Cutting
+    off the signal can only lower the prominence and width of a peak, so a peak that
+    meets the conditions within the window also meets them on the whole signal. A
+    local maximum that does not meet them is only rejected once the search for its
+    bases stopped at a higher point within the window on both sides, as on the whole
+    signal. Otherwise, or when a flat stretch runs from the edge of the window into
+    the chunk, the halo on that side is doubled and the chunk is searched again.
+
+    Args:
+        values: Signal, e.g. memory-mapped, only the windows are read into memory.
+        chunk_points: Number of points per chunk.
+        halo_points: Initial number of points on both sides of a chunk.
+        valleys: Find the valleys instead of the peaks.
+
+    Returns:
+        np.ndarray: Positions of the peaks.
+    """
+    sign = -1.0 if valleys else 1.0
+    num_points = len(values)
+    peaks = []
+    for chunk_start in range(0, num_points, chunk_points):
+        chunk_end = min(chunk_start + chunk_points, num_points)
+        halo_left = halo_right = halo_points
+        while True:
+            start = max(chunk_start - halo_left, 0)
+            end = min(chunk_end + halo_right, num_points)
+            window = sign * np.asarray(values[start:end], dtype=float)
+            chunk_peaks, undecided_left, undecided_right = _find_window_peaks(
+                window,
+                chunk_start=chunk_start - start,
+                chunk_end=chunk_end - start,
+                at_start=start == 0,
+                at_end=end == num_points,
+            )
+            if not (undecided_left or undecided_right):
+                break
+            halo_left *= 2 if undecided_left else 1
+            halo_right *= 2 if undecided_right else 1
+
+        peaks.append(chunk_peaks + start)
+
+    return np.concatenate(peaks) if peaks else np.empty(0, dtype=np.intp)
+
+
+def _find_window_peaks(
+    window: np.ndarray, chunk_start: int, chunk_end: int, at_start: bool, at_end: bool
+) -> tuple:
+    """Find the peaks of a chunk in its window.
+
+    Returns:
+        tuple: Positions of the peaks in the chunk, relative to the window, and
+            whether more points are needed to the left and right to decide them.
+    """
+    from scipy.signal import find_peaks
+
+    local_maxima, _ = find_peaks(window)
+    peaks, _ = find_peaks(window, prominence=PEAK_PROMINENCE, width=PEAK_WIDTH)
+    local_maxima = local_maxima[
+        (local_maxima >= chunk_start) & (local_maxima < chunk_end)
+    ]
+    peaks = peaks[(peaks >= chunk_start) & (peaks < chunk_end)]
+    rejected = np.setdiff1d(local_maxima, peaks)
+
+    # The search for the bases of a peak stops at the first higher point
+    higher_left = np.concatenate([[-np.inf], np.maximum.accumulate(window)[:-1]])
+    higher_right = np.concatenate(
+        [np.maximum.accumulate(window[::-1])[::-1][1:], [-np.inf]]
+    )
+    undecided_left = not at_start and bool(
+        np.any(higher_left[rejected] <= window[rejected])
+    )
+    undecided_right = not at_end and bool(
+        np.any(higher_right[rejected] <= window[rejected])
+    )
+
+    # A flat stretch from the window edge into the chunk can hide a local maximum
+    changes = np.flatnonzero(window[1:] != window[:-1])
+    if not at_start and (len(changes) == 0 or changes[0] >= chunk_start):
+        undecided_left = True
+    if not at_end and (len(changes) == 0 or changes[-1] + 1 < chunk_end):
+        undecided_right = True
+
+    return peaks, undecided_left, undecided_right
+
+
+class _ChunkedSmoother:
+    """Gaussian smoothing of a signal that arrives in chunks.
+
+    A smoothed point depends on `radius` points on both sides. Points are held back
+    until the next chunk arrives when their kernel reaches beyond the data so far,
+    and the last `radius` smoothed points are kept for the kernel of the next ones.
+    At the start and the end of the signal the kernel is reflected, as with the
+    whole signal.
+    """
+
+    def __init__(self):
+        self.radius = int(SMOOTHING_TRUNCATE * SMOOTHING_SIGMA + 0.5)
+        self.history = np.empty(0)
+        self.pending = np.empty(0)
+
+    def push(self, values: np.ndarray) -> np.ndarray:
+        """Add a chunk and get the points that can be smoothed."""
+        return self._smooth(values, final=False)
+
+    def flush(self) -> np.ndarray:
+        """Get the remaining points at the end of the signal."""
+        return self._smooth(np.empty(0), final=True)
+
+    def _smooth(self, values: np.ndarray, final: bool) -> np.ndarray:
+        from scipy.ndimage import gaussian_filter1d
+
+        buffer = np.concatenate([self.history, self.pending, values])
+        start = len(self.history)
+        end = len(buffer) if final else max(len(buffer) - self.radius, start)
+        smoothed = gaussian_filter1d(
+            buffer, sigma=SMOOTHING_SIGMA, truncate=SMOOTHING_TRUNCATE
+        )[start:end]
+
+        self.history = buffer[max(end - self.radius, 0) : end]
+        self.pending = buffer[end:]
+        return smoothed
@@ -0,0 +1,189 @@
+"""Code to catalog the climbs of all ingested stages."""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+CLIMB_SLOPE_THRESHOLD = 2  # Same threshold as `apply_duration`, in %
+CLIMB_COLUMNS = [
+    "stage",
+    "segment",
+    "start point (km)",
+    "end point (km)",
+    "km to finish",
+    "length (km)",
+    "elevation gain (m)",
+    "average slope (%)",
+    "max sustained slope (%)",
+    "max sustained start (km)",
+    "summit elevation (m)",
+]
+
+
+class ClimbCatalog:
+    """Index of the climbing segments of all ingested stages.
+
+    Climbs are extracted once per stage when it is ingested and stored as columns,
+    so queries over all stages are vectorized filters and sorts that never
+    re-segment a stage. Ingesting a stage again replaces its climbs.
+    """
+
+    def __init__(self, sustained_window_km: float = 1.0):
+        """Create an empty catalog.
+
+        Args:
+            sustained_window_km: Window length in km for the max sustained slope.
+        """
+        self.sustained_window_km = sustained_window_km
+        self._stage_climbs = {}  # stage -> dataframe with climbs of the stage
+        self._climbs = pd.DataFrame(columns=CLIMB_COLUMNS)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._climbs)
+
+    def stages(self) -> list:
+        """List the ingested stages."""
+        return list(self._stage_climbs)
+
+    def add_stage(
+        self, stage: str, df: pd.DataFrame, segments_df: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Ingest the climbs of a stage.
+
+        Args:
+            stage: Name of the stage.
+            df: Dataframe with gpx data.
+            segments_df: Dataframe with generated segment information.
+
+        Returns:
+            pd.DataFrame: Dataframe with the climbs of the stage.
+        """
+        stage_climbs = extract_climbs(
+            df, segments_df, sustained_window_km=self.sustained_window_km
+        )
+        stage_climbs.insert(0, "stage", stage)
+
+        with self._lock:
+            self._stage_climbs[stage] = stage_climbs
+            self._climbs = pd.concat(
+                [climbs for climbs in self._stage_climbs.values() if len(climbs)]
+                or [self._climbs.iloc[:0]],
+                ignore_index=True,
+            )
+
+        return stage_climbs
+
+    def query(
+        self,
+        min_length_km: float = None,
+        min_slope: float = None,
+        min_sustained_slope: float = None,
+        min_gain_m: float = None,
+        within_last_km: float = None,
+        stages: list = None,
+        sort_by: str = "average slope (%)",
+        ascending: bool = False,
+        limit: int = None,
+    ) -> pd.DataFrame:
+        """Filter and sort the climbs of all ingested stages.
+
+        For example all climbs longer than 5 km above 7% in the last 50 km:
+        `query(min_length_km=5, min_slope=7, within_last_km=50)`.
+
+        Args:
+            min_length_km: Minimum climb length in km.
+            min_slope: Minimum average slope in %.
+            min_sustained_slope: Minimum max sustained slope in %.
+            min_gain_m: Minimum elevation gain in m.
+            within_last_km: Only climbs that start within this distance of the finish.
+            stages: Only climbs of these stages.
+            sort_by: Column to sort the climbs by.
+            ascending: Sort in ascending order.
+            limit: Maximum number of climbs to return.
+
+        Returns:
+            pd.DataFrame: Dataframe with the selected climbs.
+        """
+        climbs = self._climbs
+        mask = np.ones(len(climbs), dtype=bool)
+        for column, minimum in [
+            ("length (km)", min_length_km),
+            ("average slope (%)", min_slope),
+            ("max sustained slope (%)", min_sustained_slope),
+            ("elevation gain (m)", min_gain_m),
+        ]:
+            if minimum is not None:
+                mask &= climbs[column].to_numpy(dtype=float) >= minimum
+        if within_last_km is not None:
+            km_to_start = climbs["km to finish"] + climbs["length (km)"]
+            mask &= km_to_start.to_numpy(dtype=float) <= within_last_km
+        if stages is not None:
+            mask &= climbs["stage"].isin(stages).to_numpy()
+
+        order = np.argsort(climbs[sort_by].to_numpy()[mask], kind="stable")
+        if not ascending:
+            order = order[::-1]
+
+        return climbs[mask].iloc[order[:limit]].reset_index(drop=True)
+
+
+def extract_climbs(
+    df: pd.DataFrame, segments_df: pd.DataFrame, sustained_window_km: float = 1.0
+) -> pd.DataFrame:
+    """Extract the climbing segments of a stage with their statistics.
+
+    Args:
+        df: Dataframe with gpx data.
+        segments_df: Dataframe with generated segment information.
+        sustained_window_km: Window length in km for the max sustained slope.
+
+    Returns:
+        pd.DataFrame: Dataframe with one row per climb.
+    """
+    climbs_df = segments_df[
+        segments_df["average slope (%)"] > CLIMB_SLOPE_THRESHOLD
+    ].reset_index(drop=True)
+
+    distance = df["distance"].to_numpy(dtype=float)
+    elevation = df["smoothed_elevation"].to_numpy(dtype=float)
+    start_points = climbs_df["start point (km)"].to_numpy(dtype=float)
+    end_points = climbs_df["end point (km)"].to_numpy(dtype=float)
+
+    max_sustained_slope = climbs_df["average slope (%)"].to_numpy(dtype=float).copy()
+    max_sustained_start = start_points.copy()
+    for i, (start_point, end_point) in enumerate(zip(start_points, end_points)):
+        if end_point - start_point <= sustained_window_km:
+            continue
+        # Average slope of every window that starts at a route point of the climb
+        window_start = distance[
+            (distance >= start_point) & (distance <= end_point - sustained_window_km)
+        ]
+        if len(window_start) == 0:
+            continue
+        window_gain = np.interp(
+            window_start + sustained_window_km, distance, elevation
+        ) - np.interp(window_start, distance, elevation)
+        window_slope = window_gain / (sustained_window_km * 1000) * 100
+        max_sustained_slope[i] = window_slope.max()
+        max_sustained_start[i] = window_start[window_slope.argmax()]
+
+    return pd.DataFrame(
+        {
+            "segment": climbs_df["segment"].to_numpy(),
+            "start point (km)": start_points,
+            "end point (km)": end_points,
+            "km to finish": distance[-1] - end_points,
+            "length (km)": climbs_df["segment distance (km)"].to_numpy(dtype=float),
+            "elevation gain (m)": (
+                climbs_df["end elevation (m)"] - climbs_df["start elevation (m)"]
+            ).to_numpy(dtype=float),
+            "average slope (%)": climbs_df["average slope (%)"].to_numpy(dtype=float),
+            "max sustained slope (%)": max_sustained_slope,
+            "max sustained start (km)": max_sustained_start,
+            "summit elevation (m)": climbs_df["end elevation (m)"].to_numpy(
+                dtype=float
+            ),
+        }
+    )
@@ -1,6 +1,30 @@
 """Code to ..."""
 
-from scipy.optimize import fsolve
+import numpy as np
+import pandas as pd
+
+# Physical constants shared by the duration models
+AIR_DENSITY = 1.15  # kg/m^3
+CRR = 0.004
+GRAVITY = 9.81  # m/s^2
+ADDITIONAL_MASS = 7.8  # Additional mass for bike/equipment
+FRICTION_LOSS = 0.02
+
+# Default parameters of `evaluate_strategy`, e.g. for the API and the benchmarks
+STRATEGY_PARAMETERS = {
+    "rider_stats": {
+        "weight_rider": 65.0,
+        "cda_values": {"full": 0.2625, "semi": 0.305, "none": 0.35},
+    },
+    "semi_draft_point": 0.6,
+    "full_draft_point": 0.9,
+    "relative_power_climb": 5.5,
+    "relative_power_flat": 3.0,
+    "relative_power_descend": 1.5,
+    "average_speed_down": 60.0,
+    "average_speed_flat": 45.0,
+    "glycogen_start_level": 100.0,
+}
 
 
 def define_drafting_decisions(segments, semi_draft_point=0.6, full_draft_point=0.9):
@@ -20,15 +44,14 @@ def define_drafting_decisions(segments, semi_draft_point=0.6, full_draft_point=0
     else:
         raise ValueError("The full draft point must either be an integer or a float")
 
-    segments["drafting"] = ""
-
-    for i in range(num_segments):
-        if i < semi_draft_segment:
-            segments.loc[i, "drafting"] = "full"
-        elif i < full_draft_segment:
-            segments.loc[i, "drafting"] = "semi"
-        else:
-            segments.loc[i, "drafting"] = "none"
+    # Work on a copy so the input frame (and any scenario sharing it) is left intact
+    segments = segments.copy()
+    position = np.arange(num_segments)
+    segments["drafting"] = np.select(
+        [position < semi_draft_segment, position < full_draft_segment],
+        ["full", "semi"],
+        default="none",
+    )
 
     return segments, semi_draft_segment, full_draft_segment
 
@@ -54,11 +77,69 @@ def find_velocity(
         )
         return total_power_watt - total_power
 
+    from scipy.optimize import fsolve
+
     velocity_initial_guess = 5  # Initial guess for velocity
     velocity_solution = fsolve(equations, velocity_initial_guess)
     return velocity_solution[0]
 
 
+def solve_velocity(
+    total_power,
+    air_density,
+    cda_value,
+    total_mass,
+    slope,
+    CRR=CRR,
+    gravity=GRAVITY,
+    friction_loss=FRICTION_LOSS,
+):
+    """Solve the power balance for velocity on whole arrays at once.
+
+    Same equation as `find_velocity`, written as the cubic
+    `0.5 * rho * CdA * v^3 + m * g * (CRR + slope) * v = P / (1 + friction_loss)`
+    and solved in closed form, so thousands of segments or route points are solved
+    without a root finder. The cubic always has exactly one positive root for
+    non-negative power, which is the one returned.
+
+    Args:
+        total_power: Power in watts.
+        air_density: Air density in kg/m^3.
+        cda_value: Drag area in m^2.
+        total_mass: Mass of rider and equipment in kg.
+        slope: Gradient as a fraction (elevation gain / distance).
+        CRR: Rolling resistance coefficient.
+        gravity: Gravitational acceleration in m/s^2.
+        friction_loss: Drivetrain loss as a fraction of power.
+
+    Returns:
+        np.ndarray: Velocity in m/s, broadcast over the inputs.
+    """
+    a = 0.5 * np.asarray(air_density, dtype=float) * np.asarray(cda_value, dtype=float)
+    b = np.asarray(total_mass, dtype=float) * gravity * (CRR + np.asarray(slope))
+    c = np.maximum(np.asarray(total_power, dtype=float), 0) / (1 + friction_loss)
+    a, b, c = np.broadcast_arrays(a, b, c)
+
+    # Depressed cubic v^3 + p * v + q = 0
+    p = b / a
+    q = -c / a
+    discriminant = (q / 2) ** 2 + (p / 3) ** 3
+
+    # One real root (Cardano)
+    sqrt_discriminant = np.sqrt(np.maximum(discriminant, 0))
+    velocity_cardano = np.cbrt(-q / 2 + sqrt_discriminant) + np.cbrt(
+        -q / 2 - sqrt_discriminant
+    )
+
+    # Three real roots (steep descents), take the largest one
+    radius = np.sqrt(np.maximum(-p / 3, 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_argument = np.clip((-q / 2) / radius**3, -1, 1)
+    velocity_trigonometric = 2 * radius * np.cos(np.arccos(cos_argument) / 3)
+
+    return np.where(discriminant >= 0, velocity_cardano, velocity_trigonometric)
+
+
 def calculate_climbing_duration(
     time_sec=None,
     relative_power=None,
@@ -68,11 +149,10 @@ def calculate_climbing_duration(
     drafting=None,
 ):
     # Constants
-    air_density = 1.15
-    CRR = 0.004
-    gravity = 9.81  # m/s^2
-    additional_mass = 7.8  # Additional mass for bike/equipment
-    friction_loss = 0.02
+    air_density = AIR_DENSITY
+    gravity = GRAVITY
+    additional_mass = ADDITIONAL_MASS
+    friction_loss = FRICTION_LOSS
 
     if (
         length_segment_km is None
@@ -170,16 +250,99 @@ def apply_flat_duration(row, average_speed_flat):
     return row["segment distance (km)"] * 3600 / average_speed_flat
 
 
-def apply_duration(row, rider_stats, average_speed_down=60, average_speed_flat=45):
+def apply_duration(
+    row, rider_stats, average_speed_down=60, average_speed_flat=45, route_durations=None
+):
     if row["average slope (%)"] > 2:
         return apply_climbing_duration(row, rider_stats)
+    elif route_durations is not None:
+        # Modelled from the route geometry, e.g. by `compute_route_durations`
+        return route_durations[row.name]
     elif row["average slope (%)"] < -2:
         return apply_descending_duration(row, average_speed_down)
     else:
         return apply_flat_duration(row, average_speed_flat)
 
 
+def compute_durations_batch(
+    segments_df,
+    rider_stats,
+    average_speed_down=60,
+    average_speed_flat=45,
+    relative_power=None,
+    route_durations=None,
+):
+    """Compute the duration of every segment at once.
+
+    Vectorized equivalent of applying `apply_duration` to every row: climbing
+    segments are solved with `solve_velocity`, descending and flat segments use the
+    constant average speeds, or the durations modelled from the route geometry if
+    `route_durations` is given. Durations are not rounded.
+
+    Args:
+        segments_df: Dataframe with segment information and drafting decisions.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        average_speed_down: Average speed on descending segments in km/h.
+        average_speed_flat: Average speed on flat segments in km/h.
+        relative_power: Optional relative power (W/kg) to evaluate instead of the
+            "relative power (w/kg)" column. A 2D array evaluates one power plan per
+            row in a single call, the rider weight and CdA values can then also be
+            arrays with one value per plan, e.g. for a team roster.
+        route_durations: Optional duration in seconds per segment for descending
+            and flat segments, e.g. from `compute_route_durations`, or per plan and
+            segment.
+
+    Returns:
+        np.ndarray: Duration in seconds per segment, with the shape of
+            `relative_power`.
+    """
+    if relative_power is None:
+        relative_power = segments_df["relative power (w/kg)"].to_numpy(dtype=float)
+    relative_power = np.asarray(relative_power, dtype=float)
+
+    weight_rider = np.asarray(rider_stats["weight_rider"], dtype=float)
+    if weight_rider.ndim:
+        weight_rider = weight_rider[:, None]
+    cda_values = rider_stats["cda_values"]
+    cda_value = np.array(
+        [
+            cda_values.get(drafting, cda_values.get("full"))
+            for drafting in segments_df["drafting"]
+        ],
+        dtype=float,
+    ).T
+    length_segment_m = segments_df["segment distance (km)"].to_numpy(dtype=float) * 1000
+    elevation_gain_m = np.abs(
+        segments_df["end elevation (m)"].to_numpy(dtype=float)
+        - segments_df["start elevation (m)"].to_numpy(dtype=float)
+    )
+    average_slope = segments_df["average slope (%)"].to_numpy(dtype=float)
+
+    velocity = solve_velocity(
+        total_power=relative_power * weight_rider,
+        air_density=AIR_DENSITY,
+        cda_value=cda_value,
+        total_mass=weight_rider + ADDITIONAL_MASS,
+        slope=elevation_gain_m / length_segment_m,
+    )
+    with np.errstate(divide="ignore"):
+        climbing_duration = length_segment_m / velocity
+
+    if route_durations is not None:
+        return np.where(
+            average_slope > 2,
+            climbing_duration,
+            np.asarray(route_durations, dtype=float),
+        )
+    return np.select(
+        [average_slope > 2, average_slope < -2],
+        [climbing_duration, length_segment_m * 3.6 / average_speed_down],
+        default=length_segment_m * 3.6 / average_speed_flat,
+    )
+
+
 def compute_glycogen_level(segments, glycogen_start_level=100):
+    segments = segments.copy()
     new_column = []
     previous_value = glycogen_start_level
 
@@ -208,3 +371,58 @@ def apply_relative_power(
         return relative_power_descend
     else:
         return relative_power_flat
+
+
+def evaluate_strategy(
+    segments_df: pd.DataFrame,
+    rider_stats: dict,
+    semi_draft_point: float = 0.6,
+    full_draft_point: float = 0.9,
+    relative_power_climb: float = 5.5,
+    relative_power_flat: float = 3.0,
+    relative_power_descend: float = 1.5,
+    average_speed_down: float = 60.0,
+    average_speed_flat: float = 45.0,
+    glycogen_start_level: float = 100.0,
+) -> pd.DataFrame:
+    """Compute the durations and glycogen levels of a strategy, as on pages 02 and 03.
+
+    Segments that already have a relative power keep it, the others get the climb,
+    flat or descend power according to their slope.
+
+    Args:
+        segments_df: Dataframe with segment information.
+        rider_stats: Rider weight and CdA values per drafting mode.
+        semi_draft_point: Fraction of the route after which to semi draft.
+        full_draft_point: Fraction of the route after which to fully draft.
+        relative_power_climb: Relative power on climbs in W/kg.
+        relative_power_flat: Relative power on flat segments in W/kg.
+        relative_power_descend: Relative power on descents in W/kg.
+        average_speed_down: Average speed on descending segments in km/h.
+        average_speed_flat: Average speed on flat segments in km/h.
+        glycogen_start_level: Glycogen level at the start in %.
+
+    Returns:
+        pd.DataFrame: Dataframe with segment information, durations and glycogen.
+    """
+    segments_df, _, _ = define_drafting_decisions(
+        segments_df,
+        semi_draft_point=semi_draft_point,
+        full_draft_point=full_draft_point,
+    )
+    if "relative power (w/kg)" not in segments_df.columns:
+        segments_df["relative power (w/kg)"] = segments_df.apply(
+            apply_relative_power,
+            args=(relative_power_climb, relative_power_descend, relative_power_flat),
+            axis=1,
+        )
+    segments_df["duration (s)"] = compute_durations_batch(
+        segments_df,
+        rider_stats=rider_stats,
+        average_speed_down=average_speed_down,
+        average_speed_flat=average_speed_flat,
+    ).round(0)
+
+    return compute_glycogen_level(
+        segments_df, glycogen_start_level=glycogen_start_level
+    )
@@ -0,0 +1,240 @@
+"""Code to correct route elevations with a local digital elevation model (DEM).
+
+The DEM is a directory of 1x1 degree tiles stored as `.npy` arrays, named after
+their south-west corner as SRTM tiles are, e.g. `N43E011.npy`. The first row of a
+tile is its north edge and the first column its west edge, both edges are included,
+so a 1 arc-second tile has 3601 x 3601 values. Voids are NaN.
+
+Tiles are opened memory-mapped, so only the pages around the sampled points are
+read from disk, and the most recently used tiles are kept open. Everything works
+offline, tiles can be converted from SRTM `.hgt` files with:
+
+    python -m src.dem convert <hgt directory> data/dem
+"""
+
+import argparse
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.process_data import SMOOTHING_SIGMA, compute_route_columns, configure_logging
+
+logger = logging.getLogger(__name__)
+
+DEM_DIRECTORY = Path("data/dem")
+HGT_VOID = -32768  # No data value of SRTM tiles
+
+
+class DemTiles:
+    """Elevation tiles of a DEM, memory-mapped on first use.
+
+    Thread-safe, so one instance can be shared by all sessions of the app. The least
+    recently used tiles are closed beyond `max_tiles`, tiles that do not exist are
+    remembered as missing.
+    """
+
+    def __init__(self, directory=DEM_DIRECTORY, max_tiles: int = 16):
+        """Open a directory of DEM tiles.
+
+        Args:
+            directory: Directory with the `.npy` tiles.
+            max_tiles: Maximum number of tiles to keep open.
+        """
+        self.directory = Path(directory)
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def available(self) -> bool:
+        """Check whether the directory has any tiles."""
+        return self.directory.is_dir() and any(self.directory.glob("*.npy"))
+
+    def tile(self, latitude: int, longitude: int) -> np.ndarray:
+        """Get the tile with its south-west corner at a latitude and longitude.
+
+        Returns:
+            np.ndarray: Read-only memory-mapped elevations, None if there is no tile.
+        """
+        key = (latitude, longitude)
+        with self._lock:
+            if key not in self._tiles:
+                path = self.directory / f"{tile_name(latitude, longitude)}.npy"
+                self._tiles[key] = (
+                    np.load(path, mmap_mode="r") if path.exists() else None
+                )
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+            return self._tiles[key]
+
+    def sample(self, latitude, longitude) -> np.ndarray:
+        """Sample the elevation at points with bilinear interpolation.
+
+        Points are grouped per tile and every tile is interpolated at all its points
+        at once.
+
+        Args:
+            latitude: Latitude of every point in degrees.
+            longitude: Longitude of every point in degrees.
+
+        Returns:
+            np.ndarray: Elevation of every point in m, NaN outside the tiles and next
+                to voids.
+        """
+        latitude = np.asarray(latitude, dtype=float)
+        longitude = np.asarray(longitude, dtype=float)
+        # One integer key per tile, faster to group than pairs of corners
+        tile_keys = (np.floor(latitude).astype(int) + 90) * 360 + (
+            np.floor(longitude).astype(int) + 180
+        )
+        keys, inverse = np.unique(tile_keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        elevation = np.full(len(latitude), np.nan)
+        for i, key in enumerate(keys.tolist()):
+            south, west = key // 360 - 90, key % 360 - 180
+            tile = self.tile(south, west)
+            if tile is None:
+                continue
+            points = inverse == i
+            rows, columns = tile.shape
+            elevation[points] = bilinear_interpolation(
+                tile,
+                row=(south + 1 - latitude[points]) * (rows - 1),
+                column=(longitude[points] - west) * (columns - 1),
+            )
+
+        return elevation
+
+
+def bilinear_interpolation(
+    grid: np.ndarray, row: np.ndarray, column: np.ndarray
+) -> np.ndarray:
+    """Interpolate a grid at fractional row and column positions.
+
+    Only the four grid values around every position are read, so a memory-mapped
+    grid only pages in the blocks around the positions.
+
+    Args:
+        grid: 2D array of values.
+        row: Fractional row of every position, within the grid.
+        column: Fractional column of every position, within the grid.
+
+    Returns:
+        np.ndarray: Interpolated value at every position.
+    """
+    rows, columns = grid.shape
+    row_0 = np.clip(np.floor(row).astype(int), 0, rows - 2)
+    column_0 = np.clip(np.floor(column).astype(int), 0, columns - 2)
+    row_fraction = row - row_0
+    column_fraction = column - column_0
+
+    top = grid[row_0, column_0] * (1 - column_fraction) + (
+        grid[row_0, column_0 + 1] * column_fraction
+    )
+    bottom = grid[row_0 + 1, column_0] * (1 - column_fraction) + (
+        grid[row_0 + 1, column_0 + 1] * column_fraction
+    )
+    return top * (1 - row_fraction) + bottom * row_fraction
+
+
+def correct_elevation(df: pd.DataFrame, dem: DemTiles) -> pd.DataFrame:
+    """Replace the gpx elevation of a route by the DEM elevation.
+
+    Points outside the DEM tiles or next to voids keep their gpx elevation. The
+    elevation difference, gradient and smoothed elevation are computed again with
+    the same pipeline as `create_dataframe`.
+
+    Args:
+        df: Dataframe with gpx data.
+        dem: DEM tiles to sample.
+
+    Returns:
+        pd.DataFrame: New dataframe with gpx data and the corrected elevation.
+    """
+    from scipy.ndimage import gaussian_filter1d
+
+    latitude = df["latitude"].to_numpy(dtype=float)
+    longitude = df["longitude"].to_numpy(dtype=float)
+    dem_elevation = dem.sample(latitude, longitude)
+    covered = ~np.isnan(dem_elevation)
+    logger.info(f"Corrected the elevation of {covered.sum()}/{len(df)} points.")
+
+    columns, _ = compute_route_columns(
+        latitude,
+        longitude,
+        np.where(covered, dem_elevation, df["elevation"].to_numpy(dtype=float)),
+    )
+    corrected_df = pd.DataFrame(columns)
+    corrected_df["smoothed_elevation"] = gaussian_filter1d(
+        corrected_df["elevation"], sigma=SMOOTHING_SIGMA
+    )
+    return corrected_df
+
+
+def tile_name(latitude: int, longitude: int) -> str:
+    """Get the SRTM name of the tile with its south-west corner at a point."""
+    return (
+        f"{'N' if latitude >= 0 else 'S'}{abs(latitude):02d}"
+        f"{'E' if longitude >= 0 else 'W'}{abs(longitude):03d}"
+    )
+
+
+def convert_hgt_tiles(source, directory=DEM_DIRECTORY) -> list:
+    """Convert SRTM `.hgt` tiles to `.npy` tiles.
+
+    `.hgt` tiles are square grids of big-endian 16-bit integers, voids become NaN.
+
+    Args:
+        source: Directory with the `.hgt` files.
+        directory: Directory for the `.npy` tiles.
+
+    Returns:
+        list: Paths of the written tiles.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for hgt_path in sorted(Path(source).glob("*.hgt")):
+        values = np.fromfile(hgt_path, dtype=">i2")
+        size = int(round(np.sqrt(values.size)))
+        if size * size != values.size:
+            raise ValueError(f"{hgt_path.name} is not a square tile")
+        tile = values.reshape(size, size).astype(np.float32)
+        tile[values.reshape(size, size) == HGT_VOID] = np.nan
+
+        path = directory / f"{hgt_path.stem.upper()}.npy"
+        np.save(path, tile)
+        paths.append(path)
+        logger.info(f"Converted {hgt_path.name} to {path}")
+
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prepare local DEM tiles.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser(
+        "convert", help="Convert SRTM .hgt tiles to .npy tiles"
+    )
+    convert_parser.add_argument("source", type=Path)
+    convert_parser.add_argument(
+        "directory", type=Path, nargs="?", default=DEM_DIRECTORY
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.command == "convert":
+        paths = convert_hgt_tiles(args.source, args.directory)
+        logger.info(f"Wrote {len(paths)} tiles to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
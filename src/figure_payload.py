@@ -0,0 +1,145 @@
+"""Code to send plotly figures to the browser as compact typed arrays.
+
+`st.plotly_chart` serializes a figure from `figure.to_dict()`, which writes every
+numeric array as a JSON list of floats, on every rerun. `CompactFigure` encodes the
+long numeric arrays of its traces as plotly.js typed array specs instead, base64
+encoded float32 or int32 values, and keeps the encoded traces until the figure
+changes. The figures of the pages are cached and shared between reruns, so the route
+layers are encoded once per route and segments, not once per page view.
+
+float32 keeps about 7 significant digits, below 1 m on coordinates and below 1 cm on
+distances in km, so it is precise enough for everything the charts show.
+"""
+
+import base64
+import time
+
+import numpy as np
+import plotly.graph_objs as go
+import plotly.io
+
+TYPED_ARRAY_MIN_SIZE = 64  # Shorter arrays stay JSON lists, they are readable
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+def typed_array_spec(values) -> dict:
+    """Encode a numeric array as a plotly.js typed array spec.
+
+    Floats are encoded as float32 unless they exceed its range, integers as int32
+    unless they exceed its range, then both fall back to float64.
+
+    Args:
+        values: Numeric array with one or two dimensions.
+
+    Returns:
+        dict: Typed array spec with the dtype, base64 data and shape, None if the
+            values are not numeric.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind not in "fiu" or values.ndim not in (1, 2):
+        return None
+
+    finite = values[np.isfinite(values)] if values.dtype.kind == "f" else values
+    if values.dtype.kind == "f":
+        fits = not finite.size or np.abs(finite).max() <= FLOAT32_MAX
+        dtype = "f4" if fits else "f8"
+    else:
+        fits = not finite.size or (
+            finite.min() >= INT32_MIN and finite.max() <= INT32_MAX
+        )
+        dtype = "i4" if fits else "f8"
+
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    spec = {"dtype": dtype, "bdata": base64.b64encode(data.tobytes()).decode("ascii")}
+    if values.ndim == 2:
+        spec["shape"] = f"{values.shape[0]},{values.shape[1]}"
+    return spec
+
+
+def encode_typed_arrays(obj, min_size: int = TYPED_ARRAY_MIN_SIZE):
+    """Replace the long numeric arrays in a trace dict by typed array specs.
+
+    Args:
+        obj: Trace dict, or a value in it.
+        min_size: Minimum number of values of an encoded array.
+
+    Returns:
+        Copy of the dict with the encoded arrays, other values are not copied.
+    """
+    if isinstance(obj, dict):
+        return {key: encode_typed_arrays(value, min_size) for key, value in obj.items()}
+    if isinstance(obj, (np.ndarray, list, tuple)) and len(obj) >= min_size:
+        if isinstance(obj, np.ndarray) or isinstance(obj[0], (int, float)):
+            spec = typed_array_spec(obj)
+            if spec is not None:
+                return spec
+    return obj
+
+
+def _clears_payload(method):
+    """Wrap a figure change notification to drop the encoded payload."""
+
+    def clear_payload(self, *args, **kwargs):
+        self._payload = None
+        return method(self, *args, **kwargs)
+
+    return clear_payload
+
+
+class CompactFigure(go.Figure):
+    """Figure that serializes its numeric trace arrays as typed arrays.
+
+    The encoded dict is built on the first `to_dict` and reused until the figure
+    changes, plotly notifies every change of the traces or layout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._payload = None
+        super().__init__(*args, **kwargs)
+
+    def to_dict(self) -> dict:
+        """Get the figure dict with typed arrays, e.g. for `st.plotly_chart`.
+
+        Returns:
+            dict: Shallow copy of the encoded figure dict, the arrays are shared.
+        """
+        payload = self._payload
+        if payload is None:
+            payload = super().to_dict()
+            payload["data"] = [encode_typed_arrays(trace) for trace in payload["data"]]
+            self._payload = payload
+        return {
+            **payload,
+            "data": [dict(trace) for trace in payload["data"]],
+        }
+
+    def __reduce__(self):
+        # Copy and pickle the plain dict, typed array specs do not validate as data
+        props = super().to_dict()
+        props["_grid_str"] = self._grid_str
+        props["_grid_ref"] = self._grid_ref
+        return (self.__class__, (props,))
+
+    _send_addTraces_msg = _clears_payload(go.Figure._send_addTraces_msg)
+    _send_animate_msg = _clears_payload(go.Figure._send_animate_msg)
+    _send_deleteTraces_msg = _clears_payload(go.Figure._send_deleteTraces_msg)
+    _send_moveTraces_msg = _clears_payload(go.Figure._send_moveTraces_msg)
+    _send_relayout_msg = _clears_payload(go.Figure._send_relayout_msg)
+    _send_restyle_msg = _clears_payload(go.Figure._send_restyle_msg)
+    _send_update_msg = _clears_payload(go.Figure._send_update_msg)
+
+
+def measure_payload(fig: go.Figure) -> dict:
+    """Serialize a figure as `st.plotly_chart` does and measure the payload.
+
+    Args:
+        fig: Plotly figure.
+
+    Returns:
+        dict: Payload size in bytes and serialization time in seconds.
+    """
+    start = time.perf_counter()
+    payload = plotly.io.to_json(fig.to_dict(), validate=False)
+    duration = time.perf_counter() - start
+    return {"size (bytes)": len(payload.encode("utf-8")), "time (s)": duration}
@@ -0,0 +1,7 @@
+"""Code to format values for the pages and exported files."""
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration in seconds as h:mm:ss."""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
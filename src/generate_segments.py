@@ -1,7 +1,10 @@
 """Code to automate segment generation based on a dataframe with .gpx data."""
 
+import numpy as np
 import pandas as pd
-from scipy.signal import find_peaks
+
+PEAK_PROMINENCE = 2  # Minimum prominence of peaks and valleys in m
+PEAK_WIDTH = 1  # Minimum width of peaks and valleys in points
 
 
 def generate_segments(
@@ -17,26 +20,69 @@ def generate_segments(
     Returns:
         list: list of defined segments.
     """
+    from scipy.signal import find_peaks
+
     # Detect local maxima and minima
-    peaks, _ = find_peaks(df["smoothed_elevation"], prominence=2, width=1)
-    valleys, _ = find_peaks(-df["smoothed_elevation"], prominence=2, width=1)
+    peaks, _ = find_peaks(
+        df["smoothed_elevation"], prominence=PEAK_PROMINENCE, width=PEAK_WIDTH
+    )
+    valleys, _ = find_peaks(
+        -df["smoothed_elevation"], prominence=PEAK_PROMINENCE, width=PEAK_WIDTH
+    )
+
+    return build_segments(
+        peaks,
+        valleys,
+        distance=df["distance"].to_numpy(),
+        elevation=df["elevation"].to_numpy(),
+        window_size_km=window_size_km,
+        min_slope_diff=min_slope_diff,
+    )
+
+
+def build_segments(
+    peaks,
+    valleys,
+    distance: np.ndarray,
+    elevation: np.ndarray,
+    window_size_km: float,
+    min_slope_diff: float,
+) -> list:
+    """Split a route into segments between its peaks and valleys.
+
+    Segments run from one inflection point to the next one that is at least
+    `window_size_km` further, consecutive segments with similar slopes are merged.
+    Only the points at inflections are read from `distance` and `elevation`, so they
+    can be memory-mapped.
+
+    Args:
+        peaks: Positions of the elevation peaks.
+        valleys: Positions of the elevation valleys.
+        distance: Distance of every route point in km.
+        elevation: Elevation of every route point in m.
+        window_size_km: Minimum window length to define a segment  in km.
+        min_slope_diff: Minimum slope difference to define a segment in %.
+
+    Returns:
+        list: list of defined segments.
+    """
     inflection_points = sorted(list(peaks) + list(valleys))
 
     # Ensure first segment starts at the beginning and the last segment ends at the end
     if inflection_points[0] != 0:
         inflection_points.insert(0, 0)
-    if inflection_points[-1] != len(df) - 1:
-        inflection_points.append(len(df) - 1)
+    if inflection_points[-1] != len(distance) - 1:
+        inflection_points.append(len(distance) - 1)
 
     segments = []
     start_idx = inflection_points[0]
     for i in range(1, len(inflection_points)):
         end_idx = inflection_points[i]
-        segment_distance = df["distance"].iloc[end_idx] - df["distance"].iloc[start_idx]
+        segment_distance = distance[end_idx] - distance[start_idx]
 
         if segment_distance >= window_size_km:
-            start_elevation = df["elevation"].iloc[start_idx]
-            end_elevation = df["elevation"].iloc[end_idx]
+            start_elevation = elevation[start_idx]
+            end_elevation = elevation[end_idx]
             average_slope = (
                 (end_elevation - start_elevation) / (segment_distance * 1000) * 100
             )
@@ -62,8 +108,7 @@ def generate_segments(
             segments[i]["end_idx"] = segments[i + 1]["end_idx"]
             segments[i]["end_elevation"] = segments[i + 1]["end_elevation"]
             segments[i]["segment_distance"] = (
-                df["distance"].iloc[segments[i]["end_idx"]]
-                - df["distance"].iloc[segments[i]["start_idx"]]
+                distance[segments[i]["end_idx"]] - distance[segments[i]["start_idx"]]
             )
             segments[i]["average_slope"] = (
                 (segments[i]["end_elevation"] - segments[i]["start_elevation"])
@@ -87,6 +132,8 @@ def create_segments_dataframe(df: pd.DataFrame, segments: list) -> pd.DataFrame:
     Returns:
         pd.DataFrame: Dataframe with generated segment information.
     """
+    distance = df["distance"].to_numpy()
+
     segments_data = []
     for i, segment in enumerate(segments):
         start_idx = segment["start_idx"]
@@ -101,8 +148,8 @@ def create_segments_dataframe(df: pd.DataFrame, segments: list) -> pd.DataFrame:
                 "segment": f"segment {i+1}",
                 "start elevation (m)": start_elevation,
                 "end elevation (m)": end_elevation,
-                "start point (km)": df["distance"].iloc[start_idx],
-                "end point (km)": df["distance"].iloc[end_idx],
+                "start point (km)": distance[start_idx],
+                "end point (km)": distance[end_idx],
                 "segment distance (km)": segment_distance,
                 "average slope (%)": average_slope,
             }
@@ -111,3 +158,31 @@ def create_segments_dataframe(df: pd.DataFrame, segments: list) -> pd.DataFrame:
     segments_df = pd.DataFrame(segments_data)
 
     return segments_df
+
+
+def segments_from_dataframe(df: pd.DataFrame, segments_df: pd.DataFrame) -> list:
+    """Rebuild the list of segments from a (stored or edited) segments dataframe.
+
+    Args:
+        df: Dataframe with gpx data.
+        segments_df: Dataframe with segment information.
+
+    Returns:
+        list: list of segments, in the same format as `generate_segments`.
+    """
+    distance = np.maximum.accumulate(df["distance"].to_numpy(dtype=float))
+    start_idx = np.searchsorted(distance, segments_df["start point (km)"].to_numpy())
+    end_idx = np.searchsorted(distance, segments_df["end point (km)"].to_numpy())
+    last_idx = len(distance) - 1
+
+    return [
+        {
+            "start_idx": int(min(start, last_idx)),
+            "end_idx": int(min(end, last_idx)),
+            "start_elevation": row["start elevation (m)"],
+            "end_elevation": row["end elevation (m)"],
+            "segment_distance": row["segment distance (km)"],
+            "average_slope": row["average slope (%)"],
+        }
+        for start, end, (_, row) in zip(start_idx, end_idx, segments_df.iterrows())
+    ]
@@ -0,0 +1,136 @@
+"""Code to model the glycogen level over time with a W' balance model."""
+
+import numpy as np
+import pandas as pd
+
+CRITICAL_POWER_WKG = 5.0  # Power that can be sustained without depletion, in W/kg
+W_PRIME_JKG = 350.0  # Energy available above critical power, in J/kg
+MAX_LOG_DECAY = 50.0  # Decay per block of the scan, keeps exp() within float range
+
+
+def compute_w_prime_balance(
+    power,
+    duration,
+    critical_power: float,
+    w_prime: float,
+    glycogen_start_level: float = 100,
+) -> np.ndarray:
+    """Compute the glycogen level over time with a W' balance model.
+
+    Above critical power the reserve W' depletes by the work done above it. Below
+    critical power the deficit recovers exponentially, with a time constant that is
+    shorter the further the power is below critical power (Skiba et al. 2012):
+    tau = 546 * exp(-0.01 * (CP - P)) + 316 s.
+
+    Every step is the linear recurrence deficit[t] = a[t] * deficit[t-1] + b[t],
+    evaluated with a scan over the whole series instead of a loop, vectorized over
+    any leading dimensions (e.g. scenarios).
+
+    Args:
+        power: Power in W per step, e.g. per second or per route step, with the
+            steps along the last axis.
+        duration: Duration in seconds of every step, broadcast against `power`.
+        critical_power: Critical power in W.
+        w_prime: Energy available above critical power in J.
+        glycogen_start_level: Glycogen level at the start in %.
+
+    Returns:
+        np.ndarray: Glycogen level in % at the start and after every step, so with
+            one more value than steps along the last axis.
+    """
+    power, duration = np.broadcast_arrays(
+        np.asarray(power, dtype=float), np.asarray(duration, dtype=float)
+    )
+    below = np.maximum(critical_power - power, 0)
+    time_constant = 546 * np.exp(-0.01 * below) + 316
+    decay = np.where(power < critical_power, np.exp(-duration / time_constant), 1.0)
+    depletion = np.maximum(power - critical_power, 0) * duration
+
+    deficit = _linear_recurrence(decay, depletion)
+    start = np.zeros(deficit.shape[:-1] + (1,))
+    return glycogen_start_level * (
+        1 - np.concatenate([start, deficit], axis=-1) / w_prime
+    )
+
+
+def compute_route_glycogen(
+    route_times: pd.DataFrame,
+    rider_stats: dict,
+    critical_power_wkg: float = CRITICAL_POWER_WKG,
+    w_prime_jkg: float = W_PRIME_JKG,
+    glycogen_start_level: float = 100,
+) -> pd.DataFrame:
+    """Compute the glycogen level at every route point.
+
+    Args:
+        route_times: Dataframe returned by `integrate_route`.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        critical_power_wkg: Critical power in W/kg.
+        w_prime_jkg: Energy available above critical power in J/kg.
+        glycogen_start_level: Glycogen level at the start in %.
+
+    Returns:
+        pd.DataFrame: Dataframe with the distance, elapsed time, power and glycogen
+            level at every route point.
+    """
+    weight_rider = rider_stats["weight_rider"]
+    power = route_times["power (W)"].to_numpy(dtype=float)
+    elapsed_time = route_times["time (s)"].to_numpy(dtype=float)
+
+    glycogen_level = compute_w_prime_balance(
+        power[1:],
+        np.diff(elapsed_time),
+        critical_power=critical_power_wkg * weight_rider,
+        w_prime=w_prime_jkg * weight_rider,
+        glycogen_start_level=glycogen_start_level,
+    )
+
+    return pd.DataFrame(
+        {
+            "distance": route_times["distance"].to_numpy(),
+            "time (s)": elapsed_time,
+            "power (W)": power,
+            "glycogen level (%)": glycogen_level,
+        }
+    )
+
+
+def _linear_recurrence(decay, increment, initial=0.0) -> np.ndarray:
+    """Evaluate x[t] = decay[t] * x[t-1] + increment[t] along the last axis.
+
+    With A[t] = decay[0] * ... * decay[t], the solution is
+    x[t] = A[t] * (initial + sum over k <= t of increment[k] / A[k]), so a cumulative
+    sum of logs and a cumulative sum give every step at once. The series is split in
+    blocks in which the total decay is at most exp(-MAX_LOG_DECAY), so 1 / A stays
+    within float range for series of any length. Increments have to be non-negative,
+    so the sums have no cancellation.
+
+    Args:
+        decay: Decay factors in (0, 1] per step.
+        increment: Non-negative increments per step, same shape as `decay`.
+        initial: Value before the first step, broadcast against the leading axes.
+
+    Returns:
+        np.ndarray: Value after every step.
+    """
+    decay = np.asarray(decay, dtype=float)
+    increment = np.asarray(increment, dtype=float)
+    log_decay = np.log(decay)
+
+    # Split where the strongest decay over all series adds up to MAX_LOG_DECAY
+    step_log_decay = -log_decay.reshape(-1, log_decay.shape[-1]).min(axis=0)
+    block_ids = np.floor(np.cumsum(step_log_decay) / MAX_LOG_DECAY).astype(int)
+    boundaries = np.flatnonzero(np.diff(block_ids)) + 1
+    boundaries = np.concatenate([[0], boundaries, [decay.shape[-1]]])
+
+    result = np.empty(np.broadcast_shapes(decay.shape, increment.shape))
+    state = np.broadcast_to(np.asarray(initial, dtype=float), result.shape[:-1])
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        cumulative_log_decay = np.cumsum(log_decay[..., start:end], axis=-1)
+        scaled_increment = increment[..., start:end] * np.exp(-cumulative_log_decay)
+        result[..., start:end] = np.exp(cumulative_log_decay) * (
+            state[..., None] + np.cumsum(scaled_increment, axis=-1)
+        )
+        state = result[..., end - 1]
+
+    return result
@@ -0,0 +1,199 @@
+"""Code to export routes with their segments as gpx files for head units.
+
+The gpx text is written directly to a file object, the track points in blocks of
+formatted lines, without building a gpxpy object tree. Every segment start becomes a
+waypoint with the segment name, slope, target power and expected duration, which
+head units show as course points along the route.
+"""
+
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+from src.formatting import format_duration
+
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="vlab" xmlns="http://www.topografix.com/GPX/1/1">\n'
+)
+TRACK_POINT = '<trkpt lat="{:.7f}" lon="{:.7f}"><ele>{:.1f}</ele></trkpt>\n'
+TRACK_POINT_NO_ELEVATION = '<trkpt lat="{:.7f}" lon="{:.7f}"></trkpt>\n'
+WRITE_BLOCK_POINTS = 10_000
+UNSAFE_FILE_NAME_CHARACTERS = re.compile(r"[^\w .-]+")
+
+
+def write_route_gpx(
+    file,
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    name: str = "route",
+    weight_rider: float = None,
+) -> None:
+    """Write a route and a waypoint at the start of every segment as gpx.
+
+    Args:
+        file: Text file object to write to.
+        df: Dataframe with gpx data.
+        segments_df: Dataframe with segment information, with the target power and
+            expected duration if it has the "relative power (w/kg)" and
+            "duration (s)" columns.
+        name: Name of the route.
+        weight_rider: Rider weight in kg, adds the target power in W.
+    """
+    file.write(GPX_HEADER)
+    file.write(f"<metadata><name>{escape(name)}</name></metadata>\n")
+    for waypoint in _segment_waypoints(df, segments_df, weight_rider=weight_rider):
+        file.write(waypoint)
+
+    file.write(f"<trk><name>{escape(name)}</name><trkseg>\n")
+    latitude = df["latitude"].to_numpy(dtype=float)
+    longitude = df["longitude"].to_numpy(dtype=float)
+    elevation = df["elevation"].to_numpy(dtype=float)
+    for start in range(0, len(df), WRITE_BLOCK_POINTS):
+        block = slice(start, start + WRITE_BLOCK_POINTS)
+        block_elevation = elevation[block]
+        if np.isnan(block_elevation).any():
+            file.write(
+                "".join(
+                    (
+                        TRACK_POINT_NO_ELEVATION.format(lat, lon)
+                        if np.isnan(ele)
+                        else TRACK_POINT.format(lat, lon, ele)
+                    )
+                    for lat, lon, ele in zip(
+                        latitude[block].tolist(),
+                        longitude[block].tolist(),
+                        block_elevation.tolist(),
+                    )
+                )
+            )
+        else:
+            file.write(
+                "".join(
+                    map(
+                        TRACK_POINT.format,
+                        latitude[block].tolist(),
+                        longitude[block].tolist(),
+                        block_elevation.tolist(),
+                    )
+                )
+            )
+    file.write("</trkseg></trk>\n</gpx>\n")
+
+
+def export_route_gpx(
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    name: str = "route",
+    weight_rider: float = None,
+) -> bytes:
+    """Export a route with its segments as gpx, e.g. for a download button.
+
+    Returns:
+        bytes: Content of the gpx file.
+    """
+    text = io.StringIO()
+    write_route_gpx(text, df, segments_df, name=name, weight_rider=weight_rider)
+    return text.getvalue().encode("utf-8")
+
+
+def export_team_gpx(file, stages: dict, rider_plans: dict) -> None:
+    """Export the routes of several stages for every rider of a team as a zip file.
+
+    Every gpx file is streamed into the zip archive, so only one block of track
+    points is held in memory at a time. The stage and rider names are sanitized for
+    the entry names, so every file ends up in its stage folder, and names that
+    collide get a number.
+
+    Args:
+        file: Path or binary file object of the zip file.
+        stages: Dataframe with gpx data per stage name.
+        rider_plans: Per stage name, a dict with the rider weight and a dataframe
+            with segment information, target power and expected duration per rider
+            name, e.g. from `plan_roster_segments`.
+    """
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        entry_names = set()
+        for stage, df in stages.items():
+            folder = _file_name(stage)
+            for rider, (weight_rider, segments_df) in rider_plans[stage].items():
+                base_name = f"{folder}/{_file_name(f'{stage} {rider}')}"
+                entry_name, suffix = base_name, 1
+                while entry_name.lower() in entry_names:
+                    suffix += 1
+                    entry_name = f"{base_name} ({suffix})"
+                entry_names.add(entry_name.lower())
+
+                with archive.open(f"{entry_name}.gpx", "w") as entry:
+                    with io.TextIOWrapper(entry, encoding="utf-8") as text:
+                        write_route_gpx(
+                            text,
+                            df,
+                            segments_df,
+                            name=f"{stage} {rider}",
+                            weight_rider=weight_rider,
+                        )
+
+
+def _segment_waypoints(
+    df: pd.DataFrame, segments_df: pd.DataFrame, weight_rider: float = None
+) -> list:
+    """Format a gpx waypoint at the start of every segment.
+
+    The start points are looked up in the route distance with `np.searchsorted`. The
+    comment is the short text head units show next to the name, the description has
+    the full segment plan.
+    """
+    distance = df["distance"].to_numpy(dtype=float)
+    start_idx = np.clip(
+        np.searchsorted(
+            distance, segments_df["start point (km)"].to_numpy(dtype=float)
+        ),
+        0,
+        len(df) - 1,
+    )
+    latitude = df["latitude"].to_numpy(dtype=float)[start_idx]
+    longitude = df["longitude"].to_numpy(dtype=float)[start_idx]
+    elevation = df["elevation"].to_numpy(dtype=float)[start_idx]
+
+    waypoints = []
+    for i, row in enumerate(segments_df.to_dict("records")):
+        comment = [f"{row['average slope (%)']:.1f}%"]
+        description = [
+            f"{row['segment distance (km)']:.1f} km at "
+            f"{row['average slope (%)']:.1f}%"
+        ]
+        if pd.notna(row.get("relative power (w/kg)")):
+            relative_power = row["relative power (w/kg)"]
+            comment.append(f"{relative_power:.1f} W/kg")
+            target = f"target {relative_power:.2f} W/kg"
+            if weight_rider is not None:
+                target += f" ({relative_power * weight_rider:.0f} W)"
+            description.append(target)
+        if pd.notna(row.get("duration (s)")):
+            duration = format_duration(row["duration (s)"])
+            comment.append(duration)
+            description.append(f"expected {duration}")
+
+        elevation_tag = (
+            "" if np.isnan(elevation[i]) else f"<ele>{elevation[i]:.1f}</ele>"
+        )
+        waypoints.append(
+            f'<wpt lat="{latitude[i]:.7f}" lon="{longitude[i]:.7f}">'
+            f"{elevation_tag}<name>{escape(str(row['segment']))}</name>"
+            f"<cmt>{escape(' '.join(comment))}</cmt>"
+            f"<desc>{escape(', '.join(description))}</desc>"
+            f"<type>segment</type></wpt>\n"
+        )
+
+    return waypoints
+
+
+def _file_name(name) -> str:
+    """Replace the characters of a name that are not safe in a file name."""
+    file_name = UNSAFE_FILE_NAME_CHARACTERS.sub("_", str(name)).strip(" .")
+    return file_name or "_"
@@ -0,0 +1,179 @@
+"""Code to generate segments with an optimal piecewise-linear elevation fit."""
+
+import numpy as np
+import pandas as pd
+
+
+def generate_optimal_segments(
+    df: pd.DataFrame,
+    penalty: float = 10000.0,
+    min_length_km: float = 1.0,
+    resample_m: float = 100.0,
+) -> list:
+    """Split the route where a piecewise-linear elevation profile fits best.
+
+    The smoothed elevation is resampled to a regular distance grid and segmented by
+    minimizing the squared error of a straight line per segment plus `penalty` per
+    segment, subject to a minimum segment length. The optimum is found with a
+    dynamic programme with PELT pruning, which runs in near-linear time. Unlike
+    `generate_segments`, this can split a climb where its gradient changes without a
+    local extremum.
+
+    Args:
+        df: Dataframe with gpx data.
+        penalty: Cost of adding a segment, in squared meters of elevation error.
+        min_length_km: Minimum length of a segment in km.
+        resample_m: Grid spacing in meters used for the fit.
+
+    Returns:
+        list: list of defined segments, in the same format as `generate_segments`.
+    """
+    distance = df["distance"].to_numpy(dtype=float)
+    elevation = df["elevation"].to_numpy(dtype=float)
+
+    grid = np.arange(0, distance[-1] * 1000, resample_m) / 1000
+    grid_elevation = _interpolate_finite(
+        grid, distance, df["smoothed_elevation"].to_numpy(dtype=float)
+    )
+    min_size = max(int(round(min_length_km * 1000 / resample_m)), 2)
+
+    change_points = _pelt(grid, grid_elevation, penalty=penalty, min_size=min_size)
+
+    # Map the grid boundaries back to route points
+    boundaries = np.append(grid[change_points], distance[-1])
+    boundary_idx = np.unique(
+        np.searchsorted(distance, boundaries).clip(0, len(distance) - 1)
+    )
+    boundary_idx[0] = 0
+    boundary_idx[-1] = len(distance) - 1
+
+    segments = []
+    for start_idx, end_idx in zip(boundary_idx[:-1], boundary_idx[1:]):
+        segment_distance = distance[end_idx] - distance[start_idx]
+        start_elevation = elevation[start_idx]
+        end_elevation = elevation[end_idx]
+        segments.append(
+            {
+                "start_idx": start_idx,
+                "end_idx": end_idx,
+                "start_elevation": start_elevation,
+                "end_elevation": end_elevation,
+                "segment_distance": segment_distance,
+                "average_slope": (
+                    (end_elevation - start_elevation) / (segment_distance * 1000) * 100
+                ),
+            }
+        )
+
+    return segments
+
+
+def compute_fit_error(df: pd.DataFrame, segments: list) -> float:
+    """Compute how well a segmentation describes the elevation profile.
+
+    Every segment is fitted with a least-squares line over its route points.
+
+    Args:
+        df: Dataframe with gpx data.
+        segments: List of generated segments.
+
+    Returns:
+        float: Root mean squared elevation error in meters.
+    """
+    distance = df["distance"].to_numpy(dtype=float)
+    elevation = _interpolate_finite(
+        distance, distance, df["elevation"].to_numpy(dtype=float)
+    )
+    cost = _LinearFitCost(distance, elevation)
+
+    squared_error = sum(
+        cost(np.array([segment["start_idx"]]), segment["end_idx"] + 1)[0]
+        for segment in segments
+    )
+    num_points = segments[-1]["end_idx"] + 1 - segments[0]["start_idx"]
+    return float(np.sqrt(max(squared_error, 0) / num_points))
+
+
+def _interpolate_finite(x: np.ndarray, xp: np.ndarray, fp: np.ndarray) -> np.ndarray:
+    """Interpolate values at `x`, skipping points without a finite value.
+
+    Args:
+        x: Positions to interpolate at.
+        xp: Positions of the values.
+        fp: Values, possibly with missing (NaN) values.
+
+    Returns:
+        np.ndarray: Interpolated values.
+    """
+    finite = np.isfinite(fp)
+    return np.interp(x, xp[finite], fp[finite])
+
+
+def _pelt(x: np.ndarray, y: np.ndarray, penalty: float, min_size: int) -> np.ndarray:
+    """Find the optimal change points of a piecewise-linear fit with PELT.
+
+    Args:
+        x: Sample positions.
+        y: Sample values.
+        penalty: Cost per segment.
+        min_size: Minimum number of samples per segment.
+
+    Returns:
+        np.ndarray: Start position of every segment, beginning with 0.
+    """
+    num_samples = len(x)
+    if num_samples < 2 * min_size:
+        return np.array([0])
+
+    cost = _LinearFitCost(x, y)
+    total_cost = np.full(num_samples + 1, np.inf)
+    total_cost[0] = -penalty
+    previous_change = np.zeros(num_samples + 1, dtype=int)
+    candidates = np.array([0])
+
+    for end in range(min_size, num_samples + 1):
+        candidate_costs = total_cost[candidates] + cost(candidates, end)
+        best = candidate_costs.argmin()
+        total_cost[end] = candidate_costs[best] + penalty
+        previous_change[end] = candidates[best]
+
+        # Prune candidates that can never be optimal again
+        candidates = candidates[candidate_costs <= total_cost[end]]
+        if end + 1 - min_size >= min_size:
+            candidates = np.append(candidates, end + 1 - min_size)
+
+    change_points = []
+    end = num_samples
+    while end > 0:
+        end = previous_change[end]
+        change_points.append(end)
+
+    return np.array(change_points[::-1])
+
+
+class _LinearFitCost:
+    """Squared error of a least-squares line over any range of samples in O(1)."""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray):
+        # Center the data to keep the prefix sums numerically stable
+        x = x - x.mean()
+        y = y - y.mean()
+        zero = np.zeros(1)
+        self._n = np.arange(len(x) + 1, dtype=float)
+        self._x = np.concatenate([zero, np.cumsum(x)])
+        self._y = np.concatenate([zero, np.cumsum(y)])
+        self._xx = np.concatenate([zero, np.cumsum(x * x)])
+        self._xy = np.concatenate([zero, np.cumsum(x * y)])
+        self._yy = np.concatenate([zero, np.cumsum(y * y)])
+
+    def __call__(self, start: np.ndarray, end: int) -> np.ndarray:
+        """Squared error of samples [start, end) for every start."""
+        n = self._n[end] - self._n[start]
+        sx = self._x[end] - self._x[start]
+        sy = self._y[end] - self._y[start]
+        sxx = self._xx[end] - self._xx[start] - sx * sx / n
+        sxy = self._xy[end] - self._xy[start] - sx * sy / n
+        syy = self._yy[end] - self._yy[start] - sy * sy / n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            explained = np.where(sxx > 0, sxy * sxy / sxx, 0)
+        return syy - explained
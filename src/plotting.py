@@ -1,35 +1,45 @@
 """Code with plotting functions for visualization."""
 
+from typing import TYPE_CHECKING
+
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
+
+from src.route_index import RouteIndex
+
+# Plotly is imported in the functions that use it, so importing this module is cheap
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
 
 
 # Plot map
 def plot_map(
-    df: pd.DataFrame, segments_df: pd.DataFrame, selected_stage: str
-) -> go.Figure:
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    selected_stage: str,
+    route_index: RouteIndex = None,
+) -> "go.Figure":
     """Plot map of stage.
 
     Args:
         df: Dataframe with gpx data.
+        segments_df: Dataframe with generated segment information.
         selected_stage: Number id of stage selected in sidebar
+        route_index: Index on the route points, built from `df` if not specified.
 
     Returns:
         Figure: Plotly figure with route of stage on a map.
     """
+    import plotly.express as px
+    import plotly.graph_objs as go
+
+    from src.figure_payload import CompactFigure
+
     map_fig = px.scatter_mapbox(
         df,
         title=f"<b>📍 {selected_stage}",
         lat="latitude",
         lon="longitude",
-        hover_data={
-            "distance": ":.2f",
-            "latitude": ":.2f",
-            "longitude": ":.2f",
-            "elevation": ":, m",
-        },
         height=800,
         width=1200,
         zoom=8,
@@ -37,13 +47,21 @@ def plot_map(
         color_continuous_scale="YlOrRd",
         template="plotly_dark",
     )
+    # Hover on the trace's own coordinates and colors, only the distance is extra
+    map_fig.update_traces(
+        customdata=df["distance"],
+        hovertemplate="latitude=%{lat:.2f}<br>longitude=%{lon:.2f}<br>"
+        "distance=%{customdata:.2f}<br>elevation=%{marker.color:, m}<extra></extra>",
+    )
     map_fig.update_layout(margin=dict(l=0, b=0), mapbox_style="carto-positron")
 
-    segments_coordinates_df = segments_df.merge(
-        df, left_on="start point (km)", right_on="distance"
-    ).drop_duplicates("segment")
-    segments_coordinates_df["segment_id"] = (
-        segments_coordinates_df["segment"].str.split(" ").str[1]
+    if route_index is None:
+        route_index = RouteIndex(df)
+    start_idx = route_index.index_at_km(segments_df["start point (km)"])
+    segments_coordinates_df = segments_df.assign(
+        latitude=route_index.latitude[start_idx],
+        longitude=route_index.longitude[start_idx],
+        segment_id=segments_df["segment"].str.split(" ").str[1],
     )
 
     segment_indicator_fig = px.scatter_mapbox(
@@ -62,6 +80,7 @@ def plot_map(
         marker=go.scattermapbox.Marker(color="slategrey", size=17, opacity=1.0),
     )
 
+    map_fig = CompactFigure(map_fig)
     map_fig.add_trace(segment_indicator_fig.data[0])
 
     return map_fig
@@ -91,7 +110,7 @@ def plot_map(
 #     return elevation_fig
 
 
-def plot_segments(df: pd.DataFrame, segments: list) -> go.Figure:
+def plot_segments(df: pd.DataFrame, segments: list) -> "go.Figure":
     """Plot elevation profile with generated segments.
 
     Args:
@@ -101,7 +120,11 @@ def plot_segments(df: pd.DataFrame, segments: list) -> go.Figure:
     Returns:
         Figure: Plotly figure with segment visualization.
     """
-    fig = go.Figure()
+    import plotly.graph_objs as go
+
+    from src.figure_payload import CompactFigure
+
+    fig = CompactFigure()
 
     fig.add_trace(
         go.Scatter(
@@ -123,12 +146,14 @@ def plot_segments(df: pd.DataFrame, segments: list) -> go.Figure:
     )
 
     # Add segment markers
-    for i, segment in enumerate(segments):
-        start_idx = segment["start_idx"]
-        fig.add_trace(
+    start_idx = np.array([segment["start_idx"] for segment in segments], dtype=int)
+    start_distance = df["distance"].to_numpy()[start_idx]
+    start_elevation = df["elevation"].to_numpy()[start_idx]
+    fig.add_traces(
+        [
             go.Scatter(
-                x=[df["distance"].iloc[start_idx]],
-                y=[df["elevation"].iloc[start_idx]],
+                x=[x_value],
+                y=[y_value],
                 mode="markers+text",
                 name=f"segment {i+1}",
                 text=f"{i+1}<br>{segment['average_slope']:.1f}%",
@@ -140,15 +165,24 @@ def plot_segments(df: pd.DataFrame, segments: list) -> go.Figure:
                     line=dict(width=1, color="white"),
                 ),
             )
-        )
-        fig.add_shape(
-            type="line",
-            x0=df["distance"].iloc[start_idx],
-            x1=df["distance"].iloc[start_idx],
-            y0=0,
-            y1=df["elevation"].iloc[start_idx],
-            line=dict(color="#ffe103", width=1, dash="dot"),
-        )
+            for i, (segment, x_value, y_value) in enumerate(
+                zip(segments, start_distance.tolist(), start_elevation.tolist())
+            )
+        ]
+    )
+    fig.update_layout(
+        shapes=[
+            dict(
+                type="line",
+                x0=x_value,
+                x1=x_value,
+                y0=0,
+                y1=y_value,
+                line=dict(color="#ffe103", width=1, dash="dot"),
+            )
+            for x_value, y_value in zip(start_distance, start_elevation)
+        ]
+    )
 
     num_segments = len(segments)
     fig.update_layout(
@@ -167,21 +201,30 @@ def plot_segments(df: pd.DataFrame, segments: list) -> go.Figure:
     return fig
 
 
-def plot_glycogen(df: pd.DataFrame) -> go.Figure:
+def plot_glycogen(df: pd.DataFrame) -> "go.Figure":
     """Plot KPI profile with fatigue and failure thresholds.
 
     Args:
-        df: Dataframe with gpx data.
+        df: Dataframe with the glycogen level per segment, or per route point with a
+            "distance" column.
 
     Returns:
         Figure: Plotly figure with KPI visualization.
     """
+    import plotly.graph_objs as go
+
+    # Glycogen level per route point or at the start of every segment
+    if "distance" in df:
+        x_values, x_end = df["distance"], df["distance"].max()
+    else:
+        x_values, x_end = df["start point (km)"], df["end point (km)"].max()
+
     fig = go.Figure()
 
     # KPI plot
     fig.add_trace(
         go.Scatter(
-            x=df["start point (km)"],
+            x=x_values,
             y=df["glycogen level (%)"],
             mode="lines",
             name="glycogen level (%)",
@@ -193,7 +236,7 @@ def plot_glycogen(df: pd.DataFrame) -> go.Figure:
     # Add horizontal lines for fatigue and failure thresholds
     fig.add_trace(
         go.Scatter(
-            x=[df["start point (km)"].min(), df["end point (km)"].max()],
+            x=[x_values.min(), x_end],
             y=[35, 35],
             mode="lines",
             line=dict(color="orange", width=2, dash="dash"),
@@ -203,7 +246,7 @@ def plot_glycogen(df: pd.DataFrame) -> go.Figure:
     )
     fig.add_trace(
         go.Scatter(
-            x=[df["start point (km)"].min(), df["end point (km)"].max()],
+            x=[x_values.min(), x_end],
             y=[10, 10],
             mode="lines",
             line=dict(color="red", width=2, dash="dash"),
@@ -215,7 +258,7 @@ def plot_glycogen(df: pd.DataFrame) -> go.Figure:
     return fig
 
 
-def plot_elevation_only(df: pd.DataFrame) -> go.Scatter:
+def plot_elevation_only(df: pd.DataFrame) -> "go.Scatter":
     """Create a transparent elevation trace for overlay.
 
     Args:
@@ -224,6 +267,8 @@ def plot_elevation_only(df: pd.DataFrame) -> go.Scatter:
     Returns:
         Scatter: Plotly scatter trace with elevation visualization.
     """
+    import plotly.graph_objs as go
+
     return go.Scatter(
         x=df["distance"],
         y=df["elevation"],
@@ -238,14 +283,19 @@ def plot_elevation_only(df: pd.DataFrame) -> go.Scatter:
 
 
 def combine_plots(
-    df: pd.DataFrame, segments: list, segments_df: pd.DataFrame
-) -> go.Figure:
+    df: pd.DataFrame,
+    segments: list,
+    segments_df: pd.DataFrame,
+    glycogen_df: pd.DataFrame = None,
+) -> "go.Figure":
     """Combine elevation and glycogen plots into one figure with transparent background for the elevation plot.
 
     Args:
         df: Dataframe with elevation data.
         segments: List of segments for elevation data.
         segments_df: Dataframe with glycogen data.
+        glycogen_df: Dataframe with the glycogen level per route point, e.g. from
+            `compute_route_glycogen`, used instead of the levels in `segments_df`.
 
     Returns:
         Figure: Plotly figure with combined visualization.
@@ -260,10 +310,15 @@ def combine_plots(
     Returns:
         Figure: Plotly figure with combined visualization.
     """
+    from plotly.subplots import make_subplots
+
+    from src.figure_payload import CompactFigure
+
     elevation_trace = plot_elevation_only(df)
-    glycogen_fig = plot_glycogen(segments_df)
+    glycogen_df = segments_df if glycogen_df is None else glycogen_df
+    glycogen_fig = plot_glycogen(glycogen_df)
 
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig = CompactFigure(make_subplots(specs=[[{"secondary_y": True}]]))
 
     # Add glycogen trace
     for trace in glycogen_fig["data"]:
@@ -273,26 +328,33 @@ def combine_plots(
     fig.add_trace(elevation_trace, secondary_y=True)
 
     # Add vertical segment separation lines
-    for segment in segments:
-        start_idx = segment["start_idx"]
-        x_value = df["distance"].iloc[start_idx]
-        y_value = df["elevation"].iloc[start_idx]
-        fig.add_shape(
-            type="line",
-            x0=x_value,
-            x1=x_value,
-            y0=0,
-            y1=y_value,
-            yref="y2",
-            line=dict(color="rgba(255, 255, 255, 0.4)", width=1, dash="dot"),
-        )
+    start_idx = np.array([segment["start_idx"] for segment in segments], dtype=int)
+    fig.update_layout(
+        shapes=[
+            dict(
+                type="line",
+                x0=x_value,
+                x1=x_value,
+                y0=0,
+                y1=y_value,
+                yref="y2",
+                line=dict(color="rgba(255, 255, 255, 0.4)", width=1, dash="dot"),
+            )
+            for x_value, y_value in zip(
+                df["distance"].to_numpy()[start_idx],
+                df["elevation"].to_numpy()[start_idx],
+            )
+        ]
+    )
 
     fig.update_layout(
         title="🏔️ Glycogen Depletion with Fatigue and Failure Thresholds",
         xaxis_title="distance (km)",
         yaxis=dict(
-            title="glycogen level (%)", side="left", range=[0, 100]
-        ),  # Ensure y-axis starts at 0
+            title="glycogen level (%)",
+            side="left",
+            range=[min(0, glycogen_df["glycogen level (%)"].min()), 100],
+        ),  # Ensure y-axis starts at 0, or lower when W' is overdrawn
         yaxis2=dict(
             title="elevation (m)",
             side="right",
@@ -309,3 +371,244 @@ def combine_plots(
     )
 
     return fig
+
+
+def plot_marginal_gains(
+    df: pd.DataFrame, sensitivity_df: pd.DataFrame, column: str
+) -> "go.Figure":
+    """Plot the time saved per segment as bars over the elevation profile.
+
+    Args:
+        df: Dataframe with elevation data.
+        sensitivity_df: Dataframe from `compute_sensitivities`.
+        column: Time saved column to plot.
+
+    Returns:
+        Figure: Plotly figure with the time saved per segment.
+    """
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
+
+    from src.figure_payload import CompactFigure
+
+    start = sensitivity_df["start point (km)"].to_numpy(dtype=float)
+    end = sensitivity_df["end point (km)"].to_numpy(dtype=float)
+
+    fig = CompactFigure(make_subplots(specs=[[{"secondary_y": True}]]))
+    fig.add_trace(
+        go.Bar(
+            x=(start + end) / 2,
+            y=sensitivity_df[column],
+            width=end - start,
+            name=column,
+            marker_color="#1f77b4",
+            customdata=sensitivity_df["segment"],
+            hovertemplate="segment %{customdata}<br>%{y:.1f} s<extra></extra>",
+        ),
+        secondary_y=False,
+    )
+    fig.add_trace(plot_elevation_only(df), secondary_y=True)
+
+    fig.update_layout(
+        title=f"💡 {column} per segment",
+        xaxis_title="distance (km)",
+        yaxis=dict(title=column, side="left"),
+        yaxis2=dict(
+            title="elevation (m)",
+            side="right",
+            range=[0, df["elevation"].max()],
+            showgrid=False,
+        ),
+        xaxis=dict(range=[0, df["distance"].max()]),
+        template="plotly_dark",
+        height=500,
+        showlegend=False,
+    )
+
+    return fig
+
+
+def plot_scenario_comparison(scenarios: dict) -> "go.Figure":
+    """Plot cumulative time and glycogen levels of several scenarios.
+
+    Args:
+        scenarios: Dataframes with segment information per scenario name.
+
+    Returns:
+        Figure: Plotly figure with one line per scenario in each subplot.
+    """
+    import plotly.express as px
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(
+        rows=2,
+        cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.08,
+        subplot_titles=("⏱️ Elapsed time", "🏔️ Glycogen level"),
+    )
+
+    colors = px.colors.qualitative.Plotly
+    for i, (name, segments_df) in enumerate(scenarios.items()):
+        color = colors[i % len(colors)]
+        if "duration (s)" in segments_df.columns:
+            fig.add_trace(
+                go.Scatter(
+                    x=segments_df["end point (km)"],
+                    y=segments_df["duration (s)"].cumsum() / 3600,
+                    mode="lines+markers",
+                    name=name,
+                    legendgroup=name,
+                    line_color=color,
+                ),
+                row=1,
+                col=1,
+            )
+        if "glycogen level (%)" in segments_df.columns:
+            fig.add_trace(
+                go.Scatter(
+                    x=segments_df["start point (km)"],
+                    y=segments_df["glycogen level (%)"],
+                    mode="lines",
+                    name=name,
+                    legendgroup=name,
+                    showlegend="duration (s)" not in segments_df.columns,
+                    line_color=color,
+                ),
+                row=2,
+                col=1,
+            )
+
+    fig.update_layout(
+        template="plotly_dark",
+        height=800,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+    )
+    fig.update_yaxes(title_text="elapsed time (h)", row=1, col=1)
+    fig.update_yaxes(title_text="glycogen level (%)", range=[0, 100], row=2, col=1)
+    fig.update_xaxes(title_text="distance (km)", row=2, col=1)
+
+    return fig
+
+
+def plot_ride_comparison(comparisons: dict) -> "go.Figure":
+    """Plot the time difference and glycogen level of recorded rides against the plan.
+
+    Args:
+        comparisons: Dataframes from `compare_ride` per rider name.
+
+    Returns:
+        Figure: Plotly figure with one line per rider in each subplot and the planned
+            glycogen level as a dashed line.
+    """
+    import plotly.express as px
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
+
+    from src.figure_payload import CompactFigure
+
+    fig = CompactFigure(
+        make_subplots(
+            rows=2,
+            cols=1,
+            shared_xaxes=True,
+            vertical_spacing=0.08,
+            subplot_titles=("⏱️ Time difference with the plan", "🏔️ Glycogen level"),
+        )
+    )
+
+    colors = px.colors.qualitative.Plotly
+    for i, (name, comparison_df) in enumerate(comparisons.items()):
+        color = colors[i % len(colors)]
+        fig.add_trace(
+            go.Scatter(
+                x=comparison_df["end point (km)"],
+                y=comparison_df["time difference (s)"].cumsum(skipna=False) / 60,
+                mode="lines+markers",
+                name=name,
+                legendgroup=name,
+                line_color=color,
+            ),
+            row=1,
+            col=1,
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=comparison_df["end point (km)"],
+                y=comparison_df["actual glycogen level (%)"],
+                mode="lines",
+                name=name,
+                legendgroup=name,
+                showlegend=False,
+                line_color=color,
+            ),
+            row=2,
+            col=1,
+        )
+
+    if comparisons:
+        comparison_df = next(iter(comparisons.values()))
+        fig.add_trace(
+            go.Scatter(
+                x=comparison_df["end point (km)"],
+                y=comparison_df["planned glycogen level (%)"],
+                mode="lines",
+                name="plan",
+                line=dict(color="white", dash="dash"),
+            ),
+            row=2,
+            col=1,
+        )
+
+    fig.update_layout(
+        template="plotly_dark",
+        height=800,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+    )
+    fig.update_yaxes(title_text="time difference (min)", row=1, col=1)
+    fig.update_yaxes(title_text="glycogen level (%)", row=2, col=1)
+    fig.update_xaxes(title_text="distance (km)", row=2, col=1)
+
+    return fig
+
+
+def plot_roster_glycogen(
+    glycogen_df: pd.DataFrame, segments_df: pd.DataFrame
+) -> "go.Figure":
+    """Plot the glycogen level of every rider in the roster.
+
+    Args:
+        glycogen_df: Dataframe with one row per rider and one column per segment.
+        segments_df: Dataframe with segment information.
+
+    Returns:
+        Figure: Plotly figure with one glycogen line per rider.
+    """
+    import plotly.graph_objs as go
+
+    from src.figure_payload import CompactFigure
+
+    fig = CompactFigure()
+    for rider, glycogen in glycogen_df.iterrows():
+        fig.add_trace(
+            go.Scatter(
+                x=segments_df["start point (km)"],
+                y=glycogen.to_numpy(),
+                mode="lines",
+                name=rider,
+            )
+        )
+
+    fig.add_hline(y=35, line=dict(color="orange", width=2, dash="dash"))
+    fig.add_hline(y=10, line=dict(color="red", width=2, dash="dash"))
+    fig.update_layout(
+        title="🏔️ Glycogen level per rider",
+        xaxis_title="distance (km)",
+        yaxis=dict(title="glycogen level (%)", range=[0, 100]),
+        template="plotly_dark",
+        height=600,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+    )
+
+    return fig
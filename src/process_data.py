@@ -1,20 +1,42 @@
 """Code to parse and process .gpx data into a dataframe."""
 
 import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
 
-import gpxpy
 import numpy as np
 import pandas as pd
-from scipy.ndimage import gaussian_filter1d
+
+from src.generate_segments import create_segments_dataframe, generate_segments
+from src.optimal_segmentation import generate_optimal_segments
+
+# gpxpy and scipy are imported in the functions that use them
+if TYPE_CHECKING:
+    import gpxpy
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s 🚴‍♂️ %(message)s",
-)
 
+EARTH_RADIUS_M = 6378137.0  # Same as gpxpy
+SMOOTHING_SIGMA = 2  # Gaussian smoothing of the elevation, in points
+STAGE_DIRECTORY = Path("data/tdf")  # TDF stages as stage-<number>-route.gpx
+# Default parameters of `segment_route`, e.g. for the API and the benchmarks
+SEGMENTATION_PARAMETERS = {
+    "method": "peaks and valleys",
+    "window_size_km": 2.0,
+    "min_slope_diff": 1.5,
+    "penalty": 10000.0,
+}
+
+
+def configure_logging() -> None:
+    """Log info messages of the app, called once by the entry point."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s 🚴‍♂️ %(message)s",
+    )
 
-def read_gpx_file(path: str) -> gpxpy.gpx.GPX:
+
+def read_gpx_file(path: str) -> "gpxpy.gpx.GPX":
     """Read a gpx file from a specified path.
 
     Args:
@@ -25,12 +47,26 @@ def read_gpx_file(path: str) -> gpxpy.gpx.GPX:
     """
     logger.info(f"Reading gpx file from path: {path}")
     with open(path, "r") as gpx_file:
-        gpx_file = gpxpy.parse(gpx_file)
+        gpx_file = parse_gpx_file(gpx_file)
 
     return gpx_file
 
 
-def create_dataframe(gpx_file: gpxpy.gpx.GPX) -> pd.DataFrame:
+def parse_gpx_file(file) -> "gpxpy.gpx.GPX":
+    """Parse a gpx file from an open file or string, e.g. an uploaded file.
+
+    Args:
+        file: File object or string with gpx data.
+
+    Returns:
+        gpxpy.gpx.GPX: gpx file object.
+    """
+    import gpxpy
+
+    return gpxpy.parse(file)
+
+
+def create_dataframe(gpx_file: "gpxpy.gpx.GPX") -> pd.DataFrame:
     """Create a pandas DataFrame from the gpx file.
 
     Also calculates the distance between each point, the elevation difference, and
@@ -42,61 +78,184 @@ def create_dataframe(gpx_file: gpxpy.gpx.GPX) -> pd.DataFrame:
     Returns:
         pd.DataFrame: Dataframe with gpx data.
     """
-    logger.info("Parsing gpx file to a pandas DataFrame.")
-
-    route_info = []
-    for track in gpx_file.tracks:
-        for segment in track.segments:
-            for point in segment.points:
-                route_info.append(
-                    {
-                        "latitude": point.latitude,
-                        "longitude": point.longitude,
-                        "elevation": point.elevation,
-                    }
-                )
-    df = pd.DataFrame(route_info)
-
-    df["distance"] = np.nan
-    total_distance = 0
-    for i in range(1, len(df)):
-        prev_point = (df.at[i - 1, "latitude"], df.at[i - 1, "longitude"])
-        curr_point = (df.at[i, "latitude"], df.at[i, "longitude"])
-        distance = gpxpy.geo.haversine_distance(
-            prev_point[0], prev_point[1], curr_point[0], curr_point[1]
-        )
-        total_distance += distance
-        df.at[i, "distance"] = total_distance / 1000  # Convert to kilometers
-    df.loc[0, "distance"] = 0
+    from scipy.ndimage import gaussian_filter1d
 
-    df["elevation_diff"] = df["elevation"].diff()
-    df.loc[0, "elevation_diff"] = 0
+    logger.info("Parsing gpx file to a pandas DataFrame.")
 
-    df["gradient"] = 0.0
-    for i in range(1, len(df)):
-        elevation_diff = df.at[i, "elevation"] - df.at[i - 1, "elevation"]
-        # Convert back to meters for gradient calculation
-        distance_diff = (df.at[i, "distance"] - df.at[i - 1, "distance"]) * 1000
-        df.at[i, "gradient"] = _calculate_gradient(elevation_diff, distance_diff)
+    route_info = np.array(
+        [
+            (point.latitude, point.longitude, point.elevation)
+            for track in gpx_file.tracks
+            for segment in track.segments
+            for point in segment.points
+        ],
+        dtype=float,
+    ).reshape(-1, 3)
+    columns, _ = compute_route_columns(
+        latitude=route_info[:, 0],
+        longitude=route_info[:, 1],
+        elevation=route_info[:, 2],
+    )
+    df = pd.DataFrame(columns)
 
     # Smooth the elevation data
-    df["smoothed_elevation"] = gaussian_filter1d(df["elevation"], sigma=2)
+    df["smoothed_elevation"] = gaussian_filter1d(df["elevation"], sigma=SMOOTHING_SIGMA)
 
     logger.info(f"DataFrame shape: {df.shape}")
 
     return df
 
 
-def _calculate_gradient(elevation_diff, distance_diff) -> float:
-    """Calculate the gradient between two points.
+def compute_route_columns(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    elevation: np.ndarray,
+    start_distance_m: float = 0.0,
+) -> tuple:
+    """Compute the distance, elevation difference and gradient of route points.
+
+    Distances between points are great-circle distances with the same formula and
+    earth radius as `gpxpy.geo.haversine_distance`, accumulated in meters and
+    converted to km. A chunk of a route is continued by passing the last point of
+    the previous chunk as the first point, with the distance returned for the
+    previous chunk as `start_distance_m`, and dropping the first row of the result.
+
+    Args:
+        latitude: Latitude of every point in degrees.
+        longitude: Longitude of every point in degrees.
+        elevation: Elevation of every point in m.
+        start_distance_m: Distance of the first point in m.
+
+    Returns:
+        tuple: Columns of the dataframe with gpx data without the smoothed elevation,
+            and the distance of the last point in m.
+    """
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    elevation = np.asarray(elevation, dtype=float)
+
+    # Haversine distance between consecutive points, in m
+    d_lon = np.radians(longitude[:-1] - longitude[1:])
+    latitude_1 = np.radians(latitude[:-1])
+    latitude_2 = np.radians(latitude[1:])
+    d_lat = latitude_1 - latitude_2
+    a = np.sin(d_lat / 2) ** 2 + np.sin(d_lon / 2) ** 2 * np.cos(latitude_1) * np.cos(
+        latitude_2
+    )
+    step_distance_m = EARTH_RADIUS_M * (2 * np.arcsin(np.sqrt(a)))
+
+    total_distance_m = np.cumsum(np.concatenate([[start_distance_m], step_distance_m]))
+    distance = total_distance_m / 1000  # Convert to kilometers
+
+    elevation_diff = np.concatenate([[0.0], np.diff(elevation)])
+
+    # Convert back to meters for gradient calculation, 0 between identical points
+    distance_diff = np.diff(distance) * 1000
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gradient = np.where(
+            distance_diff == 0, 0.0, (elevation_diff[1:] / distance_diff) * 100
+        )
+
+    columns = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "elevation": elevation,
+        "distance": distance,
+        "elevation_diff": elevation_diff,
+        "gradient": np.concatenate([[0.0], gradient]),
+    }
+    return columns, total_distance_m[-1]
+
+
+def iter_gpx_points(file, chunk_points: int = 100_000) -> Iterator[tuple]:
+    """Read the track points of a gpx file in chunks, without loading the whole file.
+
+    Points are read in the same order as `create_dataframe` reads them from a parsed
+    gpx file, every point is released once it is read, so memory is bounded by the
+    chunk size.
 
     Args:
-        elevation_diff: Difference in elevation between two points.
-        distance_diff: Difference in distance between two points.
+        file: Path or file object of the gpx file.
+        chunk_points: Number of points per chunk.
+
+    Yields:
+        tuple: Latitude, longitude and elevation of the points of a chunk.
+    """
+    chunk = []
+    for element in iter_track_points(file):
+        # Elevation in the namespace of the track point
+        elevation = element.findtext(element.tag[: -len("trkpt")] + "ele")
+        chunk.append(
+            (
+                float(element.get("lat")),
+                float(element.get("lon")),
+                float(elevation) if elevation else np.nan,
+            )
+        )
+
+        if len(chunk) == chunk_points:
+            yield tuple(np.array(chunk, dtype=float).T)
+            chunk = []
+
+    if chunk:
+        yield tuple(np.array(chunk, dtype=float).T)
+
+
+def iter_track_points(file) -> Iterator:
+    """Iterate over the track point elements of a gpx file in order.
+
+    Every element is removed from its track segment once the caller moves on to the
+    next one, so the parsed tree never holds more than one point.
+
+    Args:
+        file: Path or file object of the gpx file.
+
+    Yields:
+        xml.etree.ElementTree.Element: Complete track point element.
+    """
+    from xml.etree.ElementTree import iterparse
+
+    parent = None
+    for event, element in iterparse(file, events=("start", "end")):
+        if event == "start":
+            if element.tag.endswith("trkseg"):
+                parent = element
+            continue
+        if not element.tag.endswith("trkpt"):
+            continue
+
+        yield element
+        parent.remove(element)
+
+
+def segment_route(
+    df: pd.DataFrame,
+    method: str = "peaks and valleys",
+    window_size_km: float = 2.0,
+    min_slope_diff: float = 1.5,
+    penalty: float = 10000.0,
+) -> pd.DataFrame:
+    """Segment a route with one of the segmentation methods of the app.
+
+    Args:
+        df: Dataframe with gpx data.
+        method: "peaks and valleys" or "optimal piecewise linear".
+        window_size_km: Minimum segment length in km.
+        min_slope_diff: Minimum slope difference in %, for peaks and valleys.
+        penalty: Cost of adding a segment, for optimal piecewise linear.
 
     Returns:
-        float: Computed gradient between two points.
+        pd.DataFrame: Dataframe with segment information.
     """
-    if distance_diff == 0:
-        return 0
-    return (elevation_diff / distance_diff) * 100
+    if method == "peaks and valleys":
+        segments = generate_segments(
+            df=df, window_size_km=window_size_km, min_slope_diff=min_slope_diff
+        )
+    elif method == "optimal piecewise linear":
+        segments = generate_optimal_segments(
+            df=df, penalty=penalty, min_length_km=window_size_km
+        )
+    else:
+        raise ValueError(f"Unknown segmentation method: {method}")
+
+    return create_segments_dataframe(df=df, segments=segments)
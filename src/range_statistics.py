@@ -0,0 +1,258 @@
+"""Code to compute statistics over arbitrary ranges of a route."""
+
+import numpy as np
+import pandas as pd
+
+from src.route_index import RouteIndex
+
+BOUNDARY_TOLERANCE_KM = 1e-6  # Rounding of segment boundaries at the route ends
+
+
+class RangeStatistics:
+    """Index that answers statistics for any [start km, end km] range of a route.
+
+    Sums (distance, climbing, descending) come from prefix sums and extremes
+    (elevation, rolling gradient) from sparse tables, so every query takes a
+    `searchsorted` to find the boundary points and O(1) work after that. Queries are
+    vectorized over arrays of ranges.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        gradient_window_km: float = 0.5,
+        route_index: RouteIndex = None,
+    ):
+        """Build the index.
+
+        Args:
+            df: Dataframe with gpx data.
+            gradient_window_km: Window length in km for the max rolling gradient.
+            route_index: Index on the route points, built from `df` if not specified.
+        """
+        self.gradient_window_km = gradient_window_km
+        self.route_index = RouteIndex(df) if route_index is None else route_index
+        self.distance = self.route_index.distance
+        self.elevation = df["elevation"].to_numpy(dtype=float)
+
+        elevation_diff = np.diff(self.elevation, prepend=self.elevation[0])
+        self._climbing = np.cumsum(np.maximum(elevation_diff, 0))
+        self._descending = np.cumsum(np.maximum(-elevation_diff, 0))
+
+        # Gradient of the window that starts at every point, on the smoothed profile
+        smoothed_elevation = df["smoothed_elevation"].to_numpy(dtype=float)
+        window_gain = (
+            np.interp(
+                self.distance + gradient_window_km, self.distance, smoothed_elevation
+            )
+            - smoothed_elevation
+        )
+        window_length_km = np.minimum(
+            gradient_window_km, self.distance[-1] - self.distance
+        )
+        self.window_gradient = (
+            np.divide(
+                window_gain,
+                window_length_km * 1000,
+                out=np.zeros_like(window_gain),
+                where=window_length_km > 0,
+            )
+            * 100
+        )
+
+        self._min_elevation = _build_sparse_table(self.elevation, np.minimum)
+        self._max_elevation = _build_sparse_table(self.elevation, np.maximum)
+        self._max_gradient = _build_sparse_table(self.window_gradient, np.maximum)
+
+    def query(self, start_km, end_km) -> pd.DataFrame:
+        """Compute the statistics of one or more ranges.
+
+        Args:
+            start_km: Start point(s) of the ranges in km.
+            end_km: End point(s) of the ranges in km.
+
+        Returns:
+            pd.DataFrame: Dataframe with the statistics of every range.
+        """
+        start_idx = np.atleast_1d(self.route_index.index_at_km(start_km))
+        end_idx = np.atleast_1d(self.route_index.index_at_km(end_km))
+        end_idx = np.maximum(start_idx, end_idx)
+
+        segment_distance = self.distance[end_idx] - self.distance[start_idx]
+        start_elevation = self.elevation[start_idx]
+        end_elevation = self.elevation[end_idx]
+        net_climbing = end_elevation - start_elevation
+        average_slope = (
+            np.divide(
+                net_climbing,
+                segment_distance * 1000,
+                out=np.zeros_like(net_climbing),
+                where=segment_distance > 0,
+            )
+            * 100
+        )
+
+        # Windows that fit in the range, or the first point if the range is shorter
+        last_window_idx = (
+            np.searchsorted(
+                self.distance,
+                self.distance[end_idx] - self.gradient_window_km,
+                side="right",
+            )
+            - 1
+        )
+        last_window_idx = np.maximum(last_window_idx, start_idx)
+        max_slope = np.where(
+            segment_distance >= self.gradient_window_km,
+            _query_sparse_table(
+                self._max_gradient, start_idx, last_window_idx, np.maximum
+            ),
+            average_slope,
+        )
+
+        return pd.DataFrame(
+            {
+                "start point (km)": self.distance[start_idx],
+                "end point (km)": self.distance[end_idx],
+                "segment distance (km)": segment_distance,
+                "start elevation (m)": start_elevation,
+                "end elevation (m)": end_elevation,
+                "net climbing (m)": net_climbing,
+                "total climbing (m)": self._climbing[end_idx]
+                - self._climbing[start_idx],
+                "total descending (m)": self._descending[end_idx]
+                - self._descending[start_idx],
+                "average slope (%)": average_slope,
+                "max slope (%)": max_slope,
+                "min elevation (m)": _query_sparse_table(
+                    self._min_elevation, start_idx, end_idx, np.minimum
+                ),
+                "max elevation (m)": _query_sparse_table(
+                    self._max_elevation, start_idx, end_idx, np.maximum
+                ),
+            }
+        )
+
+
+def update_segment_statistics(
+    segments_df: pd.DataFrame,
+    range_statistics: RangeStatistics,
+    previous_df: pd.DataFrame = None,
+) -> pd.DataFrame:
+    """Recompute the statistics of segments from their start and end points.
+
+    Used for segments that were added or edited by hand. Only rows that are new or
+    whose start or end point differs from the same row of `previous_df` are
+    recomputed, all rows if it is not given. Rows without both a start and an end
+    point, or with boundaries that `check_segment_boundaries` flags, are left as they
+    are instead of being clamped to the route.
+
+    Args:
+        segments_df: Dataframe with segment information.
+        range_statistics: Range statistics index of the route.
+        previous_df: Dataframe with segment information before the edits.
+
+    Returns:
+        pd.DataFrame: Dataframe with recomputed segment information.
+    """
+    segments_df = segments_df.copy()
+    boundary_columns = ["start point (km)", "end point (km)"]
+    update = segments_df[boundary_columns].notna().all(
+        axis=1
+    ).to_numpy() & ~check_segment_boundaries(segments_df, range_statistics)
+    if previous_df is not None:
+        previous = previous_df[boundary_columns].reindex(segments_df.index)
+        update &= (
+            (previous.isna() | previous.ne(segments_df[boundary_columns]))
+            .any(axis=1)
+            .to_numpy()
+        )
+
+    if update.any():
+        statistics_df = range_statistics.query(
+            segments_df.loc[update, "start point (km)"].to_numpy(dtype=float),
+            segments_df.loc[update, "end point (km)"].to_numpy(dtype=float),
+        )
+        for column in [
+            "start elevation (m)",
+            "end elevation (m)",
+            "segment distance (km)",
+            "average slope (%)",
+        ]:
+            segments_df.loc[update, column] = statistics_df[column].to_numpy()
+
+    missing_name = segments_df["segment"].isna().to_numpy()
+    segments_df.loc[missing_name, "segment"] = [
+        f"segment {i+1}" for i in np.flatnonzero(missing_name)
+    ]
+
+    return segments_df
+
+
+def check_segment_boundaries(
+    segments_df: pd.DataFrame, range_statistics: RangeStatistics
+) -> np.ndarray:
+    """Flag segments with boundaries outside the route or an end before the start.
+
+    Such segments come from mistyped edits or from a segment table of another route.
+    Rows without both a start and an end point are not flagged.
+
+    Args:
+        segments_df: Dataframe with segment information.
+        range_statistics: Range statistics index of the route.
+
+    Returns:
+        np.ndarray: True for every segment with invalid boundaries.
+    """
+    start_km = segments_df["start point (km)"].to_numpy(dtype=float)
+    end_km = segments_df["end point (km)"].to_numpy(dtype=float)
+    route_km = range_statistics.distance[-1] + BOUNDARY_TOLERANCE_KM
+    with np.errstate(invalid="ignore"):
+        return (
+            (start_km < -BOUNDARY_TOLERANCE_KM)
+            | (end_km > route_km)
+            | (end_km <= start_km)
+        )
+
+
+def _build_sparse_table(values: np.ndarray, function) -> np.ndarray:
+    """Build a sparse table for idempotent range queries (min or max).
+
+    Row k holds `function` over the 2^k values that start at every position.
+
+    Args:
+        values: Values to index.
+        function: `np.minimum` or `np.maximum`.
+
+    Returns:
+        np.ndarray: Sparse table with one row per power of two.
+    """
+    num_levels = max(int(np.log2(len(values))) + 1, 1)
+    table = np.empty((num_levels, len(values)))
+    table[0] = values
+    for k in range(1, num_levels):
+        half = 1 << (k - 1)
+        table[k] = table[k - 1]
+        table[k, : len(values) - half] = function(
+            table[k - 1, : len(values) - half], table[k - 1, half:]
+        )
+
+    return table
+
+
+def _query_sparse_table(
+    table: np.ndarray, start_idx: np.ndarray, end_idx: np.ndarray, function
+) -> np.ndarray:
+    """Query a sparse table for the inclusive ranges [start_idx, end_idx].
+
+    Args:
+        table: Sparse table from `_build_sparse_table`.
+        start_idx: First position of every range.
+        end_idx: Last position of every range.
+        function: The function the table was built with.
+
+    Returns:
+        np.ndarray: `function` over the values of every range.
+    """
+    level = np.log2(end_idx - start_idx + 1).astype(int)
+    return function(table[level, start_idx], table[level, end_idx - (1 << level) + 1])
@@ -0,0 +1,542 @@
+"""Code to persist routes, segments and strategies in a local SQLite database."""
+
+import contextlib
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Versions of the processing in the route and segmentation keys, so results of older
+# code are not served after it changes
+ROUTE_VERSION = 1  # Bump when `create_dataframe` changes the processed route
+SEGMENTATION_VERSION = 1  # Bump when a segmentation method changes its segments
+ROUTE_COLUMNS = (
+    "latitude",
+    "longitude",
+    "elevation",
+    "distance",
+    "elevation_diff",
+    "gradient",
+    "smoothed_elevation",
+)
+STRATEGY_COLUMNS = (
+    "strategy_id",
+    "name",
+    "stage",
+    "rider",
+    "route_id",
+    "semi_draft_point",
+    "full_draft_point",
+    "weight_rider",
+    "cda_full",
+    "cda_semi",
+    "cda_none",
+    "average_speed_flat",
+    "average_speed_down",
+    "finish_time_s",
+    "final_glycogen_level",
+    "min_glycogen_level",
+    "parameters",
+    "segments_df",
+    "created_at",
+)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS routes (
+    route_id TEXT PRIMARY KEY,
+    source_hash TEXT,
+    stage TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    distance_km REAL,
+    elevation_gain_m REAL,
+    min_elevation_m REAL,
+    max_elevation_m REAL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS routes_source_hash ON routes (source_hash);
+CREATE INDEX IF NOT EXISTS routes_stage ON routes (stage);
+
+CREATE TABLE IF NOT EXISTS segmentations (
+    route_id TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    segments TEXT NOT NULL,
+    segments_df BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (route_id, parameters)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS strategies (
+    strategy_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    rider TEXT NOT NULL,
+    route_id TEXT,
+    semi_draft_point REAL,
+    full_draft_point REAL,
+    weight_rider REAL,
+    cda_full REAL,
+    cda_semi REAL,
+    cda_none REAL,
+    average_speed_flat REAL,
+    average_speed_down REAL,
+    finish_time_s REAL,
+    final_glycogen_level REAL,
+    min_glycogen_level REAL,
+    parameters TEXT NOT NULL,
+    segments_df BLOB,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS strategies_rider_stage_time
+    ON strategies (rider, stage, finish_time_s);
+CREATE INDEX IF NOT EXISTS strategies_stage_time ON strategies (stage, finish_time_s);
+CREATE INDEX IF NOT EXISTS strategies_draft_points
+    ON strategies (semi_draft_point, full_draft_point);
+"""
+
+
+class ResultsStore:
+    """Local SQLite store for processed routes, segmentations and strategies.
+
+    Routes and segmentations are keyed by a hash of their content and parameters, so
+    re-opening a stage or a segmentation is a primary key lookup instead of a
+    recompute. The keys include `ROUTE_VERSION` and `SEGMENTATION_VERSION`, so
+    bumping them makes the store process routes and segmentations again. Strategies
+    keep their parameters and results in indexed columns for queries over all stages
+    and riders, and their full segment table for reloading.
+
+    Writes of strategies are batched: they are buffered and written in a single
+    transaction when `batch_size` is reached, at the end of a `batch()` block or on
+    `flush()`. Reads flush first, so they always see earlier writes. The store can
+    be shared between threads.
+    """
+
+    def __init__(self, path: str = "data/results.db", batch_size: int = 256):
+        """Open (or create) the store.
+
+        Args:
+            path: Path of the database file, ":memory:" for a temporary store.
+            batch_size: Number of buffered strategies that triggers a write.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._batch_depth = 0
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Write the buffered strategies and close the database."""
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Buffer all strategy writes of the block and write them in one transaction."""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered strategies."""
+        with self._lock:
+            if not self._pending:
+                return
+            with self._connection:
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO strategies ({', '.join(STRATEGY_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(STRATEGY_COLUMNS))})",
+                    self._pending,
+                )
+            self._pending = []
+
+    def save_route(self, df: pd.DataFrame, stage: str, source_hash: str = None) -> str:
+        """Save a processed route with its summary.
+
+        Args:
+            df: Dataframe with gpx data.
+            stage: Name of the stage, or "custom gpx".
+            source_hash: Hash of the gpx data the route was processed from, to look
+                it up before processing, see `hash_source`.
+
+        Returns:
+            str: Route id, the hash of the route points.
+        """
+        route_id = hash_route(df)
+        data = io.BytesIO()
+        np.savez(data, **{column: df[column].to_numpy() for column in ROUTE_COLUMNS})
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    route_id,
+                    source_hash,
+                    stage,
+                    len(df),
+                    float(df["distance"].max()),
+                    float(df["elevation_diff"].clip(lower=0).sum()),
+                    float(df["elevation"].min()),
+                    float(df["elevation"].max()),
+                    data.getvalue(),
+                    time.time(),
+                ),
+            )
+
+        return route_id
+
+    def load_route(self, route_id: str = None, source_hash: str = None) -> pd.DataFrame:
+        """Load a processed route by its id or by the hash of its gpx data.
+
+        Returns:
+            pd.DataFrame: Dataframe with gpx data, or None if it is not stored.
+        """
+        if route_id is not None:
+            row = self._fetch_one(
+                "SELECT data FROM routes WHERE route_id = ?", (route_id,)
+            )
+        else:
+            row = self._fetch_one(
+                "SELECT data FROM routes WHERE source_hash = ?", (source_hash,)
+            )
+        if row is None:
+            return None
+
+        with np.load(io.BytesIO(row[0])) as data:
+            return pd.DataFrame({column: data[column] for column in ROUTE_COLUMNS})
+
+    def route_summaries(self, stage: str = None) -> pd.DataFrame:
+        """List the stored routes, optionally of a single stage."""
+        query = (
+            "SELECT route_id, stage, points, distance_km, elevation_gain_m, "
+            "min_elevation_m, max_elevation_m, created_at FROM routes"
+        )
+        if stage is not None:
+            return self._read(query + " WHERE stage = ?", (stage,))
+        return self._read(query + " ORDER BY length(stage), stage")
+
+    def save_segments(
+        self,
+        route_id: str,
+        parameters: dict,
+        segments: list,
+        segments_df: pd.DataFrame,
+    ) -> None:
+        """Save the segmentation of a route.
+
+        Args:
+            route_id: Id of the route.
+            parameters: Segmentation method and parameters.
+            segments: List of generated segments.
+            segments_df: Dataframe with generated segment information.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO segmentations VALUES (?, ?, ?, ?, ?)",
+                (
+                    route_id,
+                    _segmentation_key(parameters),
+                    _to_json(segments),
+                    _dataframe_to_bytes(segments_df),
+                    time.time(),
+                ),
+            )
+
+    def load_segments(self, route_id: str, parameters: dict) -> tuple:
+        """Load the segmentation of a route.
+
+        Returns:
+            tuple: List of segments and dataframe with segment information, or None
+                if the segmentation is not stored.
+        """
+        row = self._fetch_one(
+            "SELECT segments, segments_df FROM segmentations "
+            "WHERE route_id = ? AND parameters = ?",
+            (route_id, _segmentation_key(parameters)),
+        )
+        if row is None:
+            return None
+        return json.loads(row[0]), _dataframe_from_bytes(row[1])
+
+    def save_strategy(
+        self,
+        stage: str,
+        name: str,
+        segments_df: pd.DataFrame,
+        rider: str = "rider",
+        route_id: str = None,
+        parameters: dict = None,
+        finish_time_s: float = None,
+        final_glycogen_level: float = None,
+        min_glycogen_level: float = None,
+        store_segments: bool = True,
+    ) -> str:
+        """Buffer a strategy for writing.
+
+        The strategy id is a hash of the stage, rider and name only, so saving again
+        under the same stage, rider and name overwrites the earlier strategy, also
+        when its parameters differ. Save under another name to keep both.
+
+        Results that are not given are taken from the duration and glycogen columns of
+        the segments, if present.
+
+        Args:
+            stage: Name of the stage.
+            name: Name of the strategy.
+            segments_df: Dataframe with segment information of the strategy.
+            rider: Name of the rider.
+            route_id: Id of the route the strategy was made on.
+            parameters: Drafting points, rider stats, speeds and segmentation
+                parameters of the strategy.
+            finish_time_s: Total time in seconds.
+            final_glycogen_level: Glycogen level at the finish in %.
+            min_glycogen_level: Lowest glycogen level in %.
+            store_segments: Store the segment table to reload the strategy.
+
+        Returns:
+            str: Strategy id.
+        """
+        parameters = parameters or {}
+        rider_stats = parameters.get("rider_stats", {})
+        cda_values = rider_stats.get("cda_values", {})
+        if finish_time_s is None and "duration (s)" in segments_df.columns:
+            finish_time_s = float(segments_df["duration (s)"].sum())
+        if "glycogen level (%)" in segments_df.columns:
+            glycogen_level = segments_df["glycogen level (%)"]
+            if final_glycogen_level is None:
+                final_glycogen_level = float(glycogen_level.iloc[-1])
+            if min_glycogen_level is None:
+                min_glycogen_level = float(glycogen_level.min())
+
+        strategy_id = _hash(_to_json([stage, rider, name]))
+        row = (
+            strategy_id,
+            name,
+            stage,
+            rider,
+            route_id,
+            _round(parameters.get("semi_draft_point")),
+            _round(parameters.get("full_draft_point")),
+            rider_stats.get("weight_rider"),
+            cda_values.get("full"),
+            cda_values.get("semi"),
+            cda_values.get("none"),
+            parameters.get("average_speed_flat"),
+            parameters.get("average_speed_down"),
+            finish_time_s,
+            final_glycogen_level,
+            min_glycogen_level,
+            _to_json(parameters),
+            _dataframe_to_bytes(segments_df) if store_segments else None,
+            time.time(),
+        )
+        with self._lock:
+            self._pending.append(row)
+            if self._batch_depth == 0 or len(self._pending) >= self.batch_size:
+                self.flush()
+
+        return strategy_id
+
+    def load_strategy(self, strategy_id: str) -> tuple:
+        """Load a strategy.
+
+        Returns:
+            tuple: Summary of the strategy as a dict (with its parameters) and the
+                dataframe with segment information, or None if it is not stored.
+        """
+        strategies_df = self._read(
+            f"SELECT {', '.join(STRATEGY_COLUMNS)} FROM strategies "
+            "WHERE strategy_id = ?",
+            (strategy_id,),
+        )
+        if strategies_df.empty:
+            return None
+
+        strategy = strategies_df.iloc[0].to_dict()
+        segments_data = strategy.pop("segments_df")
+        strategy["parameters"] = json.loads(strategy["parameters"])
+        segments_df = (
+            None if segments_data is None else _dataframe_from_bytes(segments_data)
+        )
+        return strategy, segments_df
+
+    def delete_strategy(self, strategy_id: str) -> None:
+        with self._lock:
+            self.flush()
+            with self._connection:
+                self._connection.execute(
+                    "DELETE FROM strategies WHERE strategy_id = ?", (strategy_id,)
+                )
+
+    def find_strategies(
+        self,
+        stage: str = None,
+        rider: str = None,
+        semi_draft_point: float = None,
+        full_draft_point: float = None,
+        max_finish_time_s: float = None,
+        limit: int = None,
+    ) -> pd.DataFrame:
+        """Find strategies, fastest first.
+
+        For example all strategies with a semi draft point of 0.6:
+        `find_strategies(semi_draft_point=0.6)`.
+
+        Args:
+            stage: Only strategies of this stage.
+            rider: Only strategies of this rider.
+            semi_draft_point: Only strategies with this semi draft point.
+            full_draft_point: Only strategies with this full draft point.
+            max_finish_time_s: Only strategies at most this fast, in seconds.
+            limit: Maximum number of strategies to return.
+
+        Returns:
+            pd.DataFrame: Dataframe with the summary of every strategy.
+        """
+        conditions, values = [], []
+        for column, value in [
+            ("stage", stage),
+            ("rider", rider),
+            ("semi_draft_point", _round(semi_draft_point)),
+            ("full_draft_point", _round(full_draft_point)),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if max_finish_time_s is not None:
+            conditions.append("finish_time_s <= ?")
+            values.append(max_finish_time_s)
+
+        query = f"SELECT {', '.join(STRATEGY_COLUMNS[:-3])}, created_at FROM strategies"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY finish_time_s"
+        if limit is not None:
+            query += " LIMIT ?"
+            values.append(limit)
+
+        return self._read(query, tuple(values))
+
+    def best_finish_times(self, rider: str) -> pd.DataFrame:
+        """Find the fastest strategy of a rider on every stage.
+
+        Args:
+            rider: Name of the rider.
+
+        Returns:
+            pd.DataFrame: Dataframe with one row per stage.
+        """
+        # SQLite takes the other columns from the row with the minimum
+        return self._read(
+            "SELECT stage, MIN(finish_time_s) AS finish_time_s, strategy_id, name, "
+            "semi_draft_point, full_draft_point, final_glycogen_level "
+            "FROM strategies WHERE rider = ? AND finish_time_s IS NOT NULL "
+            "GROUP BY stage ORDER BY length(stage), stage",
+            (rider,),
+        )
+
+    def riders(self) -> list:
+        """List the riders with stored strategies."""
+        rows = self._fetch_all("SELECT DISTINCT rider FROM strategies ORDER BY rider")
+        return [row[0] for row in rows]
+
+    def _fetch_one(self, query: str, values: tuple = ()) -> tuple:
+        with self._lock:
+            self.flush()
+            return self._connection.execute(query, values).fetchone()
+
+    def _fetch_all(self, query: str, values: tuple = ()) -> list:
+        with self._lock:
+            self.flush()
+            return self._connection.execute(query, values).fetchall()
+
+    def _read(self, query: str, values: tuple = ()) -> pd.DataFrame:
+        with self._lock:
+            self.flush()
+            return pd.read_sql_query(query, self._connection, params=values)
+
+
+def hash_route(df: pd.DataFrame) -> str:
+    """Hash the points of a processed route and the route version."""
+    digest = hashlib.blake2b(f"route {ROUTE_VERSION}".encode(), digest_size=16)
+    for column in ("latitude", "longitude", "elevation"):
+        digest.update(np.ascontiguousarray(df[column].to_numpy(dtype=float)).data)
+    return digest.hexdigest()
+
+
+def hash_source(data) -> str:
+    """Hash the gpx data (text or bytes) a route is processed from and the route
+    version."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    digest = hashlib.blake2b(f"route {ROUTE_VERSION}".encode(), digest_size=16)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _segmentation_key(parameters: dict) -> str:
+    """Key of a segmentation of a route: its parameters and the segmentation version."""
+    return _to_json({"parameters": parameters, "version": SEGMENTATION_VERSION})
+
+
+def _round(value: float) -> float:
+    """Round draft points, so 0.5 + 0.1 is stored and queried as 0.6."""
+    return None if value is None else round(float(value), 6)
+
+
+def _to_json(value) -> str:
+    """Encode as canonical JSON, with numpy scalars as Python numbers."""
+    return json.dumps(
+        value,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=lambda item: item.item() if isinstance(item, np.generic) else str(item),
+    )
+
+
+def _dataframe_to_bytes(df: pd.DataFrame) -> bytes:
+    """Encode a dataframe exactly: typed columns as arrays, object columns as JSON."""
+    arrays, objects = {}, {}
+    for i, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        if values.dtype == object:
+            objects[str(i)] = values.tolist()
+        else:
+            arrays[str(i)] = values
+    metadata = _to_json({"columns": list(df.columns), "objects": objects})
+
+    data = io.BytesIO()
+    np.savez(data, metadata=np.array(metadata), **arrays)
+    return data.getvalue()
+
+
+def _dataframe_from_bytes(data: bytes) -> pd.DataFrame:
+    with np.load(io.BytesIO(data)) as arrays:
+        metadata = json.loads(str(arrays["metadata"]))
+        return pd.DataFrame(
+            {
+                column: (
+                    np.array(metadata["objects"][str(i)], dtype=object)
+                    if str(i) in metadata["objects"]
+                    else arrays[str(i)]
+                )
+                for i, column in enumerate(metadata["columns"])
+            }
+        )
@@ -0,0 +1,476 @@
+"""Code to ingest recorded rides and compare them with the planned segments.
+
+Recorded rides are gpx files with a timestamp and a power extension per track point,
+or csv files with the same fields, typically at 1 Hz for several hours. They are
+read into columns and processed with the same vectorized pipeline as the routes, so
+a ride has the same distance, elevation and gradient columns as a route, plus the
+elapsed time and power.
+
+A ride is aligned to the planned segments by cumulative distance: the boundaries of
+the segments are looked up in the cumulative distance of the ride with
+`np.searchsorted`, and the elapsed time, work and glycogen level at every boundary
+are interpolated between the two ride points around it.
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from xml.etree.ElementTree import ParseError
+
+import numpy as np
+import pandas as pd
+
+from src.glycogen_model import (
+    CRITICAL_POWER_WKG,
+    W_PRIME_JKG,
+    compute_w_prime_balance,
+)
+from src.process_data import SMOOTHING_SIGMA, compute_route_columns, iter_track_points
+
+logger = logging.getLogger(__name__)
+
+# Local names of power extensions, e.g. <power> of Strava and Wahoo exports and
+# <gpxpx:PowerInWatts> of the Garmin power extension
+POWER_TAGS = ("power", "powerinwatts", "watts")
+# Accepted csv column names per field, compared in lower case
+CSV_COLUMNS = {
+    "latitude": ("latitude", "lat", "position_lat"),
+    "longitude": ("longitude", "lon", "lng", "position_long"),
+    "elevation": ("elevation", "altitude", "ele", "enhanced_altitude"),
+    "time": ("time", "timestamp", "secs", "seconds"),
+    "power": ("power", "watts"),
+}
+COMPARISON_COLUMNS = [
+    "segment",
+    "start point (km)",
+    "end point (km)",
+    "planned duration (s)",
+    "actual duration (s)",
+    "time difference (s)",
+    "planned power (W)",
+    "actual power (W)",
+    "power difference (W)",
+    "planned glycogen level (%)",
+    "actual glycogen level (%)",
+    "glycogen difference (%)",
+]
+
+
+def read_ride(file, file_type: str = None) -> pd.DataFrame:
+    """Read a recorded ride from a gpx or csv file.
+
+    Args:
+        file: Path, file object or bytes of the ride file.
+        file_type: "gpx" or "csv", taken from the file name if not specified.
+
+    Returns:
+        pd.DataFrame: Dataframe with gpx data, the elapsed time and the power.
+    """
+    if file_type is None:
+        file_type = Path(getattr(file, "name", str(file))).suffix.lstrip(".").lower()
+    if isinstance(file, bytes):
+        file = BytesIO(file)
+
+    if file_type == "gpx":
+        return read_ride_gpx(file)
+    if file_type == "csv":
+        return read_ride_csv(file)
+    raise ValueError(f"Unknown ride file type: {file_type}")
+
+
+def read_ride_gpx(file) -> pd.DataFrame:
+    """Read a recorded ride from a gpx file with timestamps and power extensions.
+
+    The file is streamed point by point, the fields are collected into columns and
+    the timestamps are parsed in one vectorized call.
+
+    Args:
+        file: Path or file object of the gpx file.
+
+    Returns:
+        pd.DataFrame: Dataframe with gpx data, the elapsed time and the power.
+    """
+    logger.info("Reading recorded ride from gpx file.")
+    points = []
+    times = []
+    try:
+        for element in iter_track_points(file):
+            namespace = element.tag[: -len("trkpt")]
+            latitude, longitude = element.get("lat"), element.get("lon")
+            if latitude is None or longitude is None:
+                raise ValueError(
+                    "The gpx file has track points without a latitude or longitude"
+                )
+            elevation = element.findtext(namespace + "ele")
+            power = next(
+                (
+                    child.text
+                    for child in element.iter()
+                    if child.tag.rsplit("}", 1)[-1].lower() in POWER_TAGS
+                ),
+                None,
+            )
+            points.append(
+                (
+                    float(latitude),
+                    float(longitude),
+                    float(elevation) if elevation else np.nan,
+                    float(power) if power else np.nan,
+                )
+            )
+            times.append(element.findtext(namespace + "time"))
+    except ParseError as error:
+        # Truncated or malformed uploads, reported per file like the other errors
+        raise ValueError(f"The gpx file could not be parsed: {error}") from error
+
+    if not points:
+        raise ValueError("The gpx file has no track points")
+    if None in times:
+        raise ValueError("The gpx file has track points without a timestamp")
+
+    latitude, longitude, elevation, power = np.array(points, dtype=float).T
+    return create_ride_dataframe(
+        latitude=latitude,
+        longitude=longitude,
+        elevation=elevation,
+        time=_elapsed_seconds(times),
+        power=power,
+    )
+
+
+def read_ride_csv(file) -> pd.DataFrame:
+    """Read a recorded ride from a csv file.
+
+    The file needs latitude, longitude, time and power columns and can have an
+    elevation column, under any of the names of `CSV_COLUMNS`. Times are timestamps
+    or seconds.
+
+    Args:
+        file: Path or file object of the csv file.
+
+    Returns:
+        pd.DataFrame: Dataframe with gpx data, the elapsed time and the power.
+    """
+    logger.info("Reading recorded ride from csv file.")
+    csv_df = pd.read_csv(file)
+    columns = {column.strip().lower(): column for column in csv_df.columns}
+    fields = {}
+    for field, names in CSV_COLUMNS.items():
+        column = next((columns[name] for name in names if name in columns), None)
+        if column is not None:
+            fields[field] = csv_df[column]
+
+    missing = [
+        field
+        for field in ["latitude", "longitude", "time", "power"]
+        if field not in fields
+    ]
+    if missing:
+        raise ValueError(f"The csv file has no {', '.join(missing)} column")
+
+    return create_ride_dataframe(
+        latitude=fields["latitude"].to_numpy(dtype=float),
+        longitude=fields["longitude"].to_numpy(dtype=float),
+        elevation=(
+            fields["elevation"].to_numpy(dtype=float)
+            if "elevation" in fields
+            else np.full(len(csv_df), np.nan)
+        ),
+        time=_elapsed_seconds(fields["time"]),
+        power=pd.to_numeric(fields["power"], errors="coerce").to_numpy(dtype=float),
+    )
+
+
+def create_ride_dataframe(
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    elevation: np.ndarray,
+    time: np.ndarray,
+    power: np.ndarray,
+) -> pd.DataFrame:
+    """Create the dataframe of a ride with the same columns as `create_dataframe`.
+
+    Args:
+        latitude: Latitude of every point in degrees.
+        longitude: Longitude of every point in degrees.
+        elevation: Elevation of every point in m.
+        time: Elapsed time of every point in s.
+        power: Power of every point in W, NaN where it was not recorded.
+
+    Returns:
+        pd.DataFrame: Dataframe with gpx data, the elapsed time and the power.
+    """
+    from scipy.ndimage import gaussian_filter1d
+
+    columns, _ = compute_route_columns(latitude, longitude, elevation)
+    df = pd.DataFrame(columns)
+    df["smoothed_elevation"] = gaussian_filter1d(df["elevation"], sigma=SMOOTHING_SIGMA)
+    df["time (s)"] = time
+    df["power (W)"] = power
+
+    logger.info(f"DataFrame shape: {df.shape}")
+    return df
+
+
+def compare_ride(
+    ride_df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    rider_stats: dict,
+    match_distance: bool = True,
+    critical_power_wkg: float = CRITICAL_POWER_WKG,
+    w_prime_jkg: float = W_PRIME_JKG,
+    glycogen_start_level: float = 100,
+) -> pd.DataFrame:
+    """Compare a recorded ride with the planned segments.
+
+    The ride is aligned to the segments by cumulative distance. The actual power of
+    a segment is its work divided by its duration, the power of a point is held over
+    the interval before it and missing power counts as 0 W. Planned and actual
+    glycogen levels both come from the W' balance model, per segment for the plan
+    and per recorded point for the ride.
+
+    Args:
+        ride_df: Dataframe returned by `read_ride`.
+        segments_df: Dataframe with segment information, "relative power (w/kg)" and
+            "duration (s)" columns, e.g. from the segment analysis page.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        match_distance: Scale the ride distance to the planned route distance, which
+            removes the drift between the recorded and planned distance. Turn off
+            for rides that did not finish the route.
+        critical_power_wkg: Critical power in W/kg.
+        w_prime_jkg: Energy available above critical power in J/kg.
+        glycogen_start_level: Glycogen level at the start in %.
+
+    Returns:
+        pd.DataFrame: Dataframe with the planned and actual duration, power and
+            glycogen level at the end of every segment, NaN for segments the ride
+            did not reach.
+    """
+    weight_rider = rider_stats["weight_rider"]
+    critical_power = critical_power_wkg * weight_rider
+    w_prime = w_prime_jkg * weight_rider
+
+    # Planned power and glycogen level at the end of every segment
+    planned_duration = segments_df["duration (s)"].to_numpy(dtype=float)
+    planned_power = (
+        segments_df["relative power (w/kg)"].to_numpy(dtype=float) * weight_rider
+    )
+    planned_glycogen = compute_w_prime_balance(
+        planned_power,
+        planned_duration,
+        critical_power=critical_power,
+        w_prime=w_prime,
+        glycogen_start_level=glycogen_start_level,
+    )[1:]
+
+    # Work and glycogen level at every ride point, power held over the step before
+    distance = np.maximum.accumulate(ride_df["distance"].to_numpy(dtype=float))
+    elapsed_time = ride_df["time (s)"].to_numpy(dtype=float)
+    step_power = np.nan_to_num(ride_df["power (W)"].to_numpy(dtype=float)[1:])
+    step_duration = np.diff(elapsed_time)
+    work = np.concatenate([[0.0], np.cumsum(step_power * step_duration)])
+    glycogen_level = compute_w_prime_balance(
+        step_power,
+        step_duration,
+        critical_power=critical_power,
+        w_prime=w_prime,
+        glycogen_start_level=glycogen_start_level,
+    )
+
+    start_km = segments_df["start point (km)"].to_numpy(dtype=float)
+    end_km = segments_df["end point (km)"].to_numpy(dtype=float)
+    if match_distance and distance[-1] > 0:
+        # The ride ends exactly at the end of the route, despite rounding
+        distance = np.minimum(distance * (end_km[-1] / distance[-1]), end_km[-1])
+        distance[-1] = end_km[-1]
+    boundaries = np.concatenate([start_km[:1], end_km])
+    boundary_time, boundary_work, boundary_glycogen = _interpolate_at_distance(
+        distance, boundaries, elapsed_time, work, glycogen_level
+    )
+
+    actual_duration = np.diff(boundary_time)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        actual_power = np.diff(boundary_work) / actual_duration
+    actual_glycogen = boundary_glycogen[1:]
+
+    comparison_df = pd.DataFrame(
+        {
+            "segment": segments_df["segment"].to_numpy(),
+            "start point (km)": start_km,
+            "end point (km)": end_km,
+            "planned duration (s)": planned_duration,
+            "actual duration (s)": actual_duration,
+            "time difference (s)": actual_duration - planned_duration,
+            "planned power (W)": planned_power,
+            "actual power (W)": actual_power,
+            "power difference (W)": actual_power - planned_power,
+            "planned glycogen level (%)": planned_glycogen,
+            "actual glycogen level (%)": actual_glycogen,
+            "glycogen difference (%)": actual_glycogen - planned_glycogen,
+        },
+        columns=COMPARISON_COLUMNS,
+    )
+    return comparison_df
+
+
+def compare_team_rides(
+    rides: dict,
+    segments_df: pd.DataFrame,
+    rider_stats,
+    workers: int = 4,
+    executor: str = "process",
+    **kwargs,
+) -> dict:
+    """Read and compare the ride files of a team with the plan in parallel.
+
+    Args:
+        rides: Ride file per rider name, as a path or as bytes with the file type
+            taken from the key, e.g. {"rider 1.gpx": b"..."}.
+        segments_df: Dataframe with the planned segments, see `compare_ride`.
+        rider_stats: Rider stats for all riders, or a dict with the rider stats per
+            rider name.
+        workers: Number of workers of the pool.
+        executor: "process" or "thread" worker pool. Reading gpx files is pure
+            Python, so only processes read several files at the same time.
+        **kwargs: Further arguments of `compare_ride`.
+
+    Returns:
+        dict: Comparison dataframe per rider name, in the order of `rides`, or the
+            error message of a file that could not be read.
+    """
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers)
+    elif executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        raise ValueError(f"Unknown executor: {executor}")
+
+    with pool:
+        futures = {
+            name: pool.submit(
+                _compare_ride_file,
+                file,
+                name,
+                segments_df,
+                rider_stats if "weight_rider" in rider_stats else rider_stats[name],
+                kwargs,
+            )
+            for name, file in rides.items()
+        }
+        comparisons = {}
+        for name, future in futures.items():
+            try:
+                comparisons[name] = future.result()
+            except Exception as error:
+                # A bad file must not take down the comparison of the whole team
+                logger.warning(f"Could not compare ride {name}: {error}")
+                comparisons[name] = str(error)
+
+    return comparisons
+
+
+def summarize_team_rides(comparisons: dict) -> pd.DataFrame:
+    """Summarize the comparisons of a team, one row per rider.
+
+    Args:
+        comparisons: Comparison dataframe per rider, from `compare_team_rides`.
+
+    Returns:
+        pd.DataFrame: Planned and actual total duration, average power and final
+            glycogen level per rider, over the segments the rider reached.
+    """
+    rows = {}
+    for name, comparison_df in comparisons.items():
+        if not isinstance(comparison_df, pd.DataFrame):
+            continue
+        reached = comparison_df[comparison_df["actual duration (s)"].notna()]
+        planned_duration = reached["planned duration (s)"].sum()
+        actual_duration = reached["actual duration (s)"].sum()
+        rows[name] = {
+            "segments": f"{len(reached)}/{len(comparison_df)}",
+            "planned duration (s)": planned_duration,
+            "actual duration (s)": actual_duration,
+            "time difference (s)": actual_duration - planned_duration,
+            "planned power (W)": (
+                reached["planned power (W)"] * reached["planned duration (s)"]
+            ).sum()
+            / planned_duration,
+            "actual power (W)": (
+                reached["actual power (W)"] * reached["actual duration (s)"]
+            ).sum()
+            / actual_duration,
+            "planned glycogen level (%)": (
+                reached["planned glycogen level (%)"].iloc[-1]
+                if len(reached)
+                else np.nan
+            ),
+            "actual glycogen level (%)": (
+                reached["actual glycogen level (%)"].iloc[-1]
+                if len(reached)
+                else np.nan
+            ),
+        }
+
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def _compare_ride_file(
+    file, name: str, segments_df: pd.DataFrame, rider_stats: dict, kwargs: dict
+) -> pd.DataFrame:
+    """Read a ride file and compare it with the plan, run by the worker pool."""
+    file_type = (
+        Path(name).suffix.lstrip(".").lower() if isinstance(file, bytes) else None
+    )
+    ride_df = read_ride(file, file_type=file_type)
+    return compare_ride(ride_df, segments_df, rider_stats, **kwargs)
+
+
+def _elapsed_seconds(time) -> np.ndarray:
+    """Convert timestamps or seconds to seconds elapsed since the first point."""
+    time = pd.Series(time)
+    if pd.api.types.is_numeric_dtype(time):
+        seconds = time.to_numpy(dtype=float)
+    else:
+        timestamps = pd.to_datetime(time, utc=True, format="ISO8601")
+        seconds = (timestamps - timestamps.iloc[0]).dt.total_seconds().to_numpy()
+    return seconds - seconds[0]
+
+
+def _interpolate_at_distance(
+    distance: np.ndarray, query: np.ndarray, *values: np.ndarray
+) -> list:
+    """Interpolate values of the ride points at distances along the ride.
+
+    The first ride point at or beyond every query distance is found with
+    `np.searchsorted`, and the values are interpolated linearly from the point before
+    it. A stop, with several points at the same distance, so gives the values at the
+    arrival. Queries before the start get the values of the first point and queries
+    beyond the end of the ride are NaN.
+
+    Args:
+        distance: Non-decreasing distance of the ride points.
+        query: Distances to interpolate the values at.
+        *values: Values of the ride points.
+
+    Returns:
+        list: Interpolated values at the query distances, per values array.
+    """
+    index = np.searchsorted(distance, query, side="left")
+    reached = index < len(distance)
+    after = np.clip(index, 1, len(distance) - 1)
+    before = after - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.clip(
+            (query - distance[before]) / (distance[after] - distance[before]), 0, 1
+        )
+    fraction = np.where(index == 0, 0.0, fraction)
+
+    return [
+        np.where(
+            reached,
+            value[before] + fraction * (value[after] - value[before]),
+            np.nan,
+        )
+        for value in values
+    ]
@@ -0,0 +1,343 @@
+"""Code to evaluate a team roster on the segments of one or more stages."""
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import compute_durations_batch
+from src.speed_model import compute_route_durations, compute_turn_radius
+
+ROSTER_DTYPE = np.dtype(
+    [
+        ("name", "U64"),
+        ("weight_rider", "f8"),
+        ("cda_full", "f8"),
+        ("cda_semi", "f8"),
+        ("cda_none", "f8"),
+        ("relative_power_climb", "f8"),
+        ("relative_power_flat", "f8"),
+        ("relative_power_descend", "f8"),
+    ]
+)
+DRAFTING_MODES = ("full", "semi", "none")
+
+
+def create_roster(riders) -> np.ndarray:
+    """Create a roster as a structured array with one record per rider.
+
+    Args:
+        riders: Dataframe or list of dicts with the fields of `ROSTER_DTYPE`.
+
+    Returns:
+        np.ndarray: Structured array with the roster.
+
+    Raises:
+        ValueError: If several riders have the same name, results are stored and
+            looked up per rider name.
+    """
+    riders_df = pd.DataFrame(riders)
+    duplicated = riders_df["name"][riders_df["name"].duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(
+            f"Rider names must be unique, found {', '.join(map(str, duplicated))} "
+            "more than once"
+        )
+
+    roster = np.empty(len(riders_df), dtype=ROSTER_DTYPE)
+    for field in ROSTER_DTYPE.names:
+        roster[field] = riders_df[field].to_numpy()
+
+    return roster
+
+
+def roster_to_dataframe(roster: np.ndarray) -> pd.DataFrame:
+    """Convert a roster to a dataframe, e.g. to edit it."""
+    return pd.DataFrame({field: roster[field] for field in ROSTER_DTYPE.names})
+
+
+def evaluate_roster(
+    roster: np.ndarray,
+    segments_df: pd.DataFrame,
+    average_speed_down: float = 60,
+    average_speed_flat: float = 45,
+    glycogen_start_level: float = 100,
+    route_durations: np.ndarray = None,
+) -> tuple:
+    """Compute the duration and glycogen level of every rider on every segment.
+
+    The roster is broadcast against the segments, so all riders are solved in one
+    vectorized call: each rider rides their climb, flat or descend power according to
+    the segment slope (same thresholds as `apply_relative_power`) with the CdA of the
+    segment's drafting decision.
+
+    Args:
+        roster: Structured array from `create_roster`.
+        segments_df: Dataframe with segment information and drafting decisions.
+        average_speed_down: Average speed on descending segments in km/h.
+        average_speed_flat: Average speed on flat segments in km/h.
+        glycogen_start_level: Glycogen level at the start in %.
+        route_durations: Optional durations in seconds per rider and segment for
+            descending and flat segments, see `compute_roster_route_durations`.
+
+    Returns:
+        tuple: Durations in seconds and glycogen levels in %, both as dataframes with
+            one row per rider and one column per segment.
+    """
+    durations, relative_power = _evaluate_durations(
+        roster,
+        segments_df,
+        average_speed_down=average_speed_down,
+        average_speed_flat=average_speed_flat,
+        route_durations=route_durations,
+    )
+    average_slope = segments_df["average slope (%)"].to_numpy(dtype=float)
+    glycogen = compute_glycogen_levels(
+        relative_power, average_slope, glycogen_start_level=glycogen_start_level
+    )
+
+    index = pd.Index(roster["name"], name="rider")
+    columns = segments_df["segment"].to_numpy()
+    return (
+        pd.DataFrame(durations, index=index, columns=columns),
+        pd.DataFrame(glycogen, index=index, columns=columns),
+    )
+
+
+def evaluate_roster_tour(
+    roster: np.ndarray,
+    stages: dict,
+    average_speed_down: float = 60,
+    average_speed_flat: float = 45,
+    glycogen_start_level: float = 100,
+    route_durations: dict = None,
+) -> pd.DataFrame:
+    """Compute the total time and final glycogen level of every rider on every stage.
+
+    All stages are concatenated into one segments table and evaluated in a single
+    vectorized call, the glycogen level restarts at every stage.
+
+    Args:
+        roster: Structured array from `create_roster`.
+        stages: Dataframes with segment information and drafting decisions per stage.
+        average_speed_down: Average speed on descending segments in km/h.
+        average_speed_flat: Average speed on flat segments in km/h.
+        glycogen_start_level: Glycogen level at the start of every stage in %.
+        route_durations: Optional durations in seconds per rider and segment for
+            descending and flat segments per stage, see
+            `compute_roster_route_durations`.
+
+    Returns:
+        pd.DataFrame: Dataframe with one row per rider and stage.
+    """
+    stage_names = list(stages)
+    all_segments_df = pd.concat(stages.values(), ignore_index=True)
+    stage_lengths = np.array([len(stages[stage]) for stage in stage_names])
+    stage_starts = np.concatenate([[0], np.cumsum(stage_lengths)[:-1]])
+
+    # The first segment of every stage restarts the glycogen level
+    first_segment = np.zeros(len(all_segments_df), dtype=bool)
+    first_segment[stage_starts] = True
+    if route_durations is not None:
+        route_durations = np.concatenate(
+            [route_durations[stage] for stage in stage_names], axis=1
+        )
+    durations, relative_power = _evaluate_durations(
+        roster,
+        all_segments_df,
+        average_speed_down=average_speed_down,
+        average_speed_flat=average_speed_flat,
+        route_durations=route_durations,
+    )
+    glycogen = compute_glycogen_levels(
+        relative_power,
+        all_segments_df["average slope (%)"].to_numpy(dtype=float),
+        glycogen_start_level=glycogen_start_level,
+        restart=first_segment,
+    )
+
+    stage_end = stage_starts + stage_lengths - 1
+    total_time = np.add.reduceat(durations, stage_starts, axis=1)
+    return pd.DataFrame(
+        {
+            "rider": np.repeat(roster["name"], len(stage_names)),
+            "stage": np.tile(stage_names, len(roster)),
+            "duration (s)": total_time.ravel(),
+            "final glycogen level (%)": glycogen[:, stage_end].ravel(),
+            "min glycogen level (%)": np.minimum.reduceat(
+                glycogen, stage_starts, axis=1
+            ).ravel(),
+        }
+    )
+
+
+def plan_roster_segments(
+    roster: np.ndarray,
+    segments_df: pd.DataFrame,
+    average_speed_down: float = 60,
+    average_speed_flat: float = 45,
+    route_durations: np.ndarray = None,
+) -> dict:
+    """Get the segment plan of every rider, e.g. to export it to their head units.
+
+    Args:
+        roster: Structured array from `create_roster`.
+        segments_df: Dataframe with segment information and drafting decisions.
+        average_speed_down: Average speed on descending segments in km/h.
+        average_speed_flat: Average speed on flat segments in km/h.
+        route_durations: Optional durations in seconds per rider and segment for
+            descending and flat segments, see `compute_roster_route_durations`.
+
+    Returns:
+        dict: Rider weight and a copy of the segments with the rider's
+            "relative power (w/kg)" and "duration (s)" per rider name.
+    """
+    durations, relative_power = _evaluate_durations(
+        roster,
+        segments_df,
+        average_speed_down=average_speed_down,
+        average_speed_flat=average_speed_flat,
+        route_durations=route_durations,
+    )
+    return {
+        rider["name"]: (
+            float(rider["weight_rider"]),
+            segments_df.assign(
+                **{
+                    "relative power (w/kg)": relative_power[i],
+                    "duration (s)": durations[i].round(0),
+                }
+            ),
+        )
+        for i, rider in enumerate(roster)
+    }
+
+
+def compute_roster_route_durations(
+    roster: np.ndarray, df: pd.DataFrame, segments_df: pd.DataFrame, **kwargs
+) -> np.ndarray:
+    """Model the segment durations of every rider from the route geometry.
+
+    The turn radius only depends on the route, so it is computed once for all
+    riders.
+
+    Args:
+        roster: Structured array from `create_roster`.
+        df: Dataframe with gpx data.
+        segments_df: Dataframe with segment information and drafting decisions.
+        **kwargs: Further arguments of `compute_speed_profile`.
+
+    Returns:
+        np.ndarray: Duration in seconds per rider and segment, e.g. for the
+            `route_durations` of `evaluate_roster`.
+    """
+    relative_power = _roster_relative_power(roster, segments_df)
+    turn_radius = compute_turn_radius(df["latitude"], df["longitude"], df["distance"])
+    route_durations = np.empty((len(roster), len(segments_df)))
+    for i, rider in enumerate(roster):
+        route_durations[i] = compute_route_durations(
+            df,
+            segments_df.assign(**{"relative power (w/kg)": relative_power[i]}),
+            rider_stats={
+                "weight_rider": float(rider["weight_rider"]),
+                "cda_values": {
+                    drafting: float(rider[f"cda_{drafting}"])
+                    for drafting in DRAFTING_MODES
+                },
+            },
+            turn_radius=turn_radius,
+            **kwargs,
+        )
+
+    return route_durations
+
+
+def compute_glycogen_levels(
+    relative_power: np.ndarray,
+    average_slope: np.ndarray,
+    glycogen_start_level: float = 100,
+    restart: np.ndarray = None,
+) -> np.ndarray:
+    """Vectorized `compute_glycogen_level` for many power plans at once.
+
+    Args:
+        relative_power: Relative power (W/kg) per plan and segment.
+        average_slope: Average slope (%) per segment.
+        glycogen_start_level: Glycogen level at the start in %.
+        restart: Segments where the level restarts, only the first one if not
+            specified.
+
+    Returns:
+        np.ndarray: Glycogen level in % per plan and segment.
+    """
+    if restart is None:
+        restart = np.zeros(len(average_slope), dtype=bool)
+        restart[0] = True
+
+    factor = np.where(average_slope < 0, 1.0, np.asarray(relative_power) / 6)
+    factor = np.where(restart, 1.0, factor)
+    glycogen = np.empty(np.shape(factor))
+    starts = np.flatnonzero(restart)
+    for start, end in zip(starts, np.append(starts[1:], len(average_slope))):
+        glycogen[..., start:end] = glycogen_start_level * np.cumprod(
+            factor[..., start:end], axis=-1
+        )
+
+    return glycogen
+
+
+def _evaluate_durations(
+    roster: np.ndarray,
+    segments_df: pd.DataFrame,
+    average_speed_down: float,
+    average_speed_flat: float,
+    route_durations: np.ndarray = None,
+) -> tuple:
+    """Compute the riders x segments durations and relative power.
+
+    Args:
+        roster: Structured array from `create_roster`.
+        segments_df: Dataframe with segment information and drafting decisions.
+        average_speed_down: Average speed on descending segments in km/h.
+        average_speed_flat: Average speed on flat segments in km/h.
+        route_durations: Optional durations in seconds per rider and segment for
+            descending and flat segments, see `compute_roster_route_durations`.
+
+    Returns:
+        tuple: Durations in seconds and relative power in W/kg per rider and segment.
+    """
+    relative_power = _roster_relative_power(roster, segments_df)
+    durations = compute_durations_batch(
+        segments_df,
+        rider_stats=_roster_rider_stats(roster),
+        average_speed_down=average_speed_down,
+        average_speed_flat=average_speed_flat,
+        relative_power=relative_power,
+        route_durations=route_durations,
+    )
+
+    return durations, relative_power
+
+
+def _roster_relative_power(roster: np.ndarray, segments_df: pd.DataFrame) -> np.ndarray:
+    """Get the relative power in W/kg per rider and segment."""
+    average_slope = segments_df["average slope (%)"].to_numpy(dtype=float)
+
+    # Climb, flat or descend per segment, same thresholds as `apply_relative_power`
+    segment_class = np.select([average_slope > 2, average_slope < -2], [0, 2], 1)
+    return np.stack(
+        [
+            roster["relative_power_climb"],
+            roster["relative_power_flat"],
+            roster["relative_power_descend"],
+        ],
+        axis=1,
+    )[:, segment_class]
+
+
+def _roster_rider_stats(roster: np.ndarray) -> dict:
+    """Get the rider stats of the roster with one value per rider."""
+    return {
+        "weight_rider": roster["weight_rider"],
+        "cda_values": {
+            drafting: roster[f"cda_{drafting}"] for drafting in DRAFTING_MODES
+        },
+    }
@@ -0,0 +1,98 @@
+"""Code to index route points for fast lookups by distance and by location."""
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6378137.0
+
+
+class RouteIndex:
+    """Index on the points of a route.
+
+    Lookups by distance use `searchsorted` on the sorted cumulative distance, lookups
+    by location use a KD-tree on latitude and longitude projected to meters around
+    the center of the route. Both answer whole arrays of queries at once.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """Build the index.
+
+        Args:
+            df: Dataframe with gpx data.
+        """
+        # Guard against duplicate points, distance has to be non-decreasing
+        self.distance = np.maximum.accumulate(df["distance"].to_numpy(dtype=float))
+        self.latitude = df["latitude"].to_numpy(dtype=float)
+        self.longitude = df["longitude"].to_numpy(dtype=float)
+
+        self._reference_latitude = np.radians(self.latitude.mean())
+        self._reference_longitude = np.radians(self.longitude.mean())
+        self._tree = None  # Built on the first lookup by location
+
+    def __len__(self) -> int:
+        return len(self.distance)
+
+    def index_at_km(self, distance_km) -> np.ndarray:
+        """Find the route points closest to the given distances.
+
+        Args:
+            distance_km: Distance(s) along the route in km.
+
+        Returns:
+            np.ndarray: Positional index of the closest point for every distance.
+        """
+        distance_km = np.asarray(distance_km, dtype=float)
+        index = np.searchsorted(self.distance, distance_km).clip(1, len(self) - 1)
+        previous_is_closer = (distance_km - self.distance[index - 1]) <= (
+            self.distance[index] - distance_km
+        )
+        return index - previous_is_closer
+
+    def nearest_index(self, latitude, longitude) -> tuple:
+        """Find the route points closest to the given locations.
+
+        Args:
+            latitude: Latitude(s) in degrees.
+            longitude: Longitude(s) in degrees.
+
+        Returns:
+            tuple: Positional index of the closest point for every location and the
+                distance to it in meters.
+        """
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+
+            self._tree = cKDTree(self._project(self.latitude, self.longitude))
+        distance_m, index = self._tree.query(self._project(latitude, longitude))
+        return index, distance_m
+
+    def nearest_km(self, latitude, longitude) -> np.ndarray:
+        """Find the distance along the route closest to the given locations.
+
+        Args:
+            latitude: Latitude(s) in degrees.
+            longitude: Longitude(s) in degrees.
+
+        Returns:
+            np.ndarray: Distance along the route in km for every location.
+        """
+        index, _ = self.nearest_index(latitude, longitude)
+        return self.distance[index]
+
+    def _project(self, latitude, longitude) -> np.ndarray:
+        """Project coordinates to meters with an equirectangular projection.
+
+        Args:
+            latitude: Latitude(s) in degrees.
+            longitude: Longitude(s) in degrees.
+
+        Returns:
+            np.ndarray: Projected x and y coordinates in meters.
+        """
+        x = (
+            EARTH_RADIUS_M
+            * (np.radians(longitude) - self._reference_longitude)
+            * np.cos(self._reference_latitude)
+        )
+        y = EARTH_RADIUS_M * (np.radians(latitude) - self._reference_latitude)
+        return np.stack([x, y], axis=-1)
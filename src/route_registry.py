@@ -0,0 +1,110 @@
+"""Code to share processed routes between all sessions of a server process."""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src.results_store import hash_route
+
+
+class RouteRegistry:
+    """Processed routes held once per server process as read-only dataframes.
+
+    Every session keeps a reference to the same dataframe instead of its own copy,
+    so memory does not grow with the number of sessions. The column arrays are
+    read-only, writing to them raises a ValueError, sessions copy a route before
+    changing it. Routes are registered by route id and optionally by the hash of the
+    gpx data they are processed from, the least recently used ones are dropped
+    beyond `max_routes`.
+    """
+
+    def __init__(self, max_routes: int = 32):
+        """Create an empty registry.
+
+        Args:
+            max_routes: Maximum number of routes to hold.
+        """
+        self.max_routes = max_routes
+        self._routes = OrderedDict()
+        self._source_hashes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def __contains__(self, route_id: str) -> bool:
+        return route_id in self._routes
+
+    def register(self, df: pd.DataFrame, source_hash: str = None) -> pd.DataFrame:
+        """Register a route, or get the registered one with the same points.
+
+        Args:
+            df: Dataframe with gpx data.
+            source_hash: Hash of the gpx data the route is processed from.
+
+        Returns:
+            pd.DataFrame: Read-only dataframe shared by all sessions.
+        """
+        route_id = hash_route(df)
+        with self._lock:
+            if route_id not in self._routes:
+                self._routes[route_id] = freeze_dataframe(df)
+            self._routes.move_to_end(route_id)
+            if source_hash is not None:
+                self._source_hashes[source_hash] = route_id
+            self._evict()
+            return self._routes[route_id]
+
+    def get(self, route_id: str = None, source_hash: str = None) -> pd.DataFrame:
+        """Get a registered route by route id or by the hash of its gpx data.
+
+        Returns:
+            pd.DataFrame: Read-only dataframe, None if the route is not registered.
+        """
+        with self._lock:
+            if route_id is None:
+                route_id = self._source_hashes.get(source_hash)
+            if route_id not in self._routes:
+                return None
+            self._routes.move_to_end(route_id)
+            return self._routes[route_id]
+
+    def memory_usage(self) -> int:
+        """Get the memory held by the registered routes in bytes."""
+        with self._lock:
+            return sum(
+                int(df.memory_usage(index=True, deep=True).sum())
+                for df in self._routes.values()
+            )
+
+    def _evict(self) -> None:
+        while len(self._routes) > self.max_routes:
+            route_id, _ = self._routes.popitem(last=False)
+            self._source_hashes = {
+                source_hash: registered_id
+                for source_hash, registered_id in self._source_hashes.items()
+                if registered_id != route_id
+            }
+
+
+def freeze_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy a dataframe into read-only column arrays.
+
+    Every column keeps its own array, the frame references them without a copy.
+
+    Args:
+        df: Dataframe to freeze.
+
+    Returns:
+        pd.DataFrame: Dataframe whose values cannot be changed in place.
+    """
+    columns = {}
+    for column in df.columns:
+        values = np.array(df[column].to_numpy(), copy=True)
+        values.flags.writeable = False
+        columns[column] = values
+
+    index = df.index.copy()
+    return pd.DataFrame(columns, index=index, copy=False)
@@ -0,0 +1,230 @@
+"""Code to store and compare named strategy scenarios per stage."""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+COMPARISON_COLUMNS = ("relative power (w/kg)", "duration (s)", "glycogen level (%)")
+START_POINT_DECIMALS = 6  # Start points of the same segment in different scenarios
+
+
+class ScenarioStore:
+    """Named strategy scenarios per stage that share unchanged columns.
+
+    Every column, and the index, is stored once as a read-only array, keyed by a hash
+    of its content. Scenarios only hold references to those arrays, so saving a
+    strategy that differs from an existing one in a single column only adds that
+    column to memory. Stored arrays are never written to: `load` hands out a working
+    copy and `view` a read-only frame over the shared arrays (copy-on-write).
+    """
+
+    def __init__(self):
+        self._columns = {}  # column hash -> read-only array
+        self._scenarios = {}  # stage -> scenario name -> {column name: column hash}
+        self._indexes = {}  # stage -> scenario name -> (index hash, index name)
+
+    def save(self, stage: str, name: str, segments_df: pd.DataFrame) -> None:
+        """Save (or overwrite) a scenario.
+
+        Args:
+            stage: Name of the stage the scenario belongs to.
+            name: Name of the scenario.
+            segments_df: Dataframe with segment information of the scenario.
+        """
+        scenario = {
+            column: self._store_column(segments_df[column].to_numpy())
+            for column in segments_df.columns
+        }
+
+        self._scenarios.setdefault(stage, {})[name] = scenario
+        self._indexes.setdefault(stage, {})[name] = (
+            self._store_column(segments_df.index.to_numpy()),
+            segments_df.index.name,
+        )
+        self._drop_unreferenced_columns()
+
+    def delete(self, stage: str, name: str) -> None:
+        """Delete a scenario and release the columns only it referenced.
+
+        Args:
+            stage: Name of the stage the scenario belongs to.
+            name: Name of the scenario.
+        """
+        del self._scenarios[stage][name]
+        del self._indexes[stage][name]
+        self._drop_unreferenced_columns()
+
+    def names(self, stage: str) -> list:
+        """List the scenario names of a stage in the order they were saved.
+
+        Args:
+            stage: Name of the stage.
+
+        Returns:
+            list: Scenario names.
+        """
+        return list(self._scenarios.get(stage, {}))
+
+    def view(self, stage: str, name: str) -> pd.DataFrame:
+        """Build a read-only dataframe over the shared column arrays.
+
+        Args:
+            stage: Name of the stage the scenario belongs to.
+            name: Name of the scenario.
+
+        Returns:
+            pd.DataFrame: Dataframe with segment information and the index it was
+                saved with, without copying data.
+        """
+        scenario = self._scenarios[stage][name]
+        index_hash, index_name = self._indexes[stage][name]
+        return pd.DataFrame(
+            {
+                column: self._columns[column_hash]
+                for column, column_hash in scenario.items()
+            },
+            index=pd.Index(self._columns[index_hash], name=index_name, copy=False),
+            copy=False,
+        )
+
+    def load(self, stage: str, name: str) -> pd.DataFrame:
+        """Load a scenario as a working copy that can be edited freely.
+
+        Args:
+            stage: Name of the stage the scenario belongs to.
+            name: Name of the scenario.
+
+        Returns:
+            pd.DataFrame: Dataframe with segment information.
+        """
+        return self.view(stage, name).copy()
+
+    def nbytes(self) -> int:
+        """Number of bytes held by the stored column arrays."""
+        return sum(values.nbytes for values in self._columns.values())
+
+    def compare(
+        self, stage: str, names: list = None, columns: tuple = COMPARISON_COLUMNS
+    ) -> pd.DataFrame:
+        """Compare scenarios side by side per segment.
+
+        Scenarios can have different segments, e.g. after segmenting the route again
+        or adding segments, so their rows are aligned on the segment start point with
+        an outer join. Segments only some scenarios have get NaN in the others.
+
+        Args:
+            stage: Name of the stage.
+            names: Names of the scenarios to compare, all scenarios if not specified.
+            columns: Columns to compare.
+
+        Returns:
+            pd.DataFrame: Dataframe with one row per segment start point and one
+                column per scenario and compared column.
+        """
+        names = self.names(stage) if names is None else names
+        key_columns = ["segment", "start point (km)", "end point (km)"]
+        comparison = pd.DataFrame(columns=key_columns)
+        for i, name in enumerate(names):
+            scenario = self._scenarios[stage][name]
+            frame = pd.DataFrame(
+                {column: self._columns[scenario[column]] for column in key_columns}
+            )
+            frame["start point (km)"] = frame["start point (km)"].round(
+                START_POINT_DECIMALS
+            )
+            for column in columns:
+                if column in scenario:
+                    frame[f"{column} [{name}]"] = self._columns[scenario[column]]
+
+            if i == 0:
+                comparison = frame
+                continue
+            comparison = comparison.merge(
+                frame, on="start point (km)", how="outer", suffixes=("", " [other]")
+            )
+            # Take the segment name and end point from the first scenario with it
+            for column in ("segment", "end point (km)"):
+                other = comparison.pop(f"{column} [other]")
+                comparison[column] = comparison[column].where(
+                    comparison[column].notna(), other
+                )
+
+        return (
+            comparison.sort_values("start point (km)", kind="stable")
+            .reset_index(drop=True)
+            .reindex(
+                columns=key_columns
+                + [column for column in comparison.columns if column not in key_columns]
+            )
+        )
+
+    def summarize(self, stage: str, names: list = None) -> pd.DataFrame:
+        """Summarize the total time and glycogen of scenarios.
+
+        Args:
+            stage: Name of the stage.
+            names: Names of the scenarios to summarize, all scenarios if not specified.
+
+        Returns:
+            pd.DataFrame: Dataframe with one row per scenario.
+        """
+        names = self.names(stage) if names is None else names
+        summary = []
+        for name in names:
+            scenario = self._scenarios[stage][name]
+            row = {"scenario": name}
+            if "duration (s)" in scenario:
+                row["total duration (s)"] = self._columns[
+                    scenario["duration (s)"]
+                ].sum()
+            if "glycogen level (%)" in scenario:
+                glycogen = self._columns[scenario["glycogen level (%)"]]
+                # A scenario without segments has no glycogen level
+                row["final glycogen level (%)"] = (
+                    glycogen[-1] if len(glycogen) else np.nan
+                )
+                row["min glycogen level (%)"] = (
+                    glycogen.min() if len(glycogen) else np.nan
+                )
+            summary.append(row)
+
+        return pd.DataFrame(summary)
+
+    def _store_column(self, values: np.ndarray) -> str:
+        """Store a column array once as a read-only copy and return its hash."""
+        column_hash = _hash_column(values)
+        if column_hash not in self._columns:
+            values = values.copy()
+            values.setflags(write=False)
+            self._columns[column_hash] = values
+        return column_hash
+
+    def _drop_unreferenced_columns(self) -> None:
+        """Release column arrays that are no longer referenced by any scenario."""
+        referenced = {
+            column_hash
+            for scenarios in self._scenarios.values()
+            for scenario in scenarios.values()
+            for column_hash in scenario.values()
+        } | {
+            index_hash
+            for indexes in self._indexes.values()
+            for index_hash, _ in indexes.values()
+        }
+        for column_hash in set(self._columns) - referenced:
+            del self._columns[column_hash]
+
+
+def _hash_column(values: np.ndarray) -> str:
+    """Hash the content and dtype of a column array.
+
+    Args:
+        values: Column values.
+
+    Returns:
+        str: Hex digest of the column.
+    """
+    digest = hashlib.blake2b(str(values.dtype).encode(), digest_size=16)
+    digest.update(pd.util.hash_array(values).tobytes())
+    return digest.hexdigest()
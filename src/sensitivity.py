@@ -0,0 +1,195 @@
+"""Code to compute how segment times respond to power, CdA and mass."""
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import (
+    ADDITIONAL_MASS,
+    AIR_DENSITY,
+    CRR,
+    FRICTION_LOSS,
+    GRAVITY,
+    solve_velocity,
+)
+from src.speed_model import MAX_SPEED_KMH, MIN_SPEED_KMH, compute_speed_profile
+
+
+def compute_sensitivities(
+    segments_df: pd.DataFrame,
+    rider_stats: dict,
+    delta_power: float = 10.0,
+    delta_cda: float = -0.01,
+    delta_mass: float = -1.0,
+    df: pd.DataFrame = None,
+) -> pd.DataFrame:
+    """Compute the derivative of every segment time to power, CdA and mass at once.
+
+    The velocity solves the same power balance as `find_velocity`,
+    F(v) = a * v^3 + b * v - c = 0 with a = 0.5 * rho * CdA, b = m * g * (CRR + slope)
+    and c = P / (1 + friction_loss). Implicit differentiation gives
+    dv/dx = -(dF/dx) / (dF/dv) with dF/dv = 3 * a * v^2 + b, and the segment time
+    t = L / v gives dt/dx = -L / v^2 * dv/dx. No velocity is solved twice.
+
+    As in `compute_durations_batch`, flat and descending segments are ridden at
+    constant speeds, so their derivatives are 0, unless the route is given. Then
+    their durations are modelled from the route geometry and the same implicit
+    derivative is taken at every route point where the power-limited speed binds,
+    and 0 where the cornering speed or the speed caps bind, from a single speed
+    profile. Derivatives to mass are at constant power in watts.
+
+    Args:
+        segments_df: Dataframe with segment information, drafting decisions and the
+            "relative power (w/kg)" column.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        delta_power: Power change in W for the estimated time change.
+        delta_cda: CdA change in m^2 for the estimated time change.
+        delta_mass: Mass change in kg for the estimated time change.
+        df: Optional dataframe with gpx data, to model the flat and descending
+            segments from the route geometry.
+
+    Returns:
+        pd.DataFrame: Dataframe with the derivatives per segment and the time change
+            in seconds for the given changes, first order estimates.
+    """
+    weight_rider = rider_stats["weight_rider"]
+    cda_values = rider_stats["cda_values"]
+    cda_value = np.array(
+        [
+            cda_values.get(drafting, cda_values.get("full"))
+            for drafting in segments_df["drafting"]
+        ]
+    )
+    length_segment_m = segments_df["segment distance (km)"].to_numpy(dtype=float) * 1000
+    elevation_gain_m = np.abs(
+        segments_df["end elevation (m)"].to_numpy(dtype=float)
+        - segments_df["start elevation (m)"].to_numpy(dtype=float)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.nan_to_num(elevation_gain_m / length_segment_m)
+    total_power = (
+        segments_df["relative power (w/kg)"].to_numpy(dtype=float) * weight_rider
+    )
+    total_mass = weight_rider + ADDITIONAL_MASS
+
+    velocity = solve_velocity(
+        total_power=total_power,
+        air_density=AIR_DENSITY,
+        cda_value=cda_value,
+        total_mass=total_mass,
+        slope=slope,
+    )
+
+    climbing = segments_df["average slope (%)"].to_numpy(dtype=float) > 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dt_dv = np.where(climbing, -length_segment_m / velocity**2, 0.0)
+    dv_dpower, dv_dcda, dv_dmass = _velocity_derivatives(
+        velocity, cda_value, total_mass, slope
+    )
+    # Add to 0.0, so segments that do not depend on the rider show 0, not -0
+    dt_dpower = 0.0 + dt_dv * dv_dpower
+    dt_dcda = 0.0 + dt_dv * dv_dcda
+    dt_dmass = 0.0 + dt_dv * dv_dmass
+    if df is not None:
+        route_dt_dpower, route_dt_dcda, route_dt_dmass = _route_derivatives(
+            df, segments_df, rider_stats
+        )
+        dt_dpower = np.where(climbing, dt_dpower, route_dt_dpower)
+        dt_dcda = np.where(climbing, dt_dcda, route_dt_dcda)
+        dt_dmass = np.where(climbing, dt_dmass, route_dt_dmass)
+
+    return pd.DataFrame(
+        {
+            "segment": segments_df["segment"].to_numpy(),
+            "start point (km)": segments_df["start point (km)"].to_numpy(),
+            "end point (km)": segments_df["end point (km)"].to_numpy(),
+            "average slope (%)": segments_df["average slope (%)"].to_numpy(),
+            "dt/dP (s/W)": dt_dpower,
+            "dt/dCdA (s/m2)": dt_dcda,
+            "dt/dm (s/kg)": dt_dmass,
+            f"time saved {delta_power:+g} W (s)": 0.0 - dt_dpower * delta_power,
+            f"time saved {delta_cda:+g} CdA (s)": 0.0 - dt_dcda * delta_cda,
+            f"time saved {delta_mass:+g} kg (s)": 0.0 - dt_dmass * delta_mass,
+        },
+        index=segments_df.index,
+    )
+
+
+def _velocity_derivatives(velocity, cda_value, total_mass, slope) -> tuple:
+    """Differentiate the velocity of the power balance to power, CdA and mass.
+
+    Returns dv/dx = -(dF/dx) / (dF/dv) in m/s per W, per m2 and per kg.
+    """
+    # Partial derivatives of the power balance F(v, P, CdA, m)
+    dF_dv = 1.5 * AIR_DENSITY * cda_value * velocity**2 + total_mass * GRAVITY * (
+        CRR + slope
+    )
+    dF_dpower = -1 / (1 + FRICTION_LOSS)
+    dF_dcda = 0.5 * AIR_DENSITY * velocity**3
+    dF_dmass = GRAVITY * (CRR + slope) * velocity
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (
+            -dF_dpower / dF_dv,
+            -dF_dcda / dF_dv,
+            -dF_dmass / dF_dv,
+        )
+
+
+def _route_derivatives(
+    df: pd.DataFrame, segments_df: pd.DataFrame, rider_stats: dict
+) -> tuple:
+    """Differentiate the modelled route durations to power, CdA and mass.
+
+    The speed only depends on the rider where the power-limited speed binds, there
+    dv/dx is the implicit derivative of the power balance at the gradient of the
+    point, or when braking or accelerating from such a point. Where the cornering
+    speed or the speed caps bind, dv/dx is 0. With the step time 2 * ds / (v0 + v1)
+    of `compute_speed_profile`, the step derivative is
+    -2 * ds / (v0 + v1)^2 * (dv0/dx + dv1/dx), summed per segment as in
+    `compute_route_durations`. Returns the derivatives per segment in s/W, s/m2 and
+    s/kg.
+    """
+    speed_profile = compute_speed_profile(df, segments_df, rider_stats)
+    distance_km = speed_profile["distance"].to_numpy()
+    speed = speed_profile["speed (km/h)"].to_numpy() / 3.6
+    power_speed = speed_profile["power speed (km/h)"].to_numpy() / 3.6
+    limit_point = speed_profile["limit point"].to_numpy()
+
+    # Points whose speed limit is the speed their power sustains, not a speed cap
+    power_limited = (
+        (power_speed <= speed_profile["cornering speed (km/h)"].to_numpy() / 3.6)
+        & (power_speed > MIN_SPEED_KMH / 3.6)
+        & (power_speed < MAX_SPEED_KMH / 3.6)
+        & (speed_profile["power (W)"].to_numpy() > 0)
+    )
+    point_derivatives = _velocity_derivatives(
+        power_speed,
+        speed_profile["CdA"].to_numpy(),
+        rider_stats["weight_rider"] + ADDITIONAL_MASS,
+        speed_profile["gradient"].to_numpy(),
+    )
+    # Braking and accelerating keep v^2 - v_limit^2 constant, so dv = v_limit / v *
+    # dv_limit, with the derivative of the point whose limit sets the speed
+    follows_limit = power_limited[limit_point] & (speed > MIN_SPEED_KMH / 3.6)
+    speed_ratio = power_speed[limit_point] / speed
+
+    step_distance_m = np.diff(distance_km) * 1000
+    dt_dspeed = -2 * step_distance_m / (speed[:-1] + speed[1:]) ** 2
+    start_km = segments_df["start point (km)"].to_numpy(dtype=float)
+    end_km = segments_df["end point (km)"].to_numpy(dtype=float)
+    derivatives = []
+    for dv_dx in point_derivatives:
+        dv_dx = np.where(
+            follows_limit & np.isfinite(dv_dx[limit_point]),
+            speed_ratio * dv_dx[limit_point],
+            0.0,
+        )
+        elapsed_time = np.concatenate(
+            [[0.0], np.cumsum(dt_dspeed * (dv_dx[:-1] + dv_dx[1:]))]
+        )
+        derivatives.append(
+            np.interp(end_km, distance_km, elapsed_time)
+            - np.interp(start_km, distance_km, elapsed_time)
+        )
+
+    return tuple(derivatives)
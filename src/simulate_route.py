@@ -0,0 +1,180 @@
+"""Code to integrate speed and time at every point of a route."""
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import ADDITIONAL_MASS, solve_velocity
+
+MAX_GRADIENT = 0.3  # Clip noisy point gradients to +/- 30%
+
+
+def compute_air_density(temperature, humidity, elevation) -> np.ndarray:
+    """Compute the density of humid air.
+
+    Pressure follows the international standard atmosphere for the given altitude and
+    the vapour pressure is derived from the relative humidity with the Magnus formula.
+
+    Args:
+        temperature: Air temperature in °C.
+        humidity: Relative humidity in %.
+        elevation: Altitude in m, a scalar or an array with one value per point.
+
+    Returns:
+        np.ndarray: Air density in kg/m^3.
+    """
+    pressure = 101325 * (1 - 2.25577e-5 * np.asarray(elevation, dtype=float)) ** 5.25588
+    saturation_pressure = 610.78 * 10 ** (7.5 * temperature / (temperature + 237.3))
+    vapour_pressure = humidity / 100 * saturation_pressure
+    temperature_kelvin = temperature + 273.15
+
+    return (pressure - vapour_pressure) / (287.058 * temperature_kelvin) + (
+        vapour_pressure / (461.495 * temperature_kelvin)
+    )
+
+
+def integrate_route(
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    rider_stats: dict,
+    temperature: float = 20.0,
+    humidity: float = 50.0,
+    max_speed_kmh: float = 80.0,
+    min_speed_kmh: float = 5.0,
+) -> pd.DataFrame:
+    """Integrate speed and time over every point of the route.
+
+    Every step between two consecutive points is solved with its own gradient, the
+    air density at its altitude and the relative power and drafting of the segment it
+    belongs to. Speeds are capped to `max_speed_kmh` to account for braking on
+    descents.
+
+    Args:
+        df: Dataframe with gpx data.
+        segments_df: Dataframe with segment information, including the
+            "relative power (w/kg)" and "drafting" columns.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        temperature: Air temperature in °C.
+        humidity: Relative humidity in %.
+        max_speed_kmh: Maximum speed in km/h.
+        min_speed_kmh: Minimum speed in km/h.
+
+    Returns:
+        pd.DataFrame: Dataframe with the speed, power and elapsed time at every route
+            point, the speed and power of a step are given at the point it ends in.
+    """
+    distance_km = df["distance"].to_numpy(dtype=float)
+    elevation = df["smoothed_elevation"].to_numpy(dtype=float)
+
+    # Map every step to the segment it starts in
+    start_points = segments_df["start point (km)"].to_numpy(dtype=float)
+    segment_ids = np.searchsorted(start_points, distance_km[:-1], side="right") - 1
+    segment_ids = np.clip(segment_ids, 0, len(segments_df) - 1)
+
+    weight_rider = rider_stats["weight_rider"]
+    cda_values = rider_stats["cda_values"]
+    segment_cda = np.array(
+        [
+            cda_values.get(drafting, cda_values.get("full"))
+            for drafting in segments_df["drafting"]
+        ]
+    )
+    segment_power = segments_df["relative power (w/kg)"].to_numpy(dtype=float)
+
+    step_distance_m = np.diff(distance_km) * 1000
+    step_elevation_m = np.diff(elevation)
+    step_gradient = np.divide(
+        step_elevation_m,
+        step_distance_m,
+        out=np.zeros_like(step_distance_m),
+        where=step_distance_m > 0,
+    ).clip(-MAX_GRADIENT, MAX_GRADIENT)
+    step_air_density = compute_air_density(
+        temperature, humidity, (elevation[:-1] + elevation[1:]) / 2
+    )
+
+    step_power = segment_power[segment_ids] * weight_rider
+    velocity = solve_velocity(
+        total_power=step_power,
+        air_density=step_air_density,
+        cda_value=segment_cda[segment_ids],
+        total_mass=weight_rider + ADDITIONAL_MASS,
+        slope=step_gradient,
+    ).clip(min_speed_kmh / 3.6, max_speed_kmh / 3.6)
+    elapsed_time = np.concatenate([[0.0], np.cumsum(step_distance_m / velocity)])
+
+    return pd.DataFrame(
+        {
+            "distance": distance_km,
+            "elevation": elevation,
+            "gradient (%)": np.concatenate([[0.0], step_gradient * 100]),
+            "air density (kg/m3)": np.concatenate(
+                [[step_air_density[0]], step_air_density]
+            ),
+            "speed (km/h)": np.concatenate([[velocity[0]], velocity]) * 3.6,
+            "power (W)": np.concatenate([[step_power[0]], step_power]),
+            "time (s)": elapsed_time,
+        }
+    )
+
+
+def compute_arrival_times(route_times: pd.DataFrame, distances_km) -> np.ndarray:
+    """Interpolate the elapsed time at arbitrary distances.
+
+    Args:
+        route_times: Dataframe returned by `integrate_route`.
+        distances_km: Distances in km to look up.
+
+    Returns:
+        np.ndarray: Elapsed time in seconds at every requested distance.
+    """
+    return np.interp(distances_km, route_times["distance"], route_times["time (s)"])
+
+
+def compute_km_arrival_times(route_times: pd.DataFrame) -> pd.DataFrame:
+    """Compute the elapsed time at every full kilometer and at the finish.
+
+    Args:
+        route_times: Dataframe returned by `integrate_route`.
+
+    Returns:
+        pd.DataFrame: Dataframe with the arrival time per kilometer.
+    """
+    total_distance = route_times["distance"].iloc[-1]
+    distances_km = np.append(np.arange(0, np.floor(total_distance) + 1), total_distance)
+    distances_km = np.unique(distances_km)
+    arrival_times = compute_arrival_times(route_times, distances_km)
+
+    return pd.DataFrame(
+        {
+            "distance (km)": distances_km,
+            "arrival time (s)": arrival_times.round(0),
+            "arrival time": pd.to_datetime(arrival_times.round(0), unit="s").strftime(
+                "%H:%M:%S"
+            ),
+        }
+    )
+
+
+def compute_segment_arrival_times(
+    route_times: pd.DataFrame, segments_df: pd.DataFrame
+) -> pd.DataFrame:
+    """Compute the arrival time at each segment boundary and the segment durations.
+
+    Args:
+        route_times: Dataframe returned by `integrate_route`.
+        segments_df: Dataframe with segment information.
+
+    Returns:
+        pd.DataFrame: Dataframe with start/end arrival times and duration per segment.
+    """
+    start_times = compute_arrival_times(route_times, segments_df["start point (km)"])
+    end_times = compute_arrival_times(route_times, segments_df["end point (km)"])
+
+    return pd.DataFrame(
+        {
+            "segment": segments_df["segment"].to_numpy(),
+            "start time (s)": start_times.round(0),
+            "end time (s)": end_times.round(0),
+            "duration (s)": (end_times - start_times).round(0),
+        }
+    )
@@ -0,0 +1,138 @@
+"""Code to solve for the power needed to reach a target finish time."""
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import compute_durations_batch
+from src.speed_model import compute_route_durations, compute_turn_radius
+
+SOLVE_MODES = ("scale", "climb")
+ROUTE_MODEL_CANDIDATES = 8  # Every candidate integrates the whole route
+
+
+def solve_for_target_time(
+    segments_df: pd.DataFrame,
+    target_time_s: float,
+    rider_stats: dict,
+    average_speed_down: float = 60,
+    average_speed_flat: float = 45,
+    start_segment: int = 0,
+    end_segment: int = None,
+    mode: str = "scale",
+    num_candidates: int = None,
+    num_iterations: int = 4,
+    df: pd.DataFrame = None,
+) -> tuple:
+    """Find the power plan that covers a range of segments in a target time.
+
+    Candidate solutions are evaluated in batches with `compute_durations_batch` and the
+    bracket around the target is refined a few times, so every solve only takes a
+    handful of vectorized evaluations. Only the segments in the range are changed and
+    the drafting plan and segment speeds are respected. With constant speeds on flat
+    and descending segments, only climbing segments respond to power. If the route
+    is given, flat and descending segments are modelled from the route geometry with
+    `compute_route_durations` for every candidate plan, so they respond to power too.
+
+    Args:
+        segments_df: Dataframe with segment information, drafting decisions and the
+            "relative power (w/kg)" column.
+        target_time_s: Target time in seconds over the range of segments.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        average_speed_down: Average speed on descending segments in km/h.
+        average_speed_flat: Average speed on flat segments in km/h.
+        start_segment: Position of the first segment of the range.
+        end_segment: Position of the last segment of the range, the last segment of
+            the stage if not specified.
+        mode: "scale" to scale the current relative power of every segment in the
+            range by one factor, or "climb" to find one relative power (W/kg) for all
+            climbing segments in the range.
+        num_candidates: Number of candidates evaluated per iteration, 64 by default
+            or 8 if the route is given.
+        num_iterations: Number of bracket refinements.
+        df: Optional dataframe with gpx data, to model the flat and descending
+            segments from the route geometry instead of the constant speeds.
+
+    Returns:
+        tuple: Solved scale factor or climbing power (W/kg) and the new relative power
+            per segment.
+    """
+    if mode not in SOLVE_MODES:
+        raise ValueError(f"The solve mode must be one of {SOLVE_MODES}")
+
+    if end_segment is None:
+        end_segment = len(segments_df) - 1
+    in_range = np.zeros(len(segments_df), dtype=bool)
+    in_range[start_segment : end_segment + 1] = True
+    climbing = in_range & (segments_df["average slope (%)"].to_numpy(dtype=float) > 2)
+    if not climbing.any() and (df is None or mode == "climb"):
+        raise ValueError(
+            "The selected segments contain no climbs, so their time does not depend "
+            "on power"
+        )
+
+    relative_power = segments_df["relative power (w/kg)"].to_numpy(dtype=float)
+    if mode == "scale":
+        lower, upper = 0.1, 3.0
+
+        def power_plans(candidates):
+            scale = np.where(in_range, candidates[:, None], 1.0)
+            return relative_power * scale
+
+    else:
+        lower, upper = 0.5, 12.0
+
+        def power_plans(candidates):
+            return np.where(climbing, candidates[:, None], relative_power)
+
+    if num_candidates is None:
+        num_candidates = 64 if df is None else ROUTE_MODEL_CANDIDATES
+    if df is not None:
+        turn_radius = compute_turn_radius(
+            df["latitude"], df["longitude"], df["distance"]
+        )
+
+    def range_times(candidates):
+        plans = power_plans(candidates)
+        route_durations = None
+        if df is not None:
+            route_durations = np.array(
+                [
+                    compute_route_durations(
+                        df,
+                        segments_df.assign(**{"relative power (w/kg)": plan}),
+                        rider_stats,
+                        turn_radius=turn_radius,
+                    )
+                    for plan in plans
+                ]
+            )
+        durations = compute_durations_batch(
+            segments_df,
+            rider_stats,
+            average_speed_down=average_speed_down,
+            average_speed_flat=average_speed_flat,
+            relative_power=plans,
+            route_durations=route_durations,
+        )
+        return durations[:, in_range].sum(axis=1)
+
+    # Range time decreases with power, check the target can be reached at all
+    bound_times = range_times(np.array([lower, upper]))
+    if not bound_times[1] <= target_time_s <= bound_times[0]:
+        raise ValueError(
+            f"The target time must be between {bound_times[1]:.0f} s and "
+            f"{bound_times[0]:.0f} s for the selected segments"
+        )
+
+    for _ in range(num_iterations):
+        candidates = np.linspace(lower, upper, num_candidates)
+        times = range_times(candidates)
+        position = np.searchsorted(-times, -target_time_s)
+        position = np.clip(position, 1, num_candidates - 1)
+        lower, upper = candidates[position - 1], candidates[position]
+
+    # Interpolate within the final bracket
+    lower_time, upper_time = range_times(np.array([lower, upper]))
+    solution = np.interp(target_time_s, [upper_time, lower_time], [upper, lower])
+
+    return float(solution), power_plans(np.array([solution]))[0]
@@ -0,0 +1,246 @@
+"""Code to model the speed on descents and flats from the route geometry.
+
+Instead of a constant average speed, the speed at every route point is the lowest
+of three limits:
+
+- the speed the rider's power sustains at the gradient of the point,
+- the cornering speed sqrt(mu * g * R) for the turn radius R of the point,
+- the speed from which the rider can still brake for the next corners, and the
+  speed the rider can reach after the previous corners, with constant braking and
+  acceleration.
+
+The braking and acceleration limits are the cumulative minimum of v^2 + 2 * a * d
+over the points ahead and of v^2 - 2 * a * d over the points behind, so both are
+single vectorized passes over the route.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.compute_segments_analytics import (
+    ADDITIONAL_MASS,
+    AIR_DENSITY,
+    GRAVITY,
+    solve_velocity,
+)
+from src.process_data import EARTH_RADIUS_M
+from src.simulate_route import MAX_GRADIENT
+
+CORNERING_FRICTION = 0.8  # Lateral friction of tyres on dry asphalt
+BRAKING_DECELERATION = 3.0  # m/s^2
+ACCELERATION = 0.5  # Mean acceleration out of corners, in m/s^2
+RADIUS_SPAN_M = 20.0  # Distance to the points before and after a turn point
+MAX_SPEED_KMH = 100.0
+MIN_SPEED_KMH = 5.0
+SPEED_MODELS = ("constant", "route geometry")
+
+
+def compute_turn_radius(
+    latitude, longitude, distance_km, span_m: float = RADIUS_SPAN_M
+) -> np.ndarray:
+    """Compute the turn radius at every route point.
+
+    The radius is the radius of the circle through the point and the points
+    `span_m` before and after it, in a local plane around the point. Spanning
+    several points keeps the gpx coordinate rounding from showing up as sharp
+    turns on straight roads.
+
+    Args:
+        latitude: Latitude of every point in degrees.
+        longitude: Longitude of every point in degrees.
+        distance_km: Distance of every point in km.
+        span_m: Distance to the points before and after a point in m.
+
+    Returns:
+        np.ndarray: Turn radius of every point in m, inf on straights and at the
+            start and end of the route.
+    """
+    latitude = np.radians(np.asarray(latitude, dtype=float))
+    longitude = np.radians(np.asarray(longitude, dtype=float))
+    distance_m = np.asarray(distance_km, dtype=float) * 1000
+    num_points = len(distance_m)
+
+    before = np.clip(
+        np.searchsorted(distance_m, distance_m - span_m, side="right") - 1,
+        0,
+        num_points - 1,
+    )
+    after = np.clip(
+        np.searchsorted(distance_m, distance_m + span_m, side="left"),
+        0,
+        num_points - 1,
+    )
+
+    # Positions of the points before and after in a local plane around the point
+    x_scale = EARTH_RADIUS_M * np.cos(latitude)
+    before_x = (longitude[before] - longitude) * x_scale
+    before_y = (latitude[before] - latitude) * EARTH_RADIUS_M
+    after_x = (longitude[after] - longitude) * x_scale
+    after_y = (latitude[after] - latitude) * EARTH_RADIUS_M
+
+    # Circumradius of the triangle, abc / (4 * area)
+    cross = before_x * after_y - before_y * after_x
+    side_product = (
+        np.hypot(before_x, before_y)
+        * np.hypot(after_x, after_y)
+        * np.hypot(after_x - before_x, after_y - before_y)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        radius = side_product / (2 * np.abs(cross))
+
+    return np.where(
+        (before == np.arange(num_points)) | (after == np.arange(num_points)),
+        np.inf,
+        np.nan_to_num(radius, nan=np.inf),
+    )
+
+
+def compute_speed_profile(
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    rider_stats: dict,
+    cornering_friction: float = CORNERING_FRICTION,
+    braking_deceleration: float = BRAKING_DECELERATION,
+    acceleration: float = ACCELERATION,
+    max_speed_kmh: float = MAX_SPEED_KMH,
+    min_speed_kmh: float = MIN_SPEED_KMH,
+    turn_radius: np.ndarray = None,
+) -> pd.DataFrame:
+    """Compute the speed and elapsed time at every route point.
+
+    Args:
+        df: Dataframe with gpx data.
+        segments_df: Dataframe with segment information, including the
+            "relative power (w/kg)" and "drafting" columns.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        cornering_friction: Lateral friction coefficient of the tyres.
+        braking_deceleration: Deceleration when braking for corners in m/s^2.
+        acceleration: Acceleration after corners in m/s^2.
+        max_speed_kmh: Maximum speed in km/h.
+        min_speed_kmh: Minimum speed in km/h.
+        turn_radius: Turn radius of every point from `compute_turn_radius`, to
+            evaluate several power plans on the same route without computing it
+            again.
+
+    Returns:
+        pd.DataFrame: Dataframe with the gradient, power, CdA and turn radius, the
+            speed limits, the speed, the index of the point whose speed limit sets
+            the speed and the elapsed time at every route point.
+    """
+    distance_km = df["distance"].to_numpy(dtype=float)
+    distance_m = distance_km * 1000
+    elevation = df["smoothed_elevation"].to_numpy(dtype=float)
+
+    # Map every point to the segment it is in, segments may be edited out of order
+    start_points = segments_df["start point (km)"].to_numpy(dtype=float)
+    order = np.argsort(start_points, kind="stable")
+    segment_ids = order[
+        np.clip(
+            np.searchsorted(start_points[order], distance_km, side="right") - 1,
+            0,
+            len(segments_df) - 1,
+        )
+    ]
+
+    weight_rider = rider_stats["weight_rider"]
+    cda_values = rider_stats["cda_values"]
+    segment_cda = np.array(
+        [
+            cda_values.get(drafting, cda_values.get("full"))
+            for drafting in segments_df["drafting"]
+        ]
+    )
+    segment_power = (
+        segments_df["relative power (w/kg)"].to_numpy(dtype=float) * weight_rider
+    )
+
+    # Speed the power sustains at the gradient of the step ending at every point,
+    # steps without elevation count as flat
+    step_distance_m = np.diff(distance_m)
+    step_gradient = np.nan_to_num(
+        np.divide(
+            np.diff(elevation),
+            step_distance_m,
+            out=np.zeros_like(step_distance_m),
+            where=step_distance_m > 0,
+        )
+    ).clip(-MAX_GRADIENT, MAX_GRADIENT)
+    gradient = np.concatenate([step_gradient[:1], step_gradient])
+    power = segment_power[segment_ids]
+    cda_value = segment_cda[segment_ids]
+    power_speed = solve_velocity(
+        total_power=power,
+        air_density=AIR_DENSITY,
+        cda_value=cda_value,
+        total_mass=weight_rider + ADDITIONAL_MASS,
+        slope=gradient,
+    ).clip(min_speed_kmh / 3.6, max_speed_kmh / 3.6)
+
+    if turn_radius is None:
+        turn_radius = compute_turn_radius(df["latitude"], df["longitude"], distance_km)
+    with np.errstate(over="ignore"):
+        cornering_speed = np.sqrt(cornering_friction * GRAVITY * turn_radius)
+    speed_limit = np.minimum(power_speed, cornering_speed)
+
+    # Brake for the corners ahead and accelerate after the corners behind
+    braking_term = (speed_limit**2 + 2 * braking_deceleration * distance_m)[::-1]
+    braking_min = np.minimum.accumulate(braking_term)
+    braking_speed = np.sqrt(braking_min[::-1] - 2 * braking_deceleration * distance_m)
+    acceleration_term = speed_limit**2 - 2 * acceleration * distance_m
+    acceleration_min = np.minimum.accumulate(acceleration_term)
+    acceleration_speed = np.sqrt(acceleration_min + 2 * acceleration * distance_m)
+    speed = np.minimum(braking_speed, acceleration_speed).clip(min_speed_kmh / 3.6)
+
+    # Point whose speed limit sets the speed, where the running minimum was reached
+    point_ids = np.arange(len(distance_m))
+    braking_point = point_ids[::-1][
+        np.maximum.accumulate(np.where(braking_term == braking_min, point_ids, 0))
+    ][::-1]
+    acceleration_point = np.maximum.accumulate(
+        np.where(acceleration_term == acceleration_min, point_ids, 0)
+    )
+    limit_point = np.where(
+        braking_speed <= acceleration_speed, braking_point, acceleration_point
+    )
+
+    # Speed changes linearly with time within a step
+    step_time = 2 * step_distance_m / (speed[:-1] + speed[1:])
+    return pd.DataFrame(
+        {
+            "distance": distance_km,
+            "gradient": gradient,
+            "power (W)": power,
+            "CdA": cda_value,
+            "turn radius (m)": turn_radius,
+            "power speed (km/h)": power_speed * 3.6,
+            "cornering speed (km/h)": cornering_speed * 3.6,
+            "speed (km/h)": speed * 3.6,
+            "limit point": limit_point,
+            "time (s)": np.concatenate([[0.0], np.cumsum(step_time)]),
+        }
+    )
+
+
+def compute_route_durations(
+    df: pd.DataFrame, segments_df: pd.DataFrame, rider_stats: dict, **kwargs
+) -> np.ndarray:
+    """Compute the duration of every segment from the speed at every route point.
+
+    Args:
+        df: Dataframe with gpx data.
+        segments_df: Dataframe with segment information, see `compute_speed_profile`.
+        rider_stats: Rider weight and CdA values per drafting condition.
+        **kwargs: Further arguments of `compute_speed_profile`.
+
+    Returns:
+        np.ndarray: Duration in seconds per segment, e.g. for the `route_durations`
+            of `compute_durations_batch`.
+    """
+    speed_profile = compute_speed_profile(df, segments_df, rider_stats, **kwargs)
+    distance = speed_profile["distance"].to_numpy()
+    elapsed_time = speed_profile["time (s)"].to_numpy()
+    return np.interp(
+        segments_df["end point (km)"].to_numpy(dtype=float), distance, elapsed_time
+    ) - np.interp(
+        segments_df["start point (km)"].to_numpy(dtype=float), distance, elapsed_time
+    )
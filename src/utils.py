@@ -1,8 +1,49 @@
+import importlib
 import io
+import logging
+import threading
+from typing import TYPE_CHECKING
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from src.climb_catalog import ClimbCatalog
+from src.dem import DemTiles, correct_elevation
+from src.formatting import format_duration
+from src.generate_segments import create_segments_dataframe, generate_segments
+from src.glycogen_model import CRITICAL_POWER_WKG, W_PRIME_JKG
+from src.gpx_export import export_route_gpx
+from src.optimal_segmentation import generate_optimal_segments
+from src.plotting import combine_plots, plot_map, plot_segments
+from src.process_data import STAGE_DIRECTORY, create_dataframe, parse_gpx_file
+from src.range_statistics import RangeStatistics
+from src.results_store import ResultsStore, hash_route, hash_source
+from src.ride_ingest import compare_team_rides
+from src.roster import compute_roster_route_durations
+from src.route_index import RouteIndex
+from src.route_registry import RouteRegistry
+from src.scenario_store import ScenarioStore
+
+if TYPE_CHECKING:
+    import plotly.graph_objs as go
+
+logger = logging.getLogger(__name__)
+
+# Heavy modules the src code imports on first use and stages preprocessed at start
+WARM_UP_MODULES = (
+    "gpxpy",
+    "plotly.express",
+    "plotly.graph_objs",
+    "plotly.subplots",
+    "scipy.ndimage",
+    "scipy.optimize",
+    "scipy.signal",
+    "scipy.spatial",
+)
+WARM_UP_STAGES = ("stage-1",)
+RESULTS_STORE_PATH = "data/results.db"
+
 
 class SessionState:
     def __init__(self, **kwargs):
@@ -22,18 +63,346 @@ def set_page_config() -> None:
     )
 
 
-def excel_download_button(
-    df: pd.DataFrame, filename: str, label: str = "Download data"
-):
+@st.cache_data(show_spinner=False, max_entries=32)
+def to_excel_bytes(df: pd.DataFrame) -> bytes:
+    """Write a dataframe to an Excel file in memory, cached per dataframe."""
     output = io.BytesIO()
     writer = pd.ExcelWriter(output, engine="xlsxwriter")
     df.to_excel(writer, index=False)
     writer.close()
-    output.seek(0)
+    return output.getvalue()
+
+
+def excel_download_button(
+    df: pd.DataFrame, filename: str, label: str = "Download data"
+):
     button = st.download_button(
         label=label,
-        data=output,
+        data=to_excel_bytes(df),
         file_name=f"{filename}.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
     return button
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def to_gpx_bytes(
+    df: pd.DataFrame, segments_df: pd.DataFrame, name: str, weight_rider: float = None
+) -> bytes:
+    """Write a route with segment waypoints to a gpx file in memory, cached per plan."""
+    return export_route_gpx(df, segments_df, name=name, weight_rider=weight_rider)
+
+
+def gpx_download_button(
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    filename: str,
+    label: str = "Download gpx",
+    weight_rider: float = None,
+):
+    button = st.download_button(
+        label=label,
+        data=to_gpx_bytes(df, segments_df, name=filename, weight_rider=weight_rider),
+        file_name=f"{filename}.gpx",
+        mime="application/gpx+xml",
+    )
+    return button
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def get_route_index(df: pd.DataFrame) -> RouteIndex:
+    """Build the route index once per route and share it between reruns."""
+    return RouteIndex(df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def get_range_statistics(df: pd.DataFrame) -> RangeStatistics:
+    """Build the range statistics index once per route and share it between reruns."""
+    return RangeStatistics(df, route_index=get_route_index(df))
+
+
+@st.cache_resource(show_spinner=False)
+def get_results_store() -> ResultsStore:
+    """Get the results store shared by all sessions of the server."""
+    return ResultsStore(RESULTS_STORE_PATH)
+
+
+@st.cache_resource(show_spinner=False)
+def get_route_registry() -> RouteRegistry:
+    """Get the registry of processed routes shared by all sessions of the server."""
+    return RouteRegistry()
+
+
+def load_route(gpx_data: bytes, stage: str) -> pd.DataFrame:
+    """Load a processed route shared by all sessions.
+
+    The route comes from the route registry, else from the results store, else it is
+    processed and stored.
+
+    Args:
+        gpx_data: Content of the gpx file.
+        stage: Name of the stage, or "custom gpx".
+
+    Returns:
+        pd.DataFrame: Read-only dataframe with gpx data.
+    """
+    route_registry = get_route_registry()
+    source_hash = hash_source(gpx_data)
+    df = route_registry.get(source_hash=source_hash)
+    if df is not None:
+        return df
+
+    results_store = get_results_store()
+    df = results_store.load_route(source_hash=source_hash)
+    if df is None:
+        df = create_dataframe(gpx_file=parse_gpx_file(io.BytesIO(gpx_data)))
+        results_store.save_route(df, stage=stage, source_hash=source_hash)
+
+    return route_registry.register(df, source_hash=source_hash)
+
+
+def load_stored_route(route_id: str) -> pd.DataFrame:
+    """Load a route from the results store, shared by all sessions.
+
+    Returns:
+        pd.DataFrame: Read-only dataframe with gpx data, None if it is not stored.
+    """
+    route_registry = get_route_registry()
+    df = route_registry.get(route_id=route_id)
+    if df is None:
+        df = get_results_store().load_route(route_id=route_id)
+    return None if df is None else route_registry.register(df)
+
+
+@st.cache_resource(show_spinner=False)
+def get_dem() -> DemTiles:
+    """Get the local DEM tiles shared by all sessions of the server."""
+    return DemTiles()
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def load_corrected_route(df: pd.DataFrame) -> pd.DataFrame:
+    """Correct the elevation of a route with the DEM once per server process."""
+    return get_route_registry().register(correct_elevation(df, dem=get_dem()))
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def load_stage(stage: str) -> pd.DataFrame:
+    """Load and process a TDF stage once per server, all sessions share the result."""
+    with open(STAGE_DIRECTORY / f"{stage}-route.gpx", "rb") as gpx_file:
+        return load_route(gpx_file.read(), stage=stage)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_segments(
+    df: pd.DataFrame,
+    segmentation_method: str = "peaks and valleys",
+    window_size_km: float = 2.0,
+    min_slope_diff: float = 1.5,
+    segment_penalty: float = 10000.0,
+) -> tuple:
+    """Segment a route, cached per route and segmentation parameters.
+
+    Segmentations are kept in the results store, so they survive server restarts.
+
+    Returns:
+        tuple: List of generated segments and dataframe with segment information.
+    """
+    parameters = {"method": segmentation_method, "window_size_km": window_size_km}
+    if segmentation_method == "peaks and valleys":
+        parameters["min_slope_diff"] = min_slope_diff
+    else:
+        parameters["penalty"] = segment_penalty
+
+    results_store = get_results_store()
+    route_id = hash_route(df)
+    stored_segments = results_store.load_segments(route_id, parameters)
+    if stored_segments is not None:
+        return stored_segments
+
+    if segmentation_method == "peaks and valleys":
+        segments = generate_segments(
+            df=df, window_size_km=window_size_km, min_slope_diff=min_slope_diff
+        )
+    else:
+        segments = generate_optimal_segments(
+            df=df, penalty=segment_penalty, min_length_km=window_size_km
+        )
+    segments_df = create_segments_dataframe(df=df, segments=segments)
+    results_store.save_segments(route_id, parameters, segments, segments_df)
+
+    return segments, segments_df
+
+
+# The figures below are shared between sessions and reruns, so they must not be
+# modified after they are returned. They keep their typed array payload, so every
+# rerun only sends the already encoded route layers.
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_map_figure(
+    df: pd.DataFrame,
+    segments_df: pd.DataFrame,
+    selected_stage: str,
+    _route_index: RouteIndex = None,
+) -> "go.Figure":
+    """Build the route map, cached per route, segments and stage."""
+    return plot_map(
+        df=df,
+        segments_df=segments_df,
+        selected_stage=selected_stage,
+        route_index=_route_index,
+    )
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_segments_figure(df: pd.DataFrame, segments: list) -> "go.Figure":
+    """Build the elevation plot with segments, cached per route and segments."""
+    return plot_segments(df=df, segments=segments)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def get_combined_figure(
+    df: pd.DataFrame,
+    segments: list,
+    segments_df: pd.DataFrame,
+    glycogen_df: pd.DataFrame = None,
+) -> "go.Figure":
+    """Build the elevation and glycogen plot, cached per route and strategy."""
+    return combine_plots(
+        df=df, segments=segments, segments_df=segments_df, glycogen_df=glycogen_df
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def get_ride_comparisons(
+    rides: dict,
+    segments_df: pd.DataFrame,
+    rider_stats: dict,
+    match_distance: bool = True,
+    critical_power_wkg: float = CRITICAL_POWER_WKG,
+    w_prime_jkg: float = W_PRIME_JKG,
+) -> dict:
+    """Read and compare the ride files of a team with the plan in worker threads.
+
+    Threads, because forking the multithreaded server from a page is not safe.
+    Cached per ride files and plan, so changing the selected rider does not read the
+    files again.
+    """
+    return compare_team_rides(
+        rides,
+        segments_df,
+        rider_stats,
+        workers=min(len(rides), 4),
+        executor="thread",
+        match_distance=match_distance,
+        critical_power_wkg=critical_power_wkg,
+        w_prime_jkg=w_prime_jkg,
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def get_roster_route_durations(
+    df: pd.DataFrame, roster: np.ndarray, segments_df: pd.DataFrame
+) -> np.ndarray:
+    """Model the segment durations of every rider from the route geometry.
+
+    Cached per route, roster and segments, so the tour is only integrated again
+    when one of them changes.
+    """
+    return compute_roster_route_durations(roster, df, segments_df)
+
+
+@st.cache_resource(show_spinner=False)
+def get_climb_catalog() -> ClimbCatalog:
+    """Get the climb catalog shared by all sessions of the server."""
+    return ClimbCatalog()
+
+
+def get_scenario_store() -> ScenarioStore:
+    """Get the scenario store of the session, creating it on first use."""
+    if "scenario_store" not in st.session_state:
+        st.session_state.scenario_store = ScenarioStore()
+    return st.session_state.scenario_store
+
+
+@st.fragment
+def save_scenario_form(
+    stage: str, segments_df: pd.DataFrame, key: str, parameters: dict = None
+) -> None:
+    """Show inputs and a button to save the current strategy as a named scenario.
+
+    The scenario is kept in the session for comparison and written to the results
+    store under the rider's name. Runs as a fragment, so typing a name only reruns
+    the form.
+
+    Args:
+        stage: Name of the stage the strategy belongs to.
+        segments_df: Dataframe with segment information of the strategy.
+        key: Unique key for the widgets.
+        parameters: Drafting points, rider stats and speeds of the strategy.
+    """
+    scenario_store = get_scenario_store()
+    col1, col2, col3 = st.columns([2, 2, 1], vertical_alignment="bottom")
+    name = col1.text_input(
+        "Scenario name",
+        value=f"scenario {len(scenario_store.names(stage)) + 1}",
+        key=f"{key}_name",
+    )
+    rider = col2.text_input(
+        "Rider", value=st.session_state.get("rider_name", "rider"), key=f"{key}_rider"
+    )
+    if col3.button("💾 Save scenario", key=f"{key}_button", use_container_width=True):
+        scenario_store.save(stage=stage, name=name, segments_df=segments_df)
+        get_results_store().save_strategy(
+            stage=stage,
+            name=name,
+            segments_df=segments_df,
+            rider=rider,
+            route_id=hash_route(st.session_state.df),
+            parameters=parameters,
+        )
+        st.session_state.rider_name = rider
+        st.toast(f"Saved {name} for {stage}")
+
+
+def warm_up(stages: tuple = WARM_UP_STAGES) -> None:
+    """Import the heavy modules and fill the shared caches for the given stages.
+
+    The cached functions are called with the same arguments as the pages, so the
+    first visit of a stage finds the processed route, its default segments and
+    figures in the cache.
+
+    Args:
+        stages: Names of the TDF stages to preprocess.
+    """
+    for module in WARM_UP_MODULES:
+        importlib.import_module(module)
+
+    for stage in stages:
+        df = load_stage(stage)
+        route_index = get_route_index(df)
+        get_range_statistics(df)
+        segments, segments_df = get_segments(
+            df=df,
+            segmentation_method="peaks and valleys",
+            window_size_km=2.0,
+            min_slope_diff=1.5,
+            segment_penalty=10000.0,
+        )
+        get_map_figure(
+            df=df,
+            segments_df=segments_df,
+            selected_stage=stage,
+            _route_index=route_index,
+        )
+        get_segments_figure(df=df, segments=segments)
+        logger.info(f"Warmed up {stage}")
+
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up(stages: tuple = WARM_UP_STAGES) -> threading.Thread:
+    """Start `warm_up` in a background thread, once per server process."""
+    thread = threading.Thread(
+        target=warm_up, kwargs=dict(stages=stages), name="warm-up", daemon=True
+    )
+    thread.start()
+    return thread
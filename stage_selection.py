@@ -1,12 +1,23 @@
 """Main code to generate the streamlit app."""
 
-import gpxpy
 import streamlit as st
 
-from src.process_data import create_dataframe, read_gpx_file
-from src.utils import get_session_state, set_page_config
+from src.process_data import configure_logging
+from src.utils import (
+    get_dem,
+    get_range_statistics,
+    get_route_index,
+    get_session_state,
+    load_corrected_route,
+    load_route,
+    load_stage,
+    set_page_config,
+    start_warm_up,
+)
 
 set_page_config()
+configure_logging()
+start_warm_up()
 
 # Define sidebar
 with st.sidebar:
@@ -31,15 +42,29 @@ selected_stage = st.selectbox("", stage_list, index=selected_index)
 st.header("💾 Custom GPX upload", divider="grey")
 uploaded_file = st.file_uploader("", type=["gpx"])
 
+st.header("⛰️ Elevation", divider="grey")
+dem_correction = st.toggle(
+    "Correct elevation with the local DEM",
+    value=st.session_state.get("dem_correction", False),
+    disabled=not get_dem().available(),
+    help="Sample the elevation of every point from the DEM tiles in data/dem, "
+    "prepared from SRTM .hgt files with python -m src.dem convert.",
+)
+
 # Load and process data
 if uploaded_file:
-    gpx_file = gpxpy.parse(uploaded_file)
+    df = load_route(uploaded_file.getvalue(), stage="custom gpx")
     selected_stage = "custom gpx"
 else:
-    gpx_file = read_gpx_file(path=f"data/tdf/{selected_stage}-route.gpx")
-
-df = create_dataframe(gpx_file=gpx_file)
+    df = load_stage(selected_stage)
+if dem_correction:
+    df = load_corrected_route(df)
+route_index = get_route_index(df)
+range_statistics = get_range_statistics(df)
 
 # Save data to session state
 st.session_state.df = df
+st.session_state.route_index = route_index
+st.session_state.range_statistics = range_statistics
 st.session_state.selected_stage = selected_stage
+st.session_state.dem_correction = dem_correction